@@ -0,0 +1,350 @@
+"""
+Admin pages (Admin Dashboard, User Management).
+
+Kept out of app.py so pandas / plotly.express are only imported the first
+time an admin opens one of these pages, not on every user's session start.
+"""
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+import plotly.express as px
+import streamlit as st
+
+import backend_client as api
+
+
+def render_admin_dashboard():
+    st.markdown("<h3>Admin Dashboard</h3>", unsafe_allow_html=True)
+
+    # 1. Check if current user is Super Admin (First Admin)
+    current_email = st.session_state.get('email')
+    is_super = False
+    try:
+        resp = api.get(f"/admin/is_super/{current_email}")
+        if resp.status_code == 200:
+            is_super = resp.json().get('is_super', False)
+    except:
+        pass # Default to False if error
+
+    # 2. Only show Management Tools if Super Admin
+    if is_super:
+        with st.expander("🛠️ System Admin Management (Super Admin Only)", expanded=False):
+            m_col1, m_col2 = st.columns([2, 1])
+
+            with m_col1:
+                st.write("#### Existing Admins")
+                try:
+                    # Fetch fresh list
+                    resp = api.get("/admin/list")
+                    if resp.status_code == 200:
+                        admin_list = resp.json()
+                        if admin_list:
+                            for adm in admin_list:
+                                a_col1, a_col2 = st.columns([3, 1])
+                                a_col1.write(f"**{adm['username']}** ({adm['email']})")
+
+                                # Prevent deleting self (Current Super Admin)
+                                if adm['email'] != current_email:
+                                    if a_col2.button("🗑️", key=f"del_{adm['email']}"):
+                                        delete_success = False # 1. Init Flag
+                                        try:
+                                            d_resp = api.delete(f"/admin/delete/{adm['email']}")
+                                            if d_resp.status_code == 200:
+                                                st.toast(f"Deleted {adm['username']}")
+                                                delete_success = True # 2. Set Flag
+                                            else:
+                                                st.error("Delete failed on backend.")
+                                        except Exception as e:
+                                            st.error(f"Connection Error: {e}")
+
+                                        # 3. Rerun OUTSIDE the try/except block
+                                        if delete_success:
+                                            time.sleep(0.5)
+                                            st.rerun()
+                        else:
+                            st.info("No other admins found.")
+                    else:
+                        st.error("Could not load admin list.")
+                except Exception as e:
+                    st.error(f"Error loading list: {e}")
+
+            with m_col2:
+                st.write("#### Add New Admin")
+                # Using st.form automatically handles the "Widget State" error
+                # and clears the fields upon a successful submit.
+                with st.form("add_admin_form", clear_on_submit=True):
+                    new_adm_user = st.text_input("Username")
+                    new_adm_email = st.text_input("Email")
+                    new_adm_pass = st.text_input("Password", type="password")
+                    submit_button = st.form_submit_button("Create Admin Account", width="stretch")
+
+                    if submit_button:
+                        if new_adm_user and new_adm_email and new_adm_pass:
+                            try:
+                                resp = api.post("/admin/add", 
+                                                json={"username": new_adm_user, 
+                                                        "email": new_adm_email, 
+                                                        "password": new_adm_pass})
+                                if resp.status_code == 200:
+                                    st.success("Admin Added!")
+                                    # We use a slight delay before rerun so the user sees the success message
+                                    time.sleep(1)
+                                    st.rerun()
+                                else:
+                                    st.error(f"Failed: {resp.text}")
+                            except Exception as e:
+                                st.error(f"Connection Error: {e}")
+        st.write("---") # Visual separator
+
+    try:
+        # 1. Fetch Stats for Metric Tiles
+        stats = api.get("/admin/stats").json()
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.markdown(f"""
+                <div class="user-card" style="margin-top:0;">
+                    <h4 style="font-size: 1.2rem;">Total Searches</h4>
+                    <p style="font-size: 2rem; color: #CCD0CF; font-weight: bold;">{stats.get('total_searches', 0)}</p>
+                </div>
+            """, unsafe_allow_html=True)
+        with col2:
+            # Use real data from the stats response
+            avg_val = stats.get('avg_rating', 0)
+            st.markdown(f"""
+                <div class="user-card" style="margin-top:0; border-top: 4px solid #4CAF50;">
+                    <h4 style="font-size: 1.1rem;">Avg Rating</h4>
+                    <p style="font-size: 2.2rem; color: #4CAF50; font-weight: bold;">{avg_val} ⭐</p>
+                </div>
+            """, unsafe_allow_html=True)
+        with col3:
+            st.markdown(f"""
+                <div class="user-card" style="margin-top:0;">
+                    <h4 style="font-size: 1.2rem;">Active Users</h4>
+                    <p style="font-size: 2rem; color: #CCD0CF; font-weight: bold;">{stats.get('total_users', 0)}</p>
+                </div>
+            """, unsafe_allow_html=True)
+        st.write("")
+
+        # 2. Fetch Trends for Charts
+        trends = api.get("/admin/trends").json()
+        chart_col1, chart_col2 = st.columns(2)
+
+        with chart_col1:
+            st.write("### 📈 Top Searches")
+            top_terms_data = trends.get('top_terms', [])
+            if top_terms_data:
+                df_terms = pd.DataFrame(top_terms_data)
+                fig_terms = px.bar(
+                    df_terms, x='count', y='term', orientation='h',
+                    title='Top 10 Scientific Terms',
+                    color='count', color_continuous_scale='Blues',
+                    template='plotly_dark'
+                )
+                fig_terms.update_layout(
+                    paper_bgcolor='rgba(0,0,0,0)',
+                    plot_bgcolor='rgba(0,0,0,0)',
+                    showlegend=False
+                )
+                st.plotly_chart(fig_terms, width="stretch")
+            else:
+                st.info("No search data yet.")
+        with chart_col2:
+            st.write("### 🎯 Complexity Distribution")
+            dist = trends.get('complexity_distribution', {})
+            if dist:
+                df_dist = pd.DataFrame([{'Complexity': k, 'Count': v} for k, v in dist.items()])
+                fig_pie = px.pie(
+                    df_dist, values='Count', names='Complexity',
+                    title='User Preferences',
+                    color_discrete_sequence=px.colors.sequential.Tealgrn,
+                    template='plotly_dark',
+                    hole=0.4
+                )
+                fig_pie.update_layout(
+                    paper_bgcolor='rgba(0,0,0,0)',
+                    plot_bgcolor='rgba(0,0,0,0)'
+                )
+                st.plotly_chart(fig_pie, width="stretch")
+            else:
+                st.info("No complexity data yet.")
+
+        # 2b. Searches Over Time (read from the hourly / daily rollups)
+        st.write("---")
+        st.write("### 📅 Searches Over Time")
+        ts_col1, ts_col2 = st.columns(2)
+        with ts_col1:
+            granularity = st.radio("Granularity", ["day", "hour"], horizontal=True, key="ts_granularity")
+        with ts_col2:
+            dimension = st.radio("Split by", ["total", "complexity", "category"], horizontal=True, key="ts_dimension")
+
+        if granularity == "day":
+            start = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+        else:
+            start = (datetime.now() - timedelta(hours=48)).strftime("%Y-%m-%d %H:00")
+        timeseries = api.get("/admin/timeseries", params={
+            "granularity": granularity, "dimension": dimension, "start": start
+        }).json()
+        ts_rows = [
+            {"Time": point["bucket"], "Searches": point["searches"], "Series": series["key"]}
+            for series in timeseries.get("series", []) for point in series["points"]
+        ]
+        if ts_rows:
+            fig_ts = px.line(
+                pd.DataFrame(ts_rows), x="Time", y="Searches", color="Series",
+                markers=True, template='plotly_dark'
+            )
+            fig_ts.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
+            st.plotly_chart(fig_ts, width="stretch")
+        else:
+            st.info("No searches in this period yet.")
+
+        # 2c. Cached answers users rated worst (flagged ones get regenerated off-peak)
+        st.write("---")
+        st.write("### 🩺 Lowest Rated Cached Answers")
+        quality = api.get("/admin/quality/worst", params={"limit": 20}).json()
+        statuses = quality.get("statuses", {})
+        st.caption(
+            f"Flagged below {quality.get('threshold')} ⭐ after {quality.get('min_ratings')} ratings · "
+            f"{statuses.get('flagged', 0)} waiting · {statuses.get('queued', 0)} regenerating"
+        )
+        if quality.get("entries"):
+            st.dataframe(
+                pd.DataFrame(quality["entries"]),
+                column_config={
+                    "term": "Term",
+                    "complexity": "Complexity",
+                    "ratings": "Ratings",
+                    "avg_rating": st.column_config.NumberColumn("Average", format="%.2f ⭐"),
+                    "rolling_rating": st.column_config.NumberColumn(
+                        "Recent", help="Weighted towards the latest ratings", format="%.2f ⭐"
+                    ),
+                    "status": "Status",
+                },
+                hide_index=True,
+                width="stretch"
+            )
+        else:
+            st.info("No rated answers yet.")
+
+        # 3. User Engagement & Guest vs Registered
+        st.write("---")
+        eng_col1, eng_col2 = st.columns(2)
+
+        # Only the top 10 page is needed; the total comes with it
+        users_page = api.get("/admin/users", params={"sort": "search_count", "order": "desc", "limit": 10}).json()
+        df_users = pd.DataFrame(users_page.get("items", []), columns=["username", "search_count"])
+
+        with eng_col1:
+                st.write("### 👤 User Engagement")
+                fig_eng = px.bar(
+                    df_users,
+                    x='username', y='search_count',
+                    title='Most Visiting Users',
+                    color='search_count',
+                    template='plotly_dark'
+                )
+                fig_eng.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
+                st.plotly_chart(fig_eng, width="stretch")
+
+        with eng_col2:
+            st.write("### 🔑 Guest vs Registered")
+            # In this app, we don't have "Guest" user in userstable, 
+            # but history might have searches from guests if we implemented it that way.
+            # For now, let's assume we compare users with 0 searches vs >0 or similar logic
+            # Or check if history has usernames that aren't in userstable (though history currently requires login)
+            # Let's mock the "Guest" count for now based on a logic or just show user breakdown
+            registered_count = users_page.get("total", 0)
+            guest_count = 5 # Mock placeholder for now
+
+            df_auth = pd.DataFrame([
+                {'Type': 'Registered', 'Count': registered_count},
+                {'Type': 'Guest', 'Count': guest_count}
+            ])
+            fig_donut = px.pie(
+                df_auth, values='Count', names='Type',
+                title='Access Type Comparison',
+                hole=0.6,
+                color_discrete_sequence=['#4A5C6A', '#253745'],
+                template='plotly_dark'
+            )
+            fig_donut.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
+            st.plotly_chart(fig_donut, width="stretch")
+
+    except Exception as e:
+        st.error(f"Error loading admin visuals: {e}")
+
+
+USERS_PAGE_SIZE = 25
+USER_SORT_LABELS = {
+    "Username": "username",
+    "Email": "email",
+    "Total Searches": "search_count",
+    "Last Active": "last_active",
+}
+
+
+def reset_users_page():
+    st.session_state.users_page = 1
+
+
+def render_user_management():
+    st.markdown("<h3>User Management</h3>", unsafe_allow_html=True)
+    st.session_state.setdefault("users_page", 1)
+
+    # Search / sort changes start again from the first page
+    f_col1, f_col2, f_col3 = st.columns([3, 2, 1])
+    with f_col1:
+        query = st.text_input("Search", placeholder="Username or email starts with...",
+                              key="users_query", on_change=reset_users_page)
+    with f_col2:
+        sort_label = st.selectbox("Sort by", list(USER_SORT_LABELS), key="users_sort", on_change=reset_users_page)
+    with f_col3:
+        order = st.radio("Order", ["asc", "desc"], horizontal=True, key="users_order", on_change=reset_users_page)
+
+    try:
+        page = st.session_state.users_page
+        resp = api.get("/admin/users", params={
+            "q": query, "sort": USER_SORT_LABELS[sort_label], "order": order,
+            "offset": (page - 1) * USERS_PAGE_SIZE, "limit": USERS_PAGE_SIZE
+        })
+        resp.raise_for_status()
+        data = resp.json()
+        total = data.get("total", 0)
+        if data.get("items"):
+            df_users = pd.DataFrame(data["items"])
+            # Apply custom CSS to the table through markdown if needed, but st.dataframe is cleaner
+            st.write("### 👥 Registered Users")
+            st.dataframe(
+                df_users,
+                column_config={
+                    "username": "Username",
+                    "email": "Email Address",
+                    "search_count": st.column_config.NumberColumn(
+                        "Total Searches",
+                        help="Total number of searches performed by this user",
+                        format="%d 🔍"
+                    ),
+                    "last_active": "Last Active"
+                },
+                hide_index=True,
+                width="stretch"  # <--- ADD THIS
+            )
+
+            pages = max(1, -(-total // USERS_PAGE_SIZE))
+            p_col1, p_col2, p_col3 = st.columns([1, 2, 1])
+            if p_col1.button("⬅️ Previous", disabled=page <= 1, width="stretch"):
+                st.session_state.users_page = page - 1
+                st.rerun()
+            first = (page - 1) * USERS_PAGE_SIZE + 1
+            p_col2.caption(f"Page {page} of {pages} · users {first}–{first + len(df_users) - 1} of {total}")
+            if p_col3.button("Next ➡️", disabled=page >= pages, width="stretch"):
+                st.session_state.users_page = page + 1
+                st.rerun()
+        elif query:
+            st.info("No users match that search.")
+        else:
+            st.info("No users registered yet.")
+    except Exception as e:
+        st.error(f"Error loading users: {e}")
@@ -0,0 +1,212 @@
+"""
+Admission control for the expensive (LLM / Whisper) endpoints.
+
+Every guarded endpoint has one global token bucket shared by all callers and
+one bucket per user. A request that finds tokens in both buckets is admitted
+straight away. Otherwise it reserves the next free slot and waits for it in a
+bounded queue, unless the predicted wait is longer than its deadline, in
+which case it is shed immediately with a 429 and a Retry-After header
+(better than letting it time out after holding a slot).
+
+Limits are configured per endpoint and can be overridden with the
+ADMISSION_LIMITS environment variable, e.g.
+    ADMISSION_LIMITS='{"explain": {"user_rate": 1, "user_burst": 5}}'
+"""
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass, asdict, replace
+
+from fastapi import HTTPException, Request
+
+# Header the frontend uses to identify the caller (username, or a per-session guest id)
+USER_HEADER = "X-User-Id"
+# Optional header with the client's own timeout in seconds (tightens max_wait)
+DEADLINE_HEADER = "X-Request-Timeout"
+
+# Per-user buckets are pruned once we track more than this many users
+MAX_TRACKED_USERS = 10000
+
+
+@dataclass
+class EndpointLimits:
+    global_rate: float   # tokens per second shared by everyone
+    global_burst: int
+    user_rate: float     # tokens per second for a single user
+    user_burst: int
+    max_queue: int       # requests allowed to wait for a slot at the same time
+    max_wait: float      # longest we let a request wait before shedding it
+
+
+DEFAULT_LIMITS = {
+    "explain": EndpointLimits(global_rate=2.0, global_burst=20, user_rate=0.2, user_burst=3,
+                              max_queue=20, max_wait=10.0),
+    "transcribe": EndpointLimits(global_rate=1.0, global_burst=5, user_rate=0.2, user_burst=2,
+                                 max_queue=5, max_wait=5.0),
+    # One token per POST /jobs/batch (up to 100 terms); the jobs themselves are capped per user in jobs.py
+    "batch": EndpointLimits(global_rate=0.5, global_burst=5, user_rate=0.05, user_burst=2,
+                            max_queue=5, max_wait=5.0),
+}
+
+
+class TokenBucket:
+    """Classic token bucket. Tokens may go negative to represent queued reservations."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """Seconds until one token is available (0 if there is one now)."""
+        if self.tokens >= 1:
+            return 0.0
+        if self.rate <= 0:
+            return math.inf
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def is_idle(self):
+        return self.tokens >= self.capacity
+
+
+class EndpointAdmission:
+    def __init__(self, name, limits):
+        self.name = name
+        self.limits = limits
+        self.global_bucket = TokenBucket(limits.global_rate, limits.global_burst)
+        self.user_buckets = {}
+        self.queued_now = 0
+        self.counters = {"admitted": 0, "queued": 0, "shed": 0}
+        self.lock = threading.Lock()
+
+    def _user_bucket(self, user, now):
+        bucket = self.user_buckets.get(user)
+        if bucket is None:
+            if len(self.user_buckets) >= MAX_TRACKED_USERS:
+                self._prune(now)
+            bucket = TokenBucket(self.limits.user_rate, self.limits.user_burst)
+            self.user_buckets[user] = bucket
+        bucket.refill(now)
+        return bucket
+
+    def _prune(self, now):
+        for user, bucket in list(self.user_buckets.items()):
+            bucket.refill(now)
+            if bucket.is_idle():
+                del self.user_buckets[user]
+
+    def reserve(self, user, deadline=None):
+        """
+        Reserve a slot for `user`. Returns the number of seconds the caller must
+        wait before proceeding, or raises a 429 if the request should be shed.
+        """
+        max_wait = self.limits.max_wait
+        if deadline is not None:
+            max_wait = min(max_wait, deadline)
+
+        with self.lock:
+            now = time.monotonic()
+            self.global_bucket.refill(now)
+            user_bucket = self._user_bucket(user, now)
+            wait = max(self.global_bucket.wait_time(), user_bucket.wait_time())
+
+            if wait > 0 and (wait > max_wait or self.queued_now >= self.limits.max_queue):
+                self.counters["shed"] += 1
+                retry_after = max(1, math.ceil(wait)) if wait != math.inf else 60
+                raise HTTPException(
+                    status_code=429,
+                    detail=f"Too many requests to /{self.name}. Please retry in {retry_after}s.",
+                    headers={"Retry-After": str(retry_after)},
+                )
+
+            self.global_bucket.take()
+            user_bucket.take()
+            if wait > 0:
+                self.queued_now += 1
+                self.counters["queued"] += 1
+            else:
+                self.counters["admitted"] += 1
+            return wait
+
+    def release_queued(self):
+        with self.lock:
+            self.queued_now -= 1
+            self.counters["admitted"] += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                **self.counters,
+                "queue_depth": self.queued_now,
+                "tracked_users": len(self.user_buckets),
+                "limits": asdict(self.limits),
+            }
+
+
+def limits_from_env():
+    limits = dict(DEFAULT_LIMITS)
+    overrides = os.getenv("ADMISSION_LIMITS")
+    if overrides:
+        for name, values in json.loads(overrides).items():
+            base = limits.get(name, DEFAULT_LIMITS["explain"])
+            limits[name] = replace(base, **values)
+    return limits
+
+
+class AdmissionController:
+    def __init__(self, limits=None):
+        self.configure(limits or DEFAULT_LIMITS)
+
+    @classmethod
+    def from_env(cls):
+        return cls(limits_from_env())
+
+    def configure(self, limits):
+        """Replaces the limits (and resets the buckets); used once the environment is loaded at startup."""
+        self.endpoints = {name: EndpointAdmission(name, lim) for name, lim in limits.items()}
+
+    def guard(self, endpoint):
+        """Returns a FastAPI dependency that admits (or sheds) calls to `endpoint`."""
+
+        async def _admit(request: Request):
+            # Looked up per call so configure() at startup takes effect
+            admission = self.endpoints[endpoint]
+            user = request.headers.get(USER_HEADER) or (request.client.host if request.client else "anonymous")
+            deadline = None
+            try:
+                if request.headers.get(DEADLINE_HEADER):
+                    deadline = float(request.headers[DEADLINE_HEADER])
+            except ValueError:
+                pass
+
+            wait = admission.reserve(user, deadline)
+            if wait > 0:
+                # Wait on the event loop so queued requests don't hold a worker thread
+                try:
+                    await asyncio.sleep(wait)
+                finally:
+                    admission.release_queued()
+
+        return _admit
+
+    def stats(self):
+        return {name: ep.stats() for name, ep in self.endpoints.items()}
+
+    def collect_metrics(self):
+        stats = self.stats()
+        yield ("admission_requests_total", "counter", "Admission decisions per endpoint",
+               [({"endpoint": name, "decision": decision}, s[decision])
+                for name, s in stats.items() for decision in ("admitted", "queued", "shed")])
+        yield ("admission_queue_depth", "gauge", "Requests currently waiting for a token",
+               [({"endpoint": name}, s["queue_depth"]) for name, s in stats.items()])
@@ -1,15 +1,17 @@
+import time
+_script_started = time.perf_counter()  # measure full script runs (see record_run_time)
+
 import streamlit as st
 from streamlit_option_menu import option_menu
 import requests
-import time
+import logging
+import backend_client as api
 from streamlit_mic_recorder import mic_recorder
 import io
 import json
-import plotly.express as px
-import pandas as pd
+import uuid
 
-# Connection to your FastAPI Backend
-BACKEND_URL = "http://127.0.0.1:8000"
+api.configure_logging()
 
 # --- SCIENTIFIC BACKGROUND GENERATOR ---
 def get_scientific_bg():
@@ -48,11 +50,19 @@ if 'search_widget' not in st.session_state:
 if 'complexity_pref' not in st.session_state or st.session_state['complexity_pref'] is None:
     st.session_state['complexity_pref'] = "Basic"
     
-# History State
-if 'history_list' not in st.session_state:
-    st.session_state['history_list'] = []
-if 'history_offset' not in st.session_state:
-    st.session_state['history_offset'] = 0
+# History State (windowed: only a few pages are kept client-side)
+if 'history_cache' not in st.session_state:
+    st.session_state['history_cache'] = {}  # page cursor -> {"items": [...], "next": cursor}
+if 'history_cursors' not in st.session_state:
+    st.session_state['history_cursors'] = [None]  # start cursor of each page visited so far
+
+# Background job for a long (Advanced) explanation: {"id", "term", "complexity"}
+if 'pending_job' not in st.session_state:
+    st.session_state['pending_job'] = None
+
+# Anonymous id so guests get their own rate-limit bucket on the backend
+if 'client_id' not in st.session_state:
+    st.session_state['client_id'] = f"guest-{uuid.uuid4().hex[:12]}"
 
 # --- CSS Styling ---
 st.markdown("""
@@ -253,18 +263,380 @@ st.markdown("""
 def update_pref_in_db():
     if st.session_state['logged_in'] and st.session_state['complexity_pref']:
         try:
-            requests.post(f"{BACKEND_URL}/update_preference", json={
+            api.post("/update_preference", json={
                 "username": st.session_state['username'],
                 "complexity": st.session_state['complexity_pref']
             })
         except:
             pass
 
+# --- Helper: Identify caller for backend rate limiting ---
+def user_headers():
+    user_id = st.session_state['username'] if st.session_state['logged_in'] else st.session_state['client_id']
+    # X-Request-Timeout lets the backend shed requests it can't admit before we give up
+    return {"X-User-Id": user_id, "X-Request-Timeout": str(api.LLM_TIMEOUT[1])}
+
+# --- Helper: Script / Fragment Run Timing ---
+perf_logger = logging.getLogger("conceptclarity.perf")
+
+def record_run_time(scope, started):
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    perf_logger.info("%s run took %.1f ms", scope, elapsed_ms)
+    # Keep the last 20 timings; shown in the sidebar with ?perf=1
+    run_times = st.session_state.setdefault('run_times', [])
+    run_times.append({"scope": scope, "ms": round(elapsed_ms, 1)})
+    del run_times[:-20]
+
 # --- FIX: New Callback Function to Sync Input ---
 def update_search_box():
     # Sync the widget's value to our main state variable
     st.session_state['last_search_term'] = st.session_state.search_widget
 
+# --- Home Page: Explanation Request ---
+# Long explanations run as backend jobs: the script returns immediately and
+# job_status_view() polls until the result is ready.
+JOB_COMPLEXITIES = {"Advanced"}
+
+def store_result(data, complexity):
+    """Keeps an explanation as last_result and saves it to history in the background."""
+    # Store complexity used in the result object
+    data['complexity'] = complexity
+    st.session_state['last_result'] = data
+
+    # Save history without making the user wait for the DB write
+    if st.session_state['logged_in']:
+        reset_history_view()  # cached pages no longer include the newest item
+        api.post_in_background("/save_history", json={
+            "username": st.session_state['username'],
+            "term": data['term'],
+            "category": data['category'],
+            "explanation": data['explanation'],
+            "extra_content": data['extra_content'],
+            "complexity_used": complexity,
+            "related_terms": data['related_terms']
+        })
+
+def show_explain_error(status_code, detail=None, retry_after=None):
+    if status_code == 400:
+        st.session_state['last_result'] = None
+        st.warning(f"⚠️ {detail or 'Invalid term.'}")
+    elif status_code == 429:
+        st.warning(f"⏳ Too many requests. Try again in {retry_after or 'a few'} seconds.")
+    elif status_code == 503:
+        st.warning("⏳ The AI service is busy right now. Please try again shortly.")
+    else:
+        st.error("Error generating explanation.")
+
+def explain_and_store(term, complexity):
+    """Calls /explain (or queues a job for long explanations) and stores the result as last_result."""
+    if complexity in JOB_COMPLEXITIES:
+        submit_explain_job(term, complexity)
+        return
+
+    with st.spinner(f"Explaining '{term}' ({complexity} Mode)..."):
+        try:
+            resp = api.post("/explain", json={
+                "term": term, 
+                "complexity": complexity
+            }, headers=user_headers(), timeout=api.LLM_TIMEOUT)
+            
+            if resp.status_code == 200:
+                store_result(resp.json(), complexity)
+            else:
+                detail = resp.json().get('detail') if resp.status_code == 400 else None
+                show_explain_error(resp.status_code, detail, resp.headers.get('Retry-After'))
+                
+        except requests.exceptions.RequestException:
+            st.error("Backend offline.")
+
+def submit_explain_job(term, complexity):
+    try:
+        resp = api.post("/jobs/explain", json={"term": term, "complexity": complexity},
+                        headers=user_headers())
+    except requests.exceptions.RequestException:
+        st.error("Backend offline.")
+        return
+    if resp.status_code != 202:
+        show_explain_error(resp.status_code, retry_after=resp.headers.get('Retry-After'))
+        return
+    st.session_state['last_result'] = None
+    st.session_state['pending_job'] = {"id": resp.json()['id'], "term": term, "complexity": complexity}
+    # Full rerun so the job status appears even when this was called from a fragment
+    st.rerun()
+
+@st.fragment(run_every=1)
+def job_status_view():
+    """Polls the pending job once a second; only this fragment reruns while waiting."""
+    job = st.session_state['pending_job']
+    if not job:
+        return
+    try:
+        resp = api.get(f"/jobs/{job['id']}")
+    except requests.exceptions.RequestException:
+        st.warning("⏳ Waiting for the backend...")
+        return
+    if resp.status_code == 404:
+        st.session_state['pending_job'] = None
+        st.error("The explanation request was lost. Please try again.")
+        return
+
+    status = resp.json()
+    if status['status'] == "done":
+        st.session_state['pending_job'] = None
+        store_result(status['result'], job['complexity'])
+        st.rerun()  # full rerun: the result view lives outside this fragment
+    elif status['status'] == "failed":
+        st.session_state['pending_job'] = None
+        show_explain_error(status.get('error_status'), status.get('error'))
+    else:
+        position = status.get('queue_position')
+        waiting = f" ({position} ahead of you)" if position else ""
+        st.info(f"⏳ Explaining '{job['term']}' ({job['complexity']} Mode)...{waiting}")
+
+# --- Home Page: Result View ---
+# The result, the feedback form and the related terms are fragments, so a star
+# click or a related-term click reruns only that component instead of the
+# whole script (CSS, sidebar menu, search box...).
+
+def select_related_term(term):
+    st.session_state['last_search_term'] = term
+    st.session_state['search_widget'] = term
+    st.session_state['search_performed'] = False
+    # Explained by result_view on its next (fragment) run
+    st.session_state['pending_related_term'] = term
+
+def fetch_suggestions(term=None, limit=5):
+    """What to learn next, from the backend's related-terms graph (no LLM call; [] on any error)."""
+    try:
+        if st.session_state['logged_in']:
+            resp = api.get(f"/related/next/{st.session_state['username']}", params={"limit": limit})
+            suggestions = resp.json()['suggestions'] if resp.status_code == 200 else []
+        elif term:
+            # Guests have no history: look two steps out from the current term instead
+            resp = api.get(f"/related/neighbors/{term}", params={"hops": 2, "limit": limit + 5})
+            suggestions = [n for n in resp.json()['neighbors'] if n['hops'] == 2] if resp.status_code == 200 else []
+        else:
+            return []
+    except requests.exceptions.RequestException:
+        return []
+    return [item['term'] for item in suggestions][:limit]
+
+def open_suggestion(term):
+    # Used outside the Home page: switch to it and explain the term there
+    st.session_state['page'] = "Home"
+    select_related_term(term)
+
+def suggestion_buttons(terms, key_prefix, on_click):
+    st.markdown('<div class="related-terms-container">', unsafe_allow_html=True)
+    for term in terms:
+        st.button(term, key=f"{key_prefix}_{term}", on_click=on_click, args=(term,), width="content")
+    st.markdown('</div>', unsafe_allow_html=True)
+
+@st.fragment
+def result_view():
+    started = time.perf_counter()
+
+    pending_term = st.session_state.pop('pending_related_term', None)
+    if pending_term:
+        explain_and_store(pending_term, st.session_state.get('complexity_pref', 'Basic'))
+
+    res = st.session_state['last_result']
+    if res:
+        st.markdown("---")
+        st.markdown(f"## 🧬 **{res['term']}**")
+        st.caption(f"**Category:** {res['category']}")
+        if res.get('freshness') == 'stale':
+            # Backend answered from its cache because the AI service was slow; a fresh answer is on its way
+            st.caption("🕒 Saved answer shown while the AI service is slow. Search again shortly for a refreshed one.")
+
+        st.write(f"### 📖 Explanation")
+        st.write(res['explanation'])
+        
+        # Use the stored complexity from the result to determine the title style
+        result_mode = res.get('complexity', 'Basic')
+        if result_mode == "Basic":
+            st.info(f"**📚 Story Time:**\n\n{res['extra_content']}")
+        elif result_mode == "Intermediate":
+            st.success(f"**🌍 Real World Scenario:**\n\n{res['extra_content']}")
+
+        feedback_view(res)
+
+        # --- RELATED TERMS (Optimized Flow) ---
+        st.write("### 🔗 Related Terms")
+
+        if res['related_terms']:
+            # Create a horizontal flow of buttons that wrap naturally
+            st.markdown('<div class="related-terms-container">', unsafe_allow_html=True)
+            
+            # Using st.button with use_container_width=False and CSS flex container
+            # is the most robust way to handle varying lengths in Streamlit
+            # We wrap each button in a div to control its flex behavior
+            for term in res['related_terms']:
+                st.button(
+                    term, 
+                    key=f"rel_{term}", 
+                    on_click=select_related_term, 
+                    args=(term,),
+                    width="content"
+                )
+            st.markdown('</div>', unsafe_allow_html=True)
+
+        # --- WHAT TO LEARN NEXT (from the related-terms graph) ---
+        shown = {t.lower() for t in res['related_terms'] or []} | {res['term'].lower()}
+        suggestions = [t for t in fetch_suggestions(res['term']) if t.lower() not in shown]
+        if suggestions:
+            st.write("### 🧭 What to Learn Next")
+            suggestion_buttons(suggestions, "next", select_related_term)
+
+    record_run_time("result_view", started)
+
+@st.fragment
+def feedback_view(res):
+    started = time.perf_counter()
+
+    # --- NEW: Customer Feedback Section (Disappearing Form) ---
+    
+    # 1. Create unique keys for this specific search result
+    # e.g., "fb_id_gravity_Basic" stores the Feedback ID for this specific search result
+    current_fb_id_key = f"fb_id_{res['term']}_{res.get('complexity', 'Basic')}"
+    fb_submitted_key = f"fb_done_{res['term']}_{res.get('complexity', 'Basic')}"
+    star_key = f"star_widget_{res['term']}"
+    comment_key = f"comment_{res['term']}"
+
+    # 2. Helper to send data (Inserts or Updates based on ID)
+    def send_feedback_to_api(rating_val, comment_text=""):
+        fb_user = st.session_state['username'] if st.session_state['logged_in'] else "Guest"
+        # If we already have an ID for this result, the backend updates that row
+        existing_id = st.session_state.get(current_fb_id_key, None)
+        
+        payload = {
+            "id": existing_id, 
+            "username": fb_user,
+            "term": res['term'],
+            "complexity": res.get('complexity', 'Basic'),
+            "category": res.get('category', 'General'),
+            "explanation": res['explanation'],
+            "extra_content": res['extra_content'],
+            "rating": rating_val,
+            "comment": comment_text
+        }
+
+        try:
+            resp = api.post("/submit_feedback", json=payload)
+            if resp.status_code == 200:
+                # Save the ID returned by backend so next time we update this same row
+                new_id = resp.json().get('id')
+                st.session_state[current_fb_id_key] = new_id
+                return True
+            else:
+                st.error(f"Error: {resp.text}")
+        except Exception as e:
+            st.error(f"Connection Error: {e}")
+        return False
+
+    # STAR RATING (Immediate Save)
+    def on_star_change():
+        val = st.session_state[star_key]
+        if val is not None:
+            send_feedback_to_api(val + 1, "") 
+            st.toast("Rating saved! ⭐") 
+
+    # SUBMIT BUTTON (Finalize & Close)
+    def on_submit_comment():
+        current_stars = st.session_state.get(star_key)
+        rating_to_send = (current_stars + 1) if current_stars is not None else 5
+        if send_feedback_to_api(rating_to_send, st.session_state.get(comment_key, "")):
+            # Mark as done so the form disappears
+            st.session_state[fb_submitted_key] = True
+
+    # 3. LOGIC: If submitted, show "Thanks". If not, show Form.
+    if st.session_state.get(fb_submitted_key, False):
+        # --- VIEW A: SUCCESS MESSAGE ---
+        st.success("✅ **Thanks for your feedback!**")
+    else:
+        # --- VIEW B: FEEDBACK FORM ---
+        with st.expander("Rate this explanation", expanded=True):
+            fb_col1, fb_col2 = st.columns([3, 1], vertical_alignment="bottom")
+            
+            with fb_col1:
+                st.feedback("stars", key=star_key, on_change=on_star_change)
+                
+                # COMMENT BOX
+                st.text_input(
+                    "Comment (Optional)", 
+                    placeholder="Tell us more...", 
+                    key=comment_key
+                )
+            
+            with fb_col2:
+                st.button("Submit Comment", key=f"btn_fb_{res['term']}", on_click=on_submit_comment)
+
+    record_run_time("feedback_view", started)
+
+# --- History Page (windowed) ---
+HISTORY_PAGE_SIZE = 10
+HISTORY_CACHE_PAGES = 5  # at most 50 items kept in session state
+
+def reset_history_view():
+    st.session_state['history_cache'] = {}
+    st.session_state['history_cursors'] = [None]
+
+def fetch_history_page(cursor):
+    cache = st.session_state['history_cache']
+    key = cursor or 0
+    if key in cache:
+        cache[key] = cache.pop(key)  # mark as most recently used
+        return cache[key]
+
+    # Ask for one extra row so we know whether an older page exists
+    params = {"limit": HISTORY_PAGE_SIZE + 1}
+    if cursor:
+        params["before_id"] = cursor
+    resp = api.get(f"/get_history/{st.session_state['username']}", params=params)
+    resp.raise_for_status()
+    rows = resp.json()
+
+    items = rows[:HISTORY_PAGE_SIZE]
+    page = {"items": items, "next": items[-1]['id'] if len(rows) > HISTORY_PAGE_SIZE else None}
+    cache[key] = page
+    while len(cache) > HISTORY_CACHE_PAGES:
+        cache.pop(next(iter(cache)))  # evict least recently used page
+    return page
+
+@st.fragment
+def history_view():
+    # Runs as a fragment: paging only reruns this block, not the whole app
+    cursors = st.session_state['history_cursors']
+    try:
+        page = fetch_history_page(cursors[-1])
+    except requests.exceptions.RequestException:
+        st.error("Backend offline.")
+        return
+
+    if not page['items']:
+        st.info("No history found.")
+        return
+
+    for item in page['items']:
+        icon = "🟢" if item.get('complexity_used') == "Basic" else "MF" 
+        if item.get('complexity_used') == "Intermediate": icon = "🔵"
+        if item.get('complexity_used') == "Advanced": icon = "🔴"
+
+        with st.expander(f"{icon} **{item['term']}** ({item.get('category', 'General')}) - {item['timestamp']}"):
+            st.write(f"**Explanation:** {item['explanation']}")
+            st.info(f"**Context:** {item.get('extra_content', 'N/A')}")
+            if item.get('related_terms'):
+                st.caption(f"Related: {', '.join(item['related_terms'])}")
+
+    # Callbacks update the cursor stack before the fragment reruns
+    nav_prev, nav_info, nav_next = st.columns([1, 2, 1])
+    with nav_prev:
+        st.button("← Newer", disabled=len(cursors) == 1, on_click=cursors.pop)
+    with nav_info:
+        st.caption(f"Page {len(cursors)}")
+    with nav_next:
+        st.button("Older →", disabled=page['next'] is None, on_click=cursors.append, args=(page['next'],))
+
 def main():
     # --- APP NAME ---
     st.markdown("""<div class="title-box"><h1>Concept Clarity</h1></div>""", unsafe_allow_html=True)
@@ -302,6 +674,10 @@ def main():
                 </div>
             """, unsafe_allow_html=True)
 
+        if st.query_params.get("perf") and st.session_state.get('run_times'):
+            with st.expander("⏱️ Run times (ms)"):
+                st.table(st.session_state['run_times'][::-1])
+
         if choice != st.session_state['page']:
             st.session_state['page'] = choice
             st.rerun()
@@ -334,7 +710,7 @@ def main():
                         
                         files = {"file": ("audio.wav", audio_file, "audio/wav")}
                         
-                        resp = requests.post(f"{BACKEND_URL}/transcribe", files=files)
+                        resp = api.post("/transcribe", files=files, headers=user_headers(), timeout=api.LLM_TIMEOUT)
                         if resp.status_code == 200:
                             transcribed_text = resp.json()['text']
                             if transcribed_text != st.session_state.get('last_search_term', ""):
@@ -347,6 +723,8 @@ def main():
                                 st.session_state['search_performed'] = False 
                                 
                                 st.rerun() 
+                        elif resp.status_code == 429:
+                            st.warning(f"⏳ Too many requests. Try again in {resp.headers.get('Retry-After', 'a few')} seconds.")
                         else:
                             st.error("Audio error.")
                     except Exception as e:
@@ -400,200 +778,14 @@ def main():
                 st.session_state['search_performed'] = False 
                 current_complexity = st.session_state.get('complexity_pref', 'Basic')
 
-                with st.spinner(f"Explaining '{search_term}' ({current_complexity} Mode)..."):
-                    try:
-                        resp = requests.post(f"{BACKEND_URL}/explain", json={
-                            "term": search_term, 
-                            "complexity": current_complexity
-                        })
-                        
-                        if resp.status_code == 200:
-                            data = resp.json()
-                            
-                            # Store complexity used in the result object
-                            data['complexity'] = current_complexity
-                            st.session_state['last_result'] = data
-                            
-                            if st.session_state['logged_in']:
-                                try:
-                                    requests.post(f"{BACKEND_URL}/save_history", json={
-                                        "username": st.session_state['username'],
-                                        "term": data['term'],
-                                        "category": data['category'],
-                                        "explanation": data['explanation'],
-                                        "extra_content": data['extra_content'],
-                                        "complexity_used": current_complexity,
-                                        "related_terms": data['related_terms']
-                                    })
-                                except:
-                                    pass
-                        
-                        elif resp.status_code == 400:
-                            st.session_state['last_result'] = None
-                            error_msg = resp.json().get('detail', "Invalid term.")
-                            st.warning(f"⚠️ {error_msg}")
-                        else:
-                            st.error("Error generating explanation.")
-                            
-                    except requests.exceptions.RequestException:
-                        st.error("Backend offline.")
-
-        # --- 3. Display Result ---
-        if st.session_state['last_result']:
-            res = st.session_state['last_result']
-            
-            st.markdown("---")
-            st.markdown(f"## 🧬 **{res['term']}**")
-            st.caption(f"**Category:** {res['category']}")
-            
-            st.write(f"### 📖 Explanation")
-            st.write(res['explanation'])
-            
-            # Use the stored complexity from the result to determine the title style
-            result_mode = res.get('complexity', 'Basic')
-
-            # --- Feedback Logic Helper ---
-            # We construct a unique key to store the Feedback ID for this specific search result
-            # e.g., "fb_id_gravity_Basic"
-            current_fb_id_key = f"fb_id_{res['term']}_{res.get('complexity', 'Basic')}"
-
-            def send_feedback_to_api(rating_val, comment_text=""):
-                # Prepare payload
-                fb_user = st.session_state['username'] if st.session_state['logged_in'] else "Guest"
-                
-                # Check if we already have an ID for this session (meaning we are updating)
-                existing_id = st.session_state.get(current_fb_id_key, None)
-                
-                payload = {
-                    "id": existing_id, # If None, backend creates new. If exists, backend updates.
-                    "username": fb_user,
-                    "term": res['term'],
-                    "complexity": res.get('complexity', 'Basic'),
-                    "category": res.get('category', 'General'),
-                    "explanation": res['explanation'],
-                    "extra_content": res['extra_content'],
-                    "rating": rating_val,
-                    "comment": comment_text
-                }
-
-                try:
-                    resp = requests.post(f"{BACKEND_URL}/submit_feedback", json=payload)
-                    if resp.status_code == 200:
-                        # Save the ID returned by backend so next time we update this same row
-                        new_id = resp.json().get('id')
-                        st.session_state[current_fb_id_key] = new_id
-                        return True
-                    else:
-                        st.error(f"Error: {resp.text}")
-                except Exception as e:
-                    st.error(f"Connection Error: {e}")
-                return False
-            
-            if result_mode == "Basic":
-                st.info(f"**📚 Story Time:**\n\n{res['extra_content']}")
-            elif result_mode == "Intermediate":
-                st.success(f"**🌍 Real World Scenario:**\n\n{res['extra_content']}")
-
-            # --- NEW: Customer Feedback Section (Disappearing Form) ---
-            
-            # 1. Create unique keys for this specific search result
-            current_fb_id_key = f"fb_id_{res['term']}_{res.get('complexity', 'Basic')}"
-            fb_submitted_key = f"fb_done_{res['term']}_{res.get('complexity', 'Basic')}"
-
-            # 2. Helper to send data (Inserts or Updates based on ID)
-            def send_feedback_to_api(rating_val, comment_text=""):
-                fb_user = st.session_state['username'] if st.session_state['logged_in'] else "Guest"
-                existing_id = st.session_state.get(current_fb_id_key, None)
-                
-                payload = {
-                    "id": existing_id, 
-                    "username": fb_user,
-                    "term": res['term'],
-                    "complexity": res.get('complexity', 'Basic'),
-                    "category": res.get('category', 'General'),
-                    "explanation": res['explanation'],
-                    "extra_content": res['extra_content'],
-                    "rating": rating_val,
-                    "comment": comment_text
-                }
+                explain_and_store(search_term, current_complexity)
 
-                try:
-                    resp = requests.post(f"{BACKEND_URL}/submit_feedback", json=payload)
-                    if resp.status_code == 200:
-                        new_id = resp.json().get('id')
-                        st.session_state[current_fb_id_key] = new_id
-                        return True
-                    else:
-                        st.error(f"Error: {resp.text}")
-                except Exception as e:
-                    st.error(f"Connection Error: {e}")
-                return False
-
-            # 3. LOGIC: If submitted, show "Thanks". If not, show Form.
-            if st.session_state.get(fb_submitted_key, False):
-                 # --- VIEW A: SUCCESS MESSAGE ---
-                 st.success("✅ **Thanks for your feedback!**")
-                 
-            else:
-                # --- VIEW B: FEEDBACK FORM ---
-                with st.expander("Rate this explanation", expanded=True):
-                    fb_col1, fb_col2 = st.columns([3, 1], vertical_alignment="bottom")
-                    
-                    with fb_col1:
-                        # STAR RATING (Immediate Save)
-                        star_key = f"star_widget_{res['term']}"
-                        
-                        def on_star_change():
-                            val = st.session_state[star_key]
-                            if val is not None:
-                                send_feedback_to_api(val + 1, "") 
-                                st.toast("Rating saved! ⭐") 
+        # Long explanations are generated in the background; poll only while one is pending
+        if st.session_state['pending_job']:
+            job_status_view()
 
-                        st.feedback("stars", key=star_key, on_change=on_star_change)
-                        
-                        # COMMENT BOX
-                        fb_comment = st.text_input(
-                            "Comment (Optional)", 
-                            placeholder="Tell us more...", 
-                            key=f"comment_{res['term']}"
-                        )
-                    
-                    with fb_col2:
-                        # SUBMIT BUTTON (Finalize & Close)
-                        if st.button("Submit Comment", key=f"btn_fb_{res['term']}"):
-                            current_stars = st.session_state.get(star_key)
-                            rating_to_send = (current_stars + 1) if current_stars is not None else 5
-                            
-                            if send_feedback_to_api(rating_to_send, fb_comment):
-                                # Mark as done so the form disappears
-                                st.session_state[fb_submitted_key] = True
-                                st.rerun()
-
-            # --- RELATED TERMS (Optimized Flow) ---
-            st.write("### 🔗 Related Terms")
-
-            if res['related_terms']:
-                def update_search(t):
-                    st.session_state['last_search_term'] = t
-                    st.session_state['search_widget'] = t 
-                    st.session_state['search_performed'] = False
-                    st.session_state['last_result'] = None
-
-                # Create a horizontal flow of buttons that wrap naturally
-                st.markdown('<div class="related-terms-container">', unsafe_allow_html=True)
-                
-                # Using st.button with use_container_width=False and CSS flex container
-                # is the most robust way to handle varying lengths in Streamlit
-                # We wrap each button in a div to control its flex behavior
-                for term in res['related_terms']:
-                    st.button(
-                        term, 
-                        key=f"rel_{term}", 
-                        on_click=update_search, 
-                        args=(term,),
-                        width="content"
-                    )
-                st.markdown('</div>', unsafe_allow_html=True)
+        # --- 3. Display Result (fragment: feedback & related terms rerun only this part) ---
+        result_view()
 
         # Guest Nudge
         if not st.session_state['logged_in'] and st.session_state['last_result']:
@@ -605,275 +797,27 @@ def main():
     # --- Page 2: History ---
     elif st.session_state['page'] == "History":
         st.markdown("<h3>My Learning History</h3>", unsafe_allow_html=True)
-        
-        if not st.session_state['history_list']:
-             try:
-                resp = requests.get(f"{BACKEND_URL}/get_history/{st.session_state['username']}?offset=0&limit=10")
-                if resp.status_code == 200:
-                    st.session_state['history_list'] = resp.json()
-                    st.session_state['history_offset'] = 10
-             except:
-                 st.error("Backend offline.")
-
-        if st.session_state['history_list']:
-            for item in st.session_state['history_list']:
-                icon = "🟢" if item.get('complexity_used') == "Basic" else "MF" 
-                if item.get('complexity_used') == "Intermediate": icon = "🔵"
-                if item.get('complexity_used') == "Advanced": icon = "🔴"
-
-                with st.expander(f"{icon} **{item['term']}** ({item.get('category', 'General')}) - {item['timestamp']}"):
-                    st.write(f"**Explanation:** {item['explanation']}")
-                    st.info(f"**Context:** {item.get('extra_content', 'N/A')}")
-                    if item.get('related_terms'):
-                        st.caption(f"Related: {', '.join(item['related_terms'])}")
-            
-            if st.button("Load More"):
-                try:
-                    offset = st.session_state['history_offset']
-                    resp = requests.get(f"{BACKEND_URL}/get_history/{st.session_state['username']}?offset={offset}&limit=10")
-                    if resp.status_code == 200:
-                        new_items = resp.json()
-                        if new_items:
-                            st.session_state['history_list'].extend(new_items)
-                            st.session_state['history_offset'] += 10
-                            st.rerun()
-                        else:
-                            st.warning("No more history to load.")
-                except:
-                    pass
-        else:
-            st.info("No history found.")
+        st.button("🔄 Refresh", on_click=reset_history_view)
 
-    # --- Page 3: Admin Dashboard ---
-    elif st.session_state['page'] == "Admin Dashboard":
-        st.markdown("<h3>Admin Dashboard</h3>", unsafe_allow_html=True)
+        # Outside the history fragment: a click switches pages, which needs a full rerun
+        suggestions = fetch_suggestions()
+        if suggestions:
+            st.caption("🧭 Suggested next, based on your history:")
+            suggestion_buttons(suggestions, "hist_next", open_suggestion)
 
-        # 1. Check if current user is Super Admin (First Admin)
-        current_email = st.session_state.get('email')
-        is_super = False
-        try:
-            resp = requests.get(f"{BACKEND_URL}/admin/is_super/{current_email}")
-            if resp.status_code == 200:
-                is_super = resp.json().get('is_super', False)
-        except:
-            pass # Default to False if error
+        history_view()
 
-        # 2. Only show Management Tools if Super Admin
-        if is_super:
-            with st.expander("🛠️ System Admin Management (Super Admin Only)", expanded=False):
-                m_col1, m_col2 = st.columns([2, 1])
-                
-                with m_col1:
-                    st.write("#### Existing Admins")
-                    try:
-                        # Fetch fresh list
-                        resp = requests.get(f"{BACKEND_URL}/admin/list")
-                        if resp.status_code == 200:
-                            admin_list = resp.json()
-                            if admin_list:
-                                for adm in admin_list:
-                                    a_col1, a_col2 = st.columns([3, 1])
-                                    a_col1.write(f"**{adm['username']}** ({adm['email']})")
-                                    
-                                    # Prevent deleting self (Current Super Admin)
-                                    if adm['email'] != current_email:
-                                        if a_col2.button("🗑️", key=f"del_{adm['email']}"):
-                                            delete_success = False # 1. Init Flag
-                                            try:
-                                                d_resp = requests.delete(f"{BACKEND_URL}/admin/delete/{adm['email']}")
-                                                if d_resp.status_code == 200:
-                                                    st.toast(f"Deleted {adm['username']}")
-                                                    delete_success = True # 2. Set Flag
-                                                else:
-                                                    st.error("Delete failed on backend.")
-                                            except Exception as e:
-                                                st.error(f"Connection Error: {e}")
-                                            
-                                            # 3. Rerun OUTSIDE the try/except block
-                                            if delete_success:
-                                                time.sleep(0.5)
-                                                st.rerun()
-                            else:
-                                st.info("No other admins found.")
-                        else:
-                            st.error("Could not load admin list.")
-                    except Exception as e:
-                        st.error(f"Error loading list: {e}")
-
-                with m_col2:
-                    st.write("#### Add New Admin")
-                    # Using st.form automatically handles the "Widget State" error
-                    # and clears the fields upon a successful submit.
-                    with st.form("add_admin_form", clear_on_submit=True):
-                        new_adm_user = st.text_input("Username")
-                        new_adm_email = st.text_input("Email")
-                        new_adm_pass = st.text_input("Password", type="password")
-                        submit_button = st.form_submit_button("Create Admin Account", width="stretch")
-                        
-                        if submit_button:
-                            if new_adm_user and new_adm_email and new_adm_pass:
-                                try:
-                                    resp = requests.post(f"{BACKEND_URL}/admin/add", 
-                                                    json={"username": new_adm_user, 
-                                                            "email": new_adm_email, 
-                                                            "password": new_adm_pass})
-                                    if resp.status_code == 200:
-                                        st.success("Admin Added!")
-                                        # We use a slight delay before rerun so the user sees the success message
-                                        time.sleep(1)
-                                        st.rerun()
-                                    else:
-                                        st.error(f"Failed: {resp.text}")
-                                except Exception as e:
-                                    st.error(f"Connection Error: {e}")
-            st.write("---") # Visual separator
-        
-        try:
-            # 1. Fetch Stats for Metric Tiles
-            stats = requests.get(f"{BACKEND_URL}/admin/stats").json()
-
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.markdown(f"""
-                    <div class="user-card" style="margin-top:0;">
-                        <h4 style="font-size: 1.2rem;">Total Searches</h4>
-                        <p style="font-size: 2rem; color: #CCD0CF; font-weight: bold;">{stats.get('total_searches', 0)}</p>
-                    </div>
-                """, unsafe_allow_html=True)
-            with col2:
-                # Use real data from the stats response
-                avg_val = stats.get('avg_rating', 0)
-                st.markdown(f"""
-                    <div class="user-card" style="margin-top:0; border-top: 4px solid #4CAF50;">
-                        <h4 style="font-size: 1.1rem;">Avg Rating</h4>
-                        <p style="font-size: 2.2rem; color: #4CAF50; font-weight: bold;">{avg_val} ⭐</p>
-                    </div>
-                """, unsafe_allow_html=True)
-            with col3:
-                st.markdown(f"""
-                    <div class="user-card" style="margin-top:0;">
-                        <h4 style="font-size: 1.2rem;">Active Users</h4>
-                        <p style="font-size: 2rem; color: #CCD0CF; font-weight: bold;">{stats.get('total_users', 0)}</p>
-                    </div>
-                """, unsafe_allow_html=True)
-            st.write("")
-            
-            # 2. Fetch Trends for Charts
-            trends = requests.get(f"{BACKEND_URL}/admin/trends").json()
-            chart_col1, chart_col2 = st.columns(2)
-            
-            with chart_col1:
-                st.write("### 📈 Top Searches")
-                top_terms_data = trends.get('top_terms', [])
-                if top_terms_data:
-                    df_terms = pd.DataFrame(top_terms_data)
-                    fig_terms = px.bar(
-                        df_terms, x='count', y='term', orientation='h',
-                        title='Top 10 Scientific Terms',
-                        color='count', color_continuous_scale='Blues',
-                        template='plotly_dark'
-                    )
-                    fig_terms.update_layout(
-                        paper_bgcolor='rgba(0,0,0,0)',
-                        plot_bgcolor='rgba(0,0,0,0)',
-                        showlegend=False
-                    )
-                    st.plotly_chart(fig_terms, width="stretch")
-                else:
-                    st.info("No search data yet.")
-            with chart_col2:
-                st.write("### 🎯 Complexity Distribution")
-                dist = trends.get('complexity_distribution', {})
-                if dist:
-                    df_dist = pd.DataFrame([{'Complexity': k, 'Count': v} for k, v in dist.items()])
-                    fig_pie = px.pie(
-                        df_dist, values='Count', names='Complexity',
-                        title='User Preferences',
-                        color_discrete_sequence=px.colors.sequential.Tealgrn,
-                        template='plotly_dark',
-                        hole=0.4
-                    )
-                    fig_pie.update_layout(
-                        paper_bgcolor='rgba(0,0,0,0)',
-                        plot_bgcolor='rgba(0,0,0,0)'
-                    )
-                    st.plotly_chart(fig_pie, width="stretch")
-                else:
-                    st.info("No complexity data yet.")
-            # 3. User Engagement & Guest vs Registered
-            st.write("---")
-            eng_col1, eng_col2 = st.columns(2)
-            
-            users_data = requests.get(f"{BACKEND_URL}/admin/users").json()
-            if users_data:
-                df_users = pd.DataFrame(users_data)
-            
-            with eng_col1:
-                    st.write("### 👤 User Engagement")
-                    fig_eng = px.bar(
-                        df_users.sort_values('search_count', ascending=False).head(10),
-                        x='username', y='search_count',
-                        title='Most Visiting Users',
-                        color='search_count',
-                        template='plotly_dark'
-                    )
-                    fig_eng.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
-                    st.plotly_chart(fig_eng, width="stretch")
-                
-            with eng_col2:
-                st.write("### 🔑 Guest vs Registered")
-                # In this app, we don't have "Guest" user in userstable, 
-                # but history might have searches from guests if we implemented it that way.
-                # For now, let's assume we compare users with 0 searches vs >0 or similar logic
-                # Or check if history has usernames that aren't in userstable (though history currently requires login)
-                # Let's mock the "Guest" count for now based on a logic or just show user breakdown
-                registered_count = len(df_users[df_users['username'] != 'Guest'])
-                guest_count = 5 # Mock placeholder for now
-                    
-                df_auth = pd.DataFrame([
-                    {'Type': 'Registered', 'Count': registered_count},
-                    {'Type': 'Guest', 'Count': guest_count}
-                ])
-                fig_donut = px.pie(
-                    df_auth, values='Count', names='Type',
-                    title='Access Type Comparison',
-                    hole=0.6,
-                    color_discrete_sequence=['#4A5C6A', '#253745'],
-                    template='plotly_dark'
-                )
-                fig_donut.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
-                st.plotly_chart(fig_donut, width="stretch")
-                
-        except Exception as e:
-            st.error(f"Error loading admin visuals: {e}")
+    # --- Page 3: Admin Dashboard ---
+    # admin_pages pulls in pandas/plotly, so it is only imported once an admin page is opened
+    elif st.session_state['page'] == "Admin Dashboard":
+        import admin_pages
+        admin_pages.render_admin_dashboard()
 
     # --- Page 4: User Management ---
     elif st.session_state['page'] == "User Management":
-        st.markdown("<h3>User Management</h3>", unsafe_allow_html=True)
-        try:
-            users = requests.get(f"{BACKEND_URL}/admin/users").json()
-            if users:
-                df_users = pd.DataFrame(users)
-                # Apply custom CSS to the table through markdown if needed, but st.dataframe is cleaner
-                st.write("### 👥 Registered Users")
-                st.dataframe(
-                    df_users,
-                    column_config={
-                        "username": "Username",
-                        "email": "Email Address",
-                        "search_count": st.column_config.NumberColumn(
-                            "Total Searches",
-                            help="Total number of searches performed by this user",
-                            format="%d 🔍"
-                        )
-                    },
-                    hide_index=True,
-                    width="stretch"  # <--- ADD THIS
-                )
-            else:
-                st.info("No users registered yet.")
-        except Exception as e:
-            st.error(f"Error loading users: {e}")
+        import admin_pages
+        admin_pages.render_user_management()
+
     # --- Page 5: Login ---
     elif st.session_state['page'] == "Login":
         st.markdown("<h3>Login</h3>", unsafe_allow_html=True)
@@ -884,7 +828,7 @@ def main():
             with st.spinner("Logging in..."):
                 try:
                     guest_pref_to_save = st.session_state.get('complexity_pref', 'Basic')
-                    resp = requests.post(f"{BACKEND_URL}/login", json={"email": email, "password": password})
+                    resp = api.post("/login", json={"email": email, "password": password})
                     
                     if resp.status_code == 200:
                         data = resp.json()
@@ -902,19 +846,16 @@ def main():
                             update_pref_in_db() 
                             # 2. SAVE GUEST HISTORY (NEW FIX)
                             if st.session_state.get('last_result'):
-                                try:
-                                    res = st.session_state['last_result']
-                                    requests.post(f"{BACKEND_URL}/save_history", json={
-                                        "username": data['username'],
-                                        "term": res['term'],
-                                        "category": res['category'],
-                                        "explanation": res['explanation'],
-                                        "extra_content": res['extra_content'],
-                                        "complexity_used": res.get('complexity', 'Basic'),
-                                        "related_terms": res['related_terms']
-                                    })
-                                except:
-                                    pass # Silent fail if history save has issues
+                                res = st.session_state['last_result']
+                                api.post_in_background("/save_history", json={
+                                    "username": data['username'],
+                                    "term": res['term'],
+                                    "category": res['category'],
+                                    "explanation": res['explanation'],
+                                    "extra_content": res['extra_content'],
+                                    "complexity_used": res.get('complexity', 'Basic'),
+                                    "related_terms": res['related_terms']
+                                }) # Silent fail (logged) if history save has issues
                             st.session_state['page'] = "Home"
                             st.success("Logged in successfully! History & Preferences saved.")
                         time.sleep(1)
@@ -938,7 +879,7 @@ def main():
         if st.button("Sign Up"):
             with st.spinner("Creating account..."):
                 try:
-                    resp = requests.post(f"{BACKEND_URL}/register", 
+                    resp = api.post("/register", 
                                          json={"username": new_user, "email": new_email, "password": new_password})
                     if resp.status_code == 200:
                         st.success("Account created! Please log in.")
@@ -956,4 +897,5 @@ def main():
         st.rerun()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
+    record_run_time("script", _script_started)
\ No newline at end of file
@@ -1,19 +1,180 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+import time
+_import_started = time.perf_counter()  # cold-start timing includes imports
+
+from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Header
 from pydantic import BaseModel
 import sqlite3
 import hashlib
 import os
 from fastapi.middleware.cors import CORSMiddleware
-from groq import Groq
+from fastapi.responses import Response, PlainTextResponse, JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+import asyncio
 from dotenv import load_dotenv
 import json
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime
 from typing import Optional # Make sure to import Optional
+from admission import AdmissionController, limits_from_env
+from upstream import ResilientChatClient, UpstreamUnavailableError
+from routing import RoutingTable
+from glossary import GlossaryIndex
+from shared_cache import SharedCache, cache_key
+from semantic_cache import SemanticIndex
+from revalidate import Revalidator
+from profiling import Profiler, ProfilingMiddleware
+import profiling
+import bulkheads
+import rollups
+import related
+import cache_quality
+import data_versions
+import http_cache
+import ledger
+import jobs
+import export
+import metrics
+
+# --- Application State ---
+# Importing this module has no side effects (no .env, no network clients, no
+# migrations) so tests and tools can import it; the lifespan below fills these in.
+GROQ_API_KEY = None
+ADMIN_EMAIL = None
+ADMIN_PASSWORD = None
+DB_NAME = "users.db"
+
+llm = None           # ResilientChatClient: retries, hedging, circuit breaking, model fallback
+client = None        # Raw Groq client (Whisper)
+model_routes = None  # Complexity -> model / max_tokens / temperature (MODEL_ROUTES_FILE)
+glossary = None      # Offline glossary packs, served before the LLM is consulted
+explain_cache = None # Host-wide explanation cache shared by all workers (SQLite, WAL)
+semantic_index = None # Paraphrase matching over the shared cache's terms (None if SEMANTIC_CACHE=off)
+revalidator = None   # Serves expired answers when the upstream is slow (None if STALE_WHILE_REVALIDATE=off)
+related_graph = None # Term -> related terms adjacency, for recommendations
+usage_ledger = None  # Token usage ledger, batched writes off the request path
+job_queue = None     # Persistent background jobs (long Advanced explanations, batches)
+quality_policy = None       # When low ratings flag a cached explanation
+quality_regenerator = None  # Off-peak, rate-limited regeneration of flagged explanations
+
+# Admission control and profiling are wired into routes / middleware, so they
+# exist from import with defaults and read their settings at startup.
+admission = AdmissionController()
+profiler = Profiler()
+executor_pools = bulkheads.Bulkheads()  # LLM / audio / DB thread pools
+
+STARTUP = {"ready": False, "migrated": None, "phases_ms": {}, "import_ms": None, "total_ms": None}
+
+@contextmanager
+def startup_phase(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STARTUP["phases_ms"][name] = round((time.perf_counter() - started) * 1000, 1)
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Startup, in order:
+      1. .env                  every setting below may come from it
+      2. settings              fails fast if GROQ_API_KEY is missing
+      3. admission, profiling  limits, profile token / sample rate, executor pool sizes
+      4. migrations            once per schema version, serialized across workers
+      5. upstream              Groq client and model routes
+      6. glossary packs, shared explanation cache, semantic index over it,
+         stale-while-revalidate pool
+      7. usage ledger, related-terms graph   need their tables from step 4
+      8. job workers           need everything above to generate explanations
+      9. quality control       queues regeneration jobs for low-rated explanations
+    Shutdown stops taking traffic (readiness), stops queueing regenerations,
+    stops claiming jobs and revalidations and flushes the usage ledger.
+    """
+    global GROQ_API_KEY, ADMIN_EMAIL, ADMIN_PASSWORD, DB_NAME
+    global llm, client, model_routes, glossary, explain_cache, semantic_index, usage_ledger, related_graph, job_queue
+    global quality_policy, quality_regenerator, revalidator
+    started = time.perf_counter()
+    if STARTUP["import_ms"] is None:  # module import + server setup before the first startup
+        STARTUP["import_ms"] = round((started - _import_started) * 1000, 1)
+
+    with startup_phase("dotenv"):
+        load_dotenv()
+
+    with startup_phase("settings"):
+        GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+        if not GROQ_API_KEY:
+            raise ValueError("GROQ_API_KEY is missing in .env file")
+        # --- NEW: Admin Environment Variables ---
+        ADMIN_EMAIL = os.getenv("ADMIN_EMAIL")
+        ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
+        DB_NAME = os.getenv("DB_NAME", "users.db")
+
+    with startup_phase("admission_profiling"):
+        admission.configure(limits_from_env())
+        profiler.configure_from_env()
+        executor_pools.configure_from_env()
+
+    with startup_phase("migrations"):
+        STARTUP["migrated"] = migrate_db()
+
+    with startup_phase("upstream"):
+        llm = ResilientChatClient.from_env(GROQ_API_KEY)
+        client = llm.client
+        model_routes = RoutingTable.from_env()
+
+    with startup_phase("glossary"):
+        glossary = GlossaryIndex.load_dir(os.getenv("GLOSSARY_DIR", "glossary_packs"))
+
+    with startup_phase("shared_cache"):
+        explain_cache = SharedCache.from_env()
+
+    with startup_phase("semantic_index"):
+        if os.getenv("SEMANTIC_CACHE", "on") != "off":
+            semantic_index = SemanticIndex.from_env()
+            # Built in the background: lookups find nothing until it's done, startup doesn't wait
+            semantic_index.maybe_refresh(lambda: explain_cache.terms(semantic_index.max_entries))
+
+    with startup_phase("revalidation"):
+        if os.getenv("STALE_WHILE_REVALIDATE", "on") != "off":
+            revalidator = Revalidator.from_env()
+
+    with startup_phase("usage_ledger"):
+        usage_ledger = ledger.UsageLedger.from_env(DB_NAME)
+
+    with startup_phase("related_graph"):
+        related_graph = related.RelatedGraph.from_env(DB_NAME)
+        related_graph.maybe_refresh()  # loads in the background; startup doesn't wait
+
+    with startup_phase("job_workers"):
+        job_queue = jobs.JobQueue.from_env(DB_NAME, handlers={"explain": run_explain_job,
+                                                               "regenerate": run_regenerate_job})
+        job_queue.start()
+
+    with startup_phase("quality_control"):
+        quality_policy = cache_quality.QualityPolicy.from_env()
+        quality_regenerator = cache_quality.Regenerator.from_env(DB_NAME, submit_regeneration,
+                                                                 interactive_jobs_waiting)
+        quality_regenerator.start()
 
-# Load environment variables
-load_dotenv()
+    STARTUP["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    STARTUP["ready"] = True
+    print(f"Startup complete in {STARTUP['total_ms']} ms (imports {STARTUP['import_ms']} ms)")
+    try:
+        yield
+    finally:
+        STARTUP["ready"] = False
+        quality_regenerator.stop()
+        job_queue.stop()
+        if revalidator is not None:
+            revalidator.close()
+        usage_ledger.close()
+        if explain_cache is not None:
+            explain_cache.close()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# --- Request Profiling (X-Profile-Token header or PROFILE_SAMPLE_RATE) and Bulkheads ---
+# Profiled routes wrap bulkhead routes: sync endpoints run in the llm / audio / db pool (see bulkheads.py)
+app.router.route_class = profiling.route_class(profiler, base=bulkheads.route_class(executor_pools))
 
 # --- CORS Configuration ---
 app.add_middleware(
@@ -24,40 +185,96 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# --- Groq Client Setup ---
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    raise ValueError("GROQ_API_KEY is missing in .env file")
+# --- Compression (gzip / brotli for JSON and text above COMPRESS_MIN_BYTES) ---
+app.add_middleware(http_cache.CompressionMiddleware)
 
-# --- NEW: Admin Environment Variables ---
-ADMIN_EMAIL = os.getenv("ADMIN_EMAIL")
-ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
+# --- Metrics (request count / latency per route, exposed at /metrics) ---
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
 
-client = Groq(api_key=GROQ_API_KEY)
+def collect_subsystem_metrics():
+    # Subsystems that keep their own counters are exported at scrape time
+    for component in (admission, executor_pools, llm, model_routes, profiler, explain_cache, semantic_index, revalidator,
+                      usage_ledger, related_graph, job_queue, quality_regenerator):
+        if component is not None:
+            yield from component.collect_metrics()
+    yield ("startup_duration_seconds", "gauge", "Cold start time per startup phase",
+           [({"phase": name}, ms / 1000) for name, ms in STARTUP["phases_ms"].items()])
 
-# --- Database Setup & Migration ---
-DB_NAME = "users.db"
+metrics.registry.register_collector(collect_subsystem_metrics)
 
+# --- Database Setup & Migration ---
 def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
+    # TimedConnection records every statement in db_query_duration_seconds
+    conn = sqlite3.connect(DB_NAME, factory=metrics.TimedConnection)
     conn.row_factory = sqlite3.Row
     return conn
 
+def versioned(*names):
+    # Route dependency: ETag / 304 from the data versions (data_versions.py) the endpoint's output depends on
+    return Depends(http_cache.conditional(get_db_connection, *names))
+
+# Bump whenever apply_schema() changes so existing databases pick it up
+SCHEMA_VERSION = 7
+
 def migrate_db():
     """
-    Updates the database schema automatically without deleting data.
-    Adds new columns for Milestone 3 features if they don't exist.
+    Brings the schema up to SCHEMA_VERSION, once. BEGIN IMMEDIATE takes the
+    database write lock, so when several workers boot together one migrates
+    while the others wait, then find the new version and skip.
+    Returns True if this process ran the migration.
     """
     conn = get_db_connection()
+    conn.isolation_level = None  # explicit transaction below
     c = conn.cursor()
-    
+    try:
+        c.execute("PRAGMA busy_timeout = 60000")  # another worker's backfill can take a while
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL, applied_at DATETIME)")
+        c.execute("SELECT MAX(version) FROM schema_version")
+        current = c.fetchone()[0] or 0
+        migrated = current < SCHEMA_VERSION
+        if migrated:
+            print(f"Migrating database schema v{current} -> v{SCHEMA_VERSION}...")
+            apply_schema(c)
+            c.execute("INSERT INTO schema_version (version, applied_at) VALUES (?, ?)",
+                      (SCHEMA_VERSION, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        seed_admin(c)
+        c.execute("COMMIT")
+        return migrated
+    except Exception:
+        if conn.in_transaction:
+            c.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+def seed_admin(c):
+    # UPDATED: Seed an admin user using Environment Variables
+    c.execute('SELECT COUNT(*) FROM admintable')
+    if c.fetchone()[0] == 0:
+        if ADMIN_EMAIL and ADMIN_PASSWORD:
+            admin_hashed_pw = hashlib.sha256(str.encode(ADMIN_PASSWORD)).hexdigest()
+            c.execute('INSERT INTO admintable (username, email, password) VALUES (?, ?, ?)',
+                      ("AdminUser", ADMIN_EMAIL, admin_hashed_pw))
+            print("Admin account seeded from environment variables.")
+        else:
+            print("Warning: Admin credentials not found in .env file.")
+
+def apply_schema(c):
+    """
+    Updates the database schema automatically without deleting data.
+    Adds new columns for Milestone 3 features if they don't exist.
+    """
     # 1. Create tables if they don't exist
     c.execute('''
         CREATE TABLE IF NOT EXISTS userstable (
             username TEXT,
             email TEXT PRIMARY KEY,
             password TEXT,
-            complexity_pref TEXT DEFAULT NULL 
+            complexity_pref TEXT DEFAULT NULL,
+            search_count INTEGER DEFAULT 0,  -- kept up to date by /save_history
+            last_active DATETIME
         )
     ''')
 
@@ -69,17 +286,6 @@ def migrate_db():
             password TEXT
         )
     ''')
-    # UPDATED: Seed an admin user using Environment Variables
-    c.execute('SELECT COUNT(*) FROM admintable')
-    if c.fetchone()[0] == 0:
-        if ADMIN_EMAIL and ADMIN_PASSWORD:
-            admin_hashed_pw = hashlib.sha256(str.encode(ADMIN_PASSWORD)).hexdigest()
-            c.execute('INSERT INTO admintable (username, email, password) VALUES (?, ?, ?)',
-                      ("AdminUser", ADMIN_EMAIL, admin_hashed_pw))
-            print("Admin account seeded from environment variables.")
-        else:
-            print("Warning: Admin credentials not found in .env file.")
-    
     c.execute('''
         CREATE TABLE IF NOT EXISTS history (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -118,12 +324,47 @@ def migrate_db():
     if 'complexity_pref' not in columns:
         print("Migrating: Adding 'complexity_pref' to userstable...")
         c.execute("ALTER TABLE userstable ADD COLUMN complexity_pref TEXT DEFAULT NULL")
+    if 'search_count' not in columns:
+        print("Migrating: Adding 'search_count' / 'last_active' to userstable...")
+        c.execute("ALTER TABLE userstable ADD COLUMN search_count INTEGER DEFAULT 0")
+        c.execute("ALTER TABLE userstable ADD COLUMN last_active DATETIME")
+        c.execute('''
+            UPDATE userstable SET
+                search_count = (SELECT COUNT(*) FROM history h WHERE h.username = userstable.username),
+                last_active = (SELECT MAX(h.timestamp) FROM history h WHERE h.username = userstable.username)
+        ''')
 
-    conn.commit()
-    conn.close()
+    # 3. Indexes
+    # Keyset pagination of a user's history (newest first)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_history_user_id ON history(username, id)")
+    # /admin/users: counter updates by username, prefix search, one index per sort order
+    c.execute("CREATE INDEX IF NOT EXISTS idx_userstable_username ON userstable(username)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_userstable_username_nocase ON userstable(username COLLATE NOCASE, email)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_userstable_email_nocase ON userstable(email COLLATE NOCASE)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_userstable_search_count ON userstable(search_count, email)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_userstable_last_active ON userstable(last_active, email)")
 
-# Run migration on startup
-migrate_db()
+    # 4. Analytics rollups (hourly / daily); backfill once from existing data
+    rollups.create_tables(c)
+    ledger.create_table(c)
+    jobs.create_table(c)
+    related.create_tables(c)
+    data_versions.create_table(c)
+    cache_quality.create_table(c)
+    cache_quality.add_missing_columns(c)
+    c.execute("SELECT EXISTS(SELECT 1 FROM rollup_daily), EXISTS(SELECT 1 FROM history), EXISTS(SELECT 1 FROM related_edges)")
+    has_rollups, has_history, has_edges = c.fetchone()
+    c.execute("SELECT EXISTS(SELECT 1 FROM feedback), EXISTS(SELECT 1 FROM cache_quality)")
+    has_feedback, has_quality = c.fetchone()
+    if has_history and not has_rollups:
+        print("Migrating: Backfilling analytics rollups...")
+        rollups.rebuild_rollups(c)
+    if has_history and not has_edges:
+        print("Migrating: Building the related-terms graph from history...")
+        related.rebuild_edges(c)
+    if has_feedback and not has_quality:
+        print("Migrating: Computing cached answer quality from feedback...")
+        cache_quality.QualityPolicy.from_env().rebuild(c)
 
 # --- Utility Functions ---
 def make_hashes(password):
@@ -147,6 +388,19 @@ class UserLogin(BaseModel):
 class ExplainRequest(BaseModel):
     term: str
     complexity: str  # 'Basic', 'Intermediate', 'Advanced'
+    category: Optional[str] = None  # Optional hint used for model routing
+
+class ExplainJobRequest(BaseModel):
+    term: str
+    complexity: str
+    category: Optional[str] = None
+    priority: str = "interactive"  # 'interactive', 'batch' or 'prefetch'
+
+class BatchJobRequest(BaseModel):
+    terms: list
+    complexity: str
+    category: Optional[str] = None
+    priority: str = "batch"
 
 class HistoryRequest(BaseModel):
     username: str
@@ -187,6 +441,7 @@ def register_user(user: UserRegister):
         # Default complexity is NULL until they choose
         c.execute('INSERT INTO userstable(username, email, password, complexity_pref) VALUES (?,?,?,?)', 
                   (user.username, user.email, hashed_pw, None))
+        data_versions.bump(c, "users")
         conn.commit()
         return {"message": "User registered successfully"}
     finally:
@@ -241,10 +496,41 @@ def update_preference(req: PreferenceRequest):
 
 # --- AI Logic Endpoints ---
 
-@app.post("/explain")
-def explain_term(request: ExplainRequest):
-    term = request.term
-    complexity = request.complexity
+@app.post("/explain", dependencies=[Depends(admission.guard("explain"))])
+@bulkheads.pool("llm")
+def explain_term(request: ExplainRequest, x_user_id: Optional[str] = Header(None)):
+    # X-User-Id: same id the admission control uses
+    return generate_explanation(request.term, request.complexity, request.category, x_user_id or "anonymous")
+
+def generate_explanation(term, complexity, category=None, username="anonymous", refresh=False):
+    """
+    Glossary packs -> shared cache -> LLM. Raises HTTPException exactly like
+    /explain does; the job workers reuse it for queued explanations.
+    refresh=True always asks the LLM (regenerating a low-rated answer).
+    """
+    # 0. Pre-generated glossary packs need no upstream call at all
+    offline = None if refresh else glossary.lookup(term, complexity)
+    if offline:
+        usage_ledger.record(username, term, complexity, cache_status="glossary")
+        return offline
+
+    # 0b. Answers generated by any worker on this host
+    cached, freshness = (None, None) if refresh else explain_cache.get(term, complexity)
+    if freshness == "fresh":
+        usage_ledger.record(username, term, complexity, cache_status="shared")
+        return json.loads(cached)
+
+    # 0c. A paraphrase of a term already answered ("process of photosynthesis" -> "photosynthesis")
+    if semantic_index is not None and cached is None and not refresh:
+        def fresh_answer(matched_term):
+            value, state = explain_cache.get(matched_term, complexity, count=False)
+            return value if state == "fresh" else None
+
+        match = semantic_index.lookup(term, complexity, fresh_answer)
+        semantic_index.maybe_refresh(lambda: explain_cache.terms(semantic_index.max_entries))
+        if match:
+            usage_ledger.record(username, term, complexity, cache_status="semantic")
+            return json.loads(match[2])
 
     # 1. Select the Persona based on Complexity
     if complexity == "Basic":
@@ -281,31 +567,216 @@ def explain_term(request: ExplainRequest):
            - "related_terms": A list of 3 advanced related terms.
         """
 
-    try:
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": system_prompt + " \n IMPORTANT: OUTPUT MUST BE VALID JSON ONLY."},
-                {"role": "user", "content": f"Explain: {term}"}
-            ],
-            model="llama-3.3-70b-versatile",
-            response_format={"type": "json_object"}
-        )
+    # 2. Pick model / token budget for this complexity
+    route = model_routes.select(complexity, category, cache_state="stale" if cached else "miss")
+
+    def ask_llm(cache_status="miss"):
+        started = time.monotonic()
+        try:
+            upstream = llm.chat(
+                model=route.model,
+                fallback_model=route.fallback_model,
+                messages=[
+                    {"role": "system", "content": system_prompt + " \n IMPORTANT: OUTPUT MUST BE VALID JSON ONLY."},
+                    {"role": "user", "content": f"Explain: {term}"}
+                ],
+                max_tokens=route.max_tokens,
+                temperature=route.temperature,
+                response_format={"type": "json_object"}
+            )
+        except Exception as e:
+            latency = time.monotonic() - started
+            model_routes.record(route, latency, error=True)
+            outcome = "unavailable" if isinstance(e, UpstreamUnavailableError) else "error"
+            usage_ledger.record(username, term, complexity, cache_status, outcome, model=route.model, latency=latency)
+            raise
+        chat_completion = upstream.completion
+        usage = getattr(chat_completion, "usage", None)
+        model_routes.record(route, upstream.latency, usage)
+        spent = dict(model=upstream.model, usage=usage, latency=upstream.latency,
+                     attempts=upstream.attempts, fallback=upstream.fallback)
         
         response_content = chat_completion.choices[0].message.content
-        data = json.loads(response_content)
+        try:
+            data = json.loads(response_content)
+        except json.JSONDecodeError:
+            # Tokens are spent whether or not the output parses
+            usage_ledger.record(username, term, complexity, cache_status, "bad_json", **spent)
+            raise
 
-        if "error" in data and data["error"] == "INVALID_TERM":
+        invalid = "error" in data and data["error"] == "INVALID_TERM"
+        usage_ledger.record(username, term, complexity, cache_status, "invalid_term" if invalid else "ok", **spent)
+        if invalid:
              raise HTTPException(status_code=400, detail="This doesn't seem to be a scientific term.")
-             
+
+        explain_cache.put(term, complexity, response_content)
+        reset_if_low_rated(term, complexity)
+        if semantic_index is not None:
+            semantic_index.add(term, complexity)
         return data
 
+    revalidating = False
+    try:
+        # 3. Expired answer on hand: wait for the upstream only up to the budget, then serve it stale.
+        #    Not if users rated it down: that one is only a fallback for outages (below).
+        #    The upstream call is booked once as 'revalidate' (its tokens), however many requests
+        #    join it; each request gets its own 'stale' or 'revalidated' row.
+        if cached is not None and revalidator is not None and not low_rated(term, complexity):
+            revalidating = True
+            try:
+                data, in_time = revalidator.fetch(cache_key(term, complexity), lambda: ask_llm("revalidate"))
+            except Exception as e:
+                if not isinstance(e, UpstreamUnavailableError):  # that one is served stale below
+                    outcome = "invalid_term" if isinstance(e, HTTPException) and e.status_code == 400 else "error"
+                    usage_ledger.record(username, term, complexity, "revalidated", outcome)
+                raise
+            if not in_time:
+                usage_ledger.record(username, term, complexity, cache_status="stale")
+                return {**json.loads(cached), "freshness": "stale"}
+            usage_ledger.record(username, term, complexity, cache_status="revalidated")
+            return data
+        return ask_llm()
+
+    except HTTPException:
+        raise
+    except UpstreamUnavailableError as e:
+        if cached:
+            # An expired answer beats an error while the upstream is down
+            if revalidator is not None:
+                revalidator.served_stale("upstream_error")
+            if revalidating:  # otherwise ask_llm's 'unavailable' row stands for this request
+                usage_ledger.record(username, term, complexity, cache_status="stale")
+            return {**json.loads(cached), "freshness": "stale"}
+        headers = {"Retry-After": str(max(1, int(e.retry_after)))} if e.retry_after else None
+        raise HTTPException(status_code=503, detail=str(e), headers=headers)
     except json.JSONDecodeError:
         raise HTTPException(status_code=500, detail="AI output error (Invalid JSON). Try again.")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/transcribe")
-async def transcribe_audio(file: UploadFile = File(...)):
+def low_rated(term, complexity):
+    # Flagged by cache_quality and not regenerated yet
+    conn = get_db_connection()
+    try:
+        return cache_quality.needs_regeneration(conn.cursor(), term, complexity)
+    finally:
+        conn.close()
+
+def reset_if_low_rated(term, complexity):
+    # A fresh answer replaced a flagged one: ratings start over, so the new answer is judged on its own
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        if cache_quality.needs_regeneration(c, term, complexity):
+            cache_quality.mark_regenerated(c, term, complexity)
+            conn.commit()
+    finally:
+        conn.close()
+
+# --- Background Jobs (submit now, poll for the result) ---
+MAX_BATCH_TERMS = 100
+MAX_JOB_WAIT = 30  # seconds a GET /jobs/{id}?wait= may hold the connection
+
+def run_explain_job(payload):
+    try:
+        return generate_explanation(payload["term"], payload["complexity"], payload.get("category"),
+                                    payload.get("username") or "anonymous")
+    except HTTPException as e:
+        raise jobs.JobError(e.status_code, e.detail)
+
+def run_regenerate_job(payload):
+    term, complexity = payload["term"], payload["complexity"]
+    # Someone asking for it since it was flagged already regenerated it
+    _, freshness = explain_cache.get(term, complexity, count=False)
+    conn = get_db_connection()
+    c = conn.cursor()
+    try:
+        if freshness != "fresh":
+            try:
+                generate_explanation(term, complexity, username="quality-control", refresh=True)
+            except HTTPException as e:
+                cache_quality.mark_failed(c, term, complexity)
+                conn.commit()
+                raise jobs.JobError(e.status_code, e.detail)
+        cache_quality.mark_regenerated(c, term, complexity)
+        conn.commit()
+    finally:
+        conn.close()
+    return {"term": term, "complexity": complexity, "regenerated": freshness != "fresh"}
+
+def submit_regeneration(term, complexity):
+    return job_queue.submit("regenerate", {"term": term, "complexity": complexity},
+                            priority="prefetch", username="quality-control")
+
+def interactive_jobs_waiting():
+    return any(row["priority"] == "interactive" and row["status"] == "queued" for row in job_queue.queue_depth())
+
+@app.post("/jobs/explain", status_code=202, dependencies=[Depends(admission.guard("explain"))])
+def submit_explain_job(req: ExplainJobRequest, x_user_id: Optional[str] = Header(None)):
+    if req.priority not in jobs.PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"priority must be one of {', '.join(jobs.PRIORITIES)}")
+    username = x_user_id or "anonymous"
+    try:
+        job_id = job_queue.submit("explain", {"term": req.term, "complexity": req.complexity,
+                                              "category": req.category, "username": username},
+                                  priority=req.priority, username=username, capped=True)
+    except jobs.QueueFullError as e:
+        raise pending_jobs_exceeded(e)
+    return {"id": job_id, "status": "queued", "priority": req.priority}
+
+def pending_jobs_exceeded(e):
+    return HTTPException(status_code=429, headers={"Retry-After": "60"},
+                         detail=f"You already have {e.pending} jobs pending (limit {e.limit}). "
+                                "Wait for some to finish before submitting more.")
+
+@app.post("/jobs/batch", status_code=202, dependencies=[Depends(admission.guard("batch"))])
+def submit_batch_jobs(req: BatchJobRequest, x_user_id: Optional[str] = Header(None)):
+    # Batches never jump ahead of interactive work
+    if req.priority not in ("batch", "prefetch"):
+        raise HTTPException(status_code=400, detail="priority must be 'batch' or 'prefetch'")
+    terms = [t.strip() for t in req.terms if isinstance(t, str) and t.strip()]
+    if not terms or len(terms) > MAX_BATCH_TERMS:
+        raise HTTPException(status_code=400, detail=f"Send between 1 and {MAX_BATCH_TERMS} terms")
+    username = x_user_id or "anonymous"
+    batch_id = jobs.new_id()
+    try:
+        job_ids = job_queue.submit_many("explain", [{"term": t, "complexity": req.complexity,
+                                                     "category": req.category, "username": username} for t in terms],
+                                        priority=req.priority, username=username, batch_id=batch_id, capped=True)
+    except jobs.QueueFullError as e:
+        raise pending_jobs_exceeded(e)
+    return {"batch_id": batch_id, "jobs": job_ids}
+
+@app.get("/jobs/batch/{batch_id}")
+def get_batch(batch_id: str):
+    batch = job_queue.batch(batch_id)
+    if not batch["total"]:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    # Long-poll: with ?wait=N hold the request until the job finishes or N seconds pass.
+    # Polls the table (the job may run in another worker process) without holding a thread.
+    deadline = time.monotonic() + min(max(wait, 0), MAX_JOB_WAIT)
+    while True:
+        job = await run_in_threadpool(job_queue.get, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if job["status"] in jobs.TERMINAL or time.monotonic() >= deadline:
+            return job
+        await asyncio.sleep(0.25)
+
+@app.get("/admin/jobs")
+def get_job_stats():
+    return job_queue.stats()
+
+@app.post("/transcribe", dependencies=[Depends(admission.guard("transcribe"))])
+@bulkheads.pool("audio")
+def transcribe_audio(file: UploadFile = File(...)):
+    # Sync so the upload read and the Whisper call block an audio pool thread, not the event loop
+    started = time.perf_counter()
+    outcome = "error"
     try:
         transcription = client.audio.transcriptions.create(
             file=(file.filename, file.file.read()),
@@ -314,9 +785,13 @@ async def transcribe_audio(file: UploadFile = File(...)):
             language="en",
             prompt="Scientific terms in English."
         )
+        outcome = "ok"
         return {"text": transcription.text}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        metrics.UPSTREAM_LATENCY.labels(service="whisper", model="whisper-large-v3").observe(time.perf_counter() - started)
+        metrics.UPSTREAM_REQUESTS.labels(service="whisper", model="whisper-large-v3", outcome=outcome).inc()
 
 # --- Feedback Endpoint (Smart Update) ---
 @app.post("/submit_feedback")
@@ -326,22 +801,42 @@ def submit_feedback(req: FeedbackRequest):
     try:
         # Scenario 1: Update existing feedback (User added a comment to an existing rating)
         if req.id:
+            c.execute('SELECT rating, timestamp, term, complexity, category FROM feedback WHERE id = ?', (req.id,))
+            previous = c.fetchone()
             c.execute('''
                 UPDATE feedback 
                 SET rating = ?, comment = ? 
                 WHERE id = ?
             ''', (req.rating, req.comment, req.id))
+            flagged = False
+            if previous:
+                rollups.record_rating(c, previous['timestamp'], previous['term'], previous['complexity'],
+                                      previous['category'], req.rating, previous_rating=previous['rating'])
+                flagged = quality_policy.record_rating(c, previous['term'], previous['complexity'], req.rating,
+                                                       previous_rating=previous['rating'])
+            data_versions.bump(c, "feedback")
             conn.commit()
+            if flagged:
+                explain_cache.expire(previous['term'], previous['complexity'])
             return {"message": "Feedback updated", "id": req.id}
         
         # Scenario 2: Create new feedback (User just clicked a star)
         else:
+            # Local time, same as history, so both line up in the rollup buckets
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             c.execute('''
-                INSERT INTO feedback (username, term, complexity, category, explanation, extra_content, rating, comment) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (req.username, req.term, req.complexity, req.category, req.explanation, req.extra_content, req.rating, req.comment))
+                INSERT INTO feedback (username, term, complexity, category, explanation, extra_content, rating, comment, timestamp) 
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (req.username, req.term, req.complexity, req.category, req.explanation, req.extra_content, req.rating, req.comment, timestamp))
+            feedback_id = c.lastrowid
+            rollups.record_rating(c, timestamp, req.term, req.complexity, req.category, req.rating)
+            flagged = quality_policy.record_rating(c, req.term, req.complexity, req.rating)
+            data_versions.bump(c, "feedback")
             conn.commit()
-            return {"message": "Feedback saved", "id": c.lastrowid} # Return ID so frontend can update later
+            if flagged:
+                # Rated too low: no longer served as fresh, kept as a fallback for upstream outages
+                explain_cache.expire(req.term, req.complexity)
+            return {"message": "Feedback saved", "id": feedback_id} # Return ID so frontend can update later
             
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -362,15 +857,169 @@ def save_history(req: HistoryRequest):
             INSERT INTO history (username, term, category, explanation, extra_content, complexity_used, related_terms, timestamp)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         ''', (req.username, req.term, req.category, req.explanation, req.extra_content, req.complexity_used, related_terms_str, timestamp))
+        rollups.record_search(c, timestamp, req.term, req.complexity_used, req.category)
+        related.record_explanation(c, req.term, req.related_terms)
+        c.execute('UPDATE userstable SET search_count = search_count + 1, last_active = ? WHERE username = ?',
+                  (timestamp, req.username))
+        data_versions.bump(c, "history", f"history:{req.username}")
         conn.commit()
+        related_graph.apply(req.term, req.related_terms)
         return {"message": "History saved"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         conn.close()
 
+# --- Related Terms (answered from the in-memory graph, no LLM call) ---
+RECOMMEND_FROM = 50  # newest history items read per recommendation
+
+@app.get("/related/next/{username}")
+def get_next_terms(username: str, limit: int = 5):
+    # "What to learn next": strongest neighbours of the user's recent searches they haven't looked up yet
+    conn = get_db_connection()
+    c = conn.cursor()
+    try:
+        c.execute('SELECT term FROM history WHERE username = ? ORDER BY id DESC LIMIT ?', (username, RECOMMEND_FROM))
+        recent = [row[0] for row in c.fetchall()]
+    finally:
+        conn.close()
+    related_graph.maybe_refresh()
+    return {"username": username, "based_on": len(recent), "suggestions": related_graph.recommend(recent, limit)}
+
+@app.get("/related/neighbors/{term}")
+def get_term_neighbors(term: str, hops: int = 1, limit: int = 10):
+    if not 1 <= hops <= related.MAX_HOPS:
+        raise HTTPException(status_code=400, detail=f"hops must be between 1 and {related.MAX_HOPS}")
+    related_graph.maybe_refresh()
+    return {"term": term, "hops": hops, "neighbors": related_graph.neighbors(term, hops, limit)}
+
+@app.post("/admin/related/rebuild")
+def rebuild_related_graph():
+    # Repair job: recompute the graph from history, then reload this worker's copy
+    conn = get_db_connection()
+    c = conn.cursor()
+    try:
+        related.rebuild_edges(c)
+        conn.commit()
+    finally:
+        conn.close()
+    related_graph.load()
+    return {"message": "Related-terms graph rebuilt", **related_graph.stats()}
+
+# --- Health Endpoints ---
+@app.get("/healthz")
+async def healthz():
+    # Liveness: the process is up and the event loop answers (no dependencies checked)
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    # Readiness: startup finished and the database answers; 503 tells the load balancer to wait
+    if not STARTUP["ready"]:
+        return JSONResponse(status_code=503, content={"status": "starting", "startup": STARTUP})
+    conn = get_db_connection()
+    try:
+        conn.execute("SELECT 1")
+    except sqlite3.Error as e:
+        return JSONResponse(status_code=503, content={"status": "database unavailable", "error": str(e)})
+    finally:
+        conn.close()
+    return {"status": "ready", "startup": STARTUP, "upstream_breakers": llm.stats()["breakers"]}
+
+# --- Metrics Endpoint (Prometheus text format) ---
+@app.get("/metrics")
+async def get_metrics():
+    # async so the thread pool collector runs on the event loop thread. Collectors never touch a
+    # database: gauges that need one are refreshed in the db pool first, so a locked users.db
+    # delays this scrape but not every other request in the process.
+    try:
+        await executor_pools.run("db", refresh_metric_gauges)
+    except HTTPException:
+        pass  # db pool full: render the last values
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+def refresh_metric_gauges():
+    for component in (explain_cache, job_queue):
+        if component is not None:
+            component.refresh_gauges()
+
 # --- Admin Analytics Endpoints ---
-@app.get("/admin/stats")
+@app.get("/admin/admission")
+def get_admission_stats():
+    # Admitted / queued / shed counters per rate-limited endpoint
+    return admission.stats()
+
+@app.get("/admin/bulkheads")
+def get_bulkhead_stats():
+    # Busy / queued / rejected per executor pool
+    return executor_pools.stats()
+
+@app.get("/admin/upstream")
+def get_upstream_stats():
+    # Retry / hedge / fallback counters and circuit breaker states
+    return llm.stats()
+
+@app.get("/admin/glossary")
+def get_glossary_stats():
+    # Loaded glossary packs and their hit / miss counts
+    return glossary.stats()
+
+@app.get("/admin/routes")
+def get_model_routes():
+    # Routing table with per-route latency and token usage
+    return model_routes.describe()
+
+@app.get("/admin/cache")
+def get_shared_cache_stats():
+    # Entries / hit rate across all workers, plus this worker's own counters
+    return explain_cache.stats()
+
+@app.get("/admin/semantic")
+def get_semantic_cache_stats():
+    # This worker's index: size / memory, lookup latency and hits on top of exact matching
+    if semantic_index is None:
+        return {"enabled": False}
+    return {"enabled": True, **semantic_index.stats()}
+
+@app.get("/admin/revalidation")
+def get_revalidation_stats():
+    # Expired answers served within the budget instead of waiting, and how their refreshes went
+    if revalidator is None:
+        return {"enabled": False}
+    return {"enabled": True, **revalidator.stats()}
+
+@app.get("/admin/quality/worst")
+def get_worst_cached_answers(limit: int = 20, min_ratings: int = 1):
+    # Lowest rolling rating first; 'flagged' / 'queued' entries are waiting to be regenerated
+    conn = get_db_connection()
+    c = conn.cursor()
+    try:
+        return {
+            "threshold": quality_policy.threshold,
+            "min_ratings": quality_policy.min_ratings,
+            "statuses": cache_quality.summary(c),
+            "regenerator": quality_regenerator.stats(),
+            "entries": cache_quality.worst(c, limit, min_ratings),
+        }
+    finally:
+        conn.close()
+
+@app.get("/admin/profiles")
+def list_profiles():
+    # Most recent first; send X-Profile-Token (PROFILE_TOKEN) on a request to capture one
+    return {"profiler": profiler.stats(), "profiles": profiler.list()}
+
+@app.get("/admin/profiles/{profile_id}")
+def get_profile(profile_id: int, format: str = "json", top: int = 30):
+    profile = profiler.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found (it may have rotated out)")
+    if format == "collapsed":
+        # One "frame;frame;frame count" line per stack, for flamegraph.pl / speedscope
+        return PlainTextResponse(profile.collapsed())
+    return profiler.details(profile, top)
+
+@app.get("/admin/stats", dependencies=[versioned("users", "history", "feedback")])
 def get_admin_stats():
     conn = get_db_connection()
     c = conn.cursor()
@@ -394,7 +1043,7 @@ def get_admin_stats():
         }
     finally:
         conn.close()
-@app.get("/admin/trends")
+@app.get("/admin/trends", dependencies=[versioned("history")])
 def get_admin_trends():
     conn = get_db_connection()
     c = conn.cursor()
@@ -423,31 +1072,141 @@ def get_admin_trends():
         }
     finally:
         conn.close()
-@app.get("/admin/users")
-def get_admin_users():
+USER_SORTS = {
+    "username": "username COLLATE NOCASE",
+    "email": "email COLLATE NOCASE",
+    "search_count": "search_count",
+    "last_active": "last_active",
+}
+MAX_USERS_PAGE = 200
+
+@app.get("/admin/users", dependencies=[versioned("users", "history")])
+def get_admin_users(q: Optional[str] = None, sort: str = "username", order: str = "asc",
+                    offset: int = 0, limit: int = 50):
+    # One page of users with their maintained search counts; q matches a username or email prefix
+    if sort not in USER_SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(USER_SORTS)}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'")
+    offset, limit = max(0, offset), max(1, min(limit, MAX_USERS_PAGE))
+    where, params = "", []
+    if q and q.strip():
+        # LIKE is case-insensitive, so a prefix is a range scan on the NOCASE indexes
+        prefix = q.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        where = "WHERE username LIKE ? ESCAPE '\\' OR email LIKE ? ESCAPE '\\'"
+        params = [prefix, prefix]
+    direction = order.upper()
     conn = get_db_connection()
     c = conn.cursor()
     try:
-        # List users with their search counts
-        c.execute('''
-            SELECT u.username, u.email, COUNT(h.id) as search_count
-            FROM userstable u
-            LEFT JOIN history h ON u.username = h.username
-            GROUP BY u.username, u.email
-        ''')
-        users = [{"username": row[0], "email": row[1], "search_count": row[2]} for row in c.fetchall()]
-        return users
+        c.execute(f"SELECT COUNT(*) FROM userstable {where}", params)
+        total = c.fetchone()[0]
+        c.execute(f'''
+            SELECT username, email, search_count, last_active FROM userstable {where}
+            ORDER BY {USER_SORTS[sort]} {direction}, email {direction} LIMIT ? OFFSET ?
+        ''', params + [limit, offset])
+        return {"items": [dict(row) for row in c.fetchall()], "total": total, "offset": offset, "limit": limit}
     finally:
         conn.close()
 
-# Updated for Pagination: Accepts offset and limit
-@app.get("/get_history/{username}")
-def get_history(username: str, offset: int = 0, limit: int = 10):
+@app.get("/admin/timeseries", dependencies=[versioned("history", "feedback", "rollups")])
+def get_admin_timeseries(granularity: str = "day", dimension: str = "total", start: Optional[str] = None,
+                         end: Optional[str] = None, key: Optional[str] = None, top: int = 5):
+    # Range query over the hourly / daily rollups only (never scans history/feedback).
+    # start / end are bucket strings: 'YYYY-MM-DD' (day) or 'YYYY-MM-DD HH:00' (hour)
+    if granularity not in rollups.GRANULARITIES:
+        raise HTTPException(status_code=400, detail="granularity must be 'hour' or 'day'")
+    if dimension not in rollups.DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"dimension must be one of {', '.join(rollups.DIMENSIONS)}")
     conn = get_db_connection()
     c = conn.cursor()
     try:
-        # SQL supports pagination now
-        c.execute('SELECT * FROM history WHERE username = ? ORDER BY timestamp DESC LIMIT ? OFFSET ?', (username, limit, offset))
+        return {
+            "granularity": granularity,
+            "dimension": dimension,
+            "series": rollups.query_timeseries(c, granularity, dimension, start, end, key, top)
+        }
+    finally:
+        conn.close()
+
+@app.post("/admin/rollups/rebuild")
+def rebuild_admin_rollups():
+    # Compaction job: recompute all rollups from the raw tables
+    conn = get_db_connection()
+    c = conn.cursor()
+    try:
+        rollups.rebuild_rollups(c)
+        data_versions.bump(c, "rollups")
+        conn.commit()
+        return {"message": "Rollups rebuilt"}
+    finally:
+        conn.close()
+
+# --- Token Usage Analytics (from the usage ledger) ---
+# start / end are timestamps or dates ('YYYY-MM-DD'); end is exclusive
+@app.get("/admin/usage/users", dependencies=[versioned("usage")])
+def get_usage_by_user(start: Optional[str] = None, end: Optional[str] = None, sort: str = "total_tokens",
+                      limit: int = 50):
+    if sort not in ledger.SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(ledger.SORT_COLUMNS)}")
+    conn = get_db_connection()
+    c = conn.cursor()
+    try:
+        return {"users": ledger.usage_by_user(c, start, end, sort, limit), "ledger": usage_ledger.stats()}
+    finally:
+        conn.close()
+
+@app.get("/admin/usage/complexity", dependencies=[versioned("usage")])
+def get_usage_by_complexity(start: Optional[str] = None, end: Optional[str] = None):
+    conn = get_db_connection()
+    c = conn.cursor()
+    try:
+        return {"complexity": ledger.usage_by_complexity(c, start, end)}
+    finally:
+        conn.close()
+
+@app.get("/admin/usage/daily", dependencies=[versioned("usage")])
+def get_usage_daily(start: Optional[str] = None, end: Optional[str] = None):
+    conn = get_db_connection()
+    c = conn.cursor()
+    try:
+        return {"days": ledger.usage_daily(c, start, end)}
+    finally:
+        conn.close()
+
+# --- Bulk Export (streamed; constant memory regardless of table size) ---
+# start / end are timestamps or dates ('YYYY-MM-DD'); end is exclusive. Ratings only apply to feedback.
+@app.get("/admin/export/{table}")
+def export_table(table: str, format: str = "csv", start: Optional[str] = None, end: Optional[str] = None,
+                 username: Optional[str] = None, complexity: Optional[str] = None,
+                 min_rating: Optional[int] = None, max_rating: Optional[int] = None):
+    if table not in export.TABLES:
+        raise HTTPException(status_code=404, detail=f"table must be one of {', '.join(export.TABLES)}")
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(export.FORMATS)}")
+    if format == "parquet" and not export.parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export needs pyarrow installed on the server")
+
+    filters = {"start": start, "end": end, "username": username, "complexity": complexity,
+               "min_rating": min_rating, "max_rating": max_rating}
+    media_type, extension = export.FORMATS[format]
+    filename = f"{table}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    return StreamingResponse(export.stream(DB_NAME, table, format, filters), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+# Updated for Pagination: Accepts offset and limit, or a before_id cursor
+# Conditional: If-None-Match with the last ETag gets 304 until this user saves new history
+@app.get("/get_history/{username}", dependencies=[versioned("history:{username}")])
+def get_history(username: str, offset: int = 0, limit: int = 10, before_id: Optional[int] = None):
+    conn = get_db_connection()
+    c = conn.cursor()
+    try:
+        if before_id is not None:
+            # Cursor pagination: rows older than the last item the client has (no OFFSET scan)
+            c.execute('SELECT * FROM history WHERE username = ? AND id < ? ORDER BY id DESC LIMIT ?', (username, before_id, limit))
+        else:
+            # SQL supports pagination now
+            c.execute('SELECT * FROM history WHERE username = ? ORDER BY id DESC LIMIT ? OFFSET ?', (username, limit, offset))
         rows = c.fetchall()
         
         history_data = []
@@ -466,7 +1225,7 @@ def get_history(username: str, offset: int = 0, limit: int = 10):
 
 # --- Admin Role Management Endpoints ---
 
-@app.get("/admin/list")
+@app.get("/admin/list", dependencies=[versioned("admins")])
 def list_admins():
     conn = get_db_connection()
     c = conn.cursor()
@@ -484,6 +1243,7 @@ def add_new_admin(req: UserRegister): # Reuse UserRegister model
         hashed_pw = hashlib.sha256(str.encode(req.password)).hexdigest()
         c.execute('INSERT INTO admintable (username, email, password) VALUES (?, ?, ?)',
                   (req.username, req.email, hashed_pw))
+        data_versions.bump(c, "admins")
         conn.commit()
         return {"message": "Admin added successfully"}
     except Exception as e:
@@ -501,12 +1261,13 @@ def delete_admin(email: str):
     c = conn.cursor()
     try:
         c.execute('DELETE FROM admintable WHERE email = ?', (email,))
+        data_versions.bump(c, "admins")
         conn.commit()
         return {"message": "Admin deleted"}
     finally:
         conn.close()
 
-@app.get("/admin/is_super/{email}")
+@app.get("/admin/is_super/{email}", dependencies=[versioned("admins")])
 def check_is_super_admin(email: str):
     conn = get_db_connection()
     c = conn.cursor()
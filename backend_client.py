@@ -0,0 +1,159 @@
+"""
+Shared HTTP client used by app.py to talk to the FastAPI backend.
+
+One keep-alive requests.Session (with a sized connection pool) is created per
+Streamlit server process via st.cache_resource and reused by every script
+run. Every call gets a timeout, idempotent GETs are retried with backoff, and
+each call's latency is logged (INFO, "conceptclarity.backend_client"; see
+configure_logging, APP_LOG_LEVEL). Writes the user doesn't need to wait for
+(e.g. history) can be sent with post_in_background.
+
+GETs are conditional: bodies that came with an ETag are kept in a
+process-wide LRU (BACKEND_BODY_CACHE_MB), the next GET of the same URL
+sends If-None-Match, and a 304 is turned back into a 200 with the cached
+body, so callers never see the difference.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Connection to your FastAPI Backend
+BACKEND_URL = os.getenv("BACKEND_URL", "http://127.0.0.1:8000")
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (3.05, 15)
+# LLM / Whisper calls may wait in the backend's admission queue and retry upstream
+LLM_TIMEOUT = (3.05, 90)
+
+POOL_SIZE = int(os.getenv("BACKEND_POOL_SIZE", "32"))
+BODY_CACHE_BYTES = int(float(os.getenv("BACKEND_BODY_CACHE_MB", "16")) * 1024 * 1024)
+
+logger = logging.getLogger("conceptclarity.backend_client")
+
+
+@st.cache_resource
+def configure_logging():
+    # Nothing else configures logging in the Streamlit process, so without this the "conceptclarity.*"
+    # INFO lines (per-call latency, script run times) would be dropped. Cached: scripts rerun constantly.
+    app_logger = logging.getLogger("conceptclarity")
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    app_logger.addHandler(handler)
+    app_logger.setLevel(os.getenv("APP_LOG_LEVEL", "INFO").upper())
+    app_logger.propagate = False
+    return app_logger
+
+
+@st.cache_resource
+def get_session():
+    session = requests.Session()
+    retry = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD"]),  # never replay POST/DELETE
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class BodyCache:
+    """URL -> (ETag, body bytes), least recently used evicted first, bounded by total body size."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, url):
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is not None:
+                self.entries.move_to_end(url)
+            return entry
+
+    def put(self, url, etag, body):
+        if len(body) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(url, None)
+            if old is not None:
+                self.size -= len(old[1])
+            self.entries[url] = (etag, body)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+
+@st.cache_resource
+def get_body_cache():
+    return BodyCache(BODY_CACHE_BYTES)
+
+
+@st.cache_resource
+def get_background_executor():
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="backend-bg")
+
+
+def request(method, path, timeout=DEFAULT_TIMEOUT, session=None, **kwargs):
+    start = time.perf_counter()
+    status = "error"
+    try:
+        resp = (session or get_session()).request(method, f"{BACKEND_URL}{path}", timeout=timeout, **kwargs)
+        status = resp.status_code
+        return resp
+    finally:
+        logger.info("%s %s -> %s in %.1f ms", method, path, status, (time.perf_counter() - start) * 1000)
+
+
+def get(path, **kwargs):
+    cache = get_body_cache()
+    url = requests.Request("GET", f"{BACKEND_URL}{path}", params=kwargs.get("params")).prepare().url
+    cached = cache.get(url)
+    if cached:
+        kwargs["headers"] = {**(kwargs.get("headers") or {}), "If-None-Match": cached[0]}
+    resp = request("GET", path, **kwargs)
+    if resp.status_code == 304 and cached:
+        # Unchanged: serve the body we already have
+        resp.status_code = 200
+        resp._content = cached[1]
+    elif resp.status_code == 200 and "ETag" in resp.headers:
+        cache.put(url, resp.headers["ETag"], resp.content)
+    return resp
+
+
+def post(path, **kwargs):
+    return request("POST", path, **kwargs)
+
+
+def delete(path, **kwargs):
+    return request("DELETE", path, **kwargs)
+
+
+def _send_in_background(session, method, path, kwargs):
+    try:
+        resp = request(method, path, session=session, **kwargs)
+        if resp.status_code >= 400:
+            logger.warning("Background %s %s failed: %s %s", method, path, resp.status_code, resp.text[:200])
+    except requests.exceptions.RequestException as e:
+        logger.warning("Background %s %s failed: %s", method, path, e)
+
+
+def post_in_background(path, **kwargs):
+    """Fire-and-forget POST: returns immediately, failures are only logged."""
+    # Resolve cached resources here; worker threads have no script run context
+    session = get_session()
+    get_background_executor().submit(_send_in_background, session, "POST", path, kwargs)
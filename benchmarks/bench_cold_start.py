@@ -0,0 +1,113 @@
+"""
+Cold-start benchmark for the backend.
+
+Boots `uvicorn backend:app` repeatedly (fake Groq key, temporary database)
+and measures the time from spawning the process until /readyz answers 200,
+plus the per-phase startup timings the backend reports. Each run uses a
+fresh database (full migration) unless --warm-db is given.
+
+With --workers N every run also checks that exactly one worker migrated the
+schema while the others waited and skipped it.
+
+    python benchmarks/bench_cold_start.py --runs 5 --workers 4 --json cold_start.json
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def boot_once(port, workdir, workers, timeout=60):
+    env = dict(os.environ, GROQ_API_KEY="bench", DB_NAME=os.path.join(workdir, "bench.db"),
+               GLOSSARY_DIR=os.path.join(workdir, "glossary_packs"),
+               SHARED_CACHE_PATH=os.path.join(workdir, "explain_cache.db"), PYTHONUNBUFFERED="1")
+    log_path = os.path.join(workdir, "server.log")
+    with open(log_path, "w") as log:
+        started = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend:app", "--port", str(port),
+                                 "--workers", str(workers), "--log-level", "warning"],
+                                cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            while True:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"backend exited with code {proc.returncode}, see {log_path}")
+                if time.perf_counter() - started > timeout:
+                    raise RuntimeError(f"backend not ready after {timeout}s")
+                try:
+                    r = requests.get(f"http://127.0.0.1:{port}/readyz", timeout=1)
+                    if r.status_code == 200:
+                        ready_ms = (time.perf_counter() - started) * 1000
+                        startup = r.json()["startup"]
+                        break
+                except requests.RequestException:
+                    pass
+                time.sleep(0.01)
+            # Let the remaining workers finish booting before counting migrations
+            time.sleep(1.0 if workers > 1 else 0)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=15)
+    with open(log_path) as f:
+        output = f.read()
+    return {"ready_ms": round(ready_ms, 1), "startup": startup,
+            "migrations_run": output.count("Migrating database schema"),
+            "workers_started": output.count("Startup complete")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--warm-db", action="store_true", help="reuse one already-migrated database")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    runs = []
+    shared = tempfile.mkdtemp(prefix="cc-coldstart-")
+    try:
+        if args.warm_db:
+            boot_once(args.port, shared, 1)
+        for _ in range(args.runs):
+            workdir = shared if args.warm_db else tempfile.mkdtemp(prefix="cc-coldstart-", dir=shared)
+            runs.append(boot_once(args.port, workdir, args.workers))
+    finally:
+        shutil.rmtree(shared, ignore_errors=True)
+
+    phases = {}
+    for run in runs:
+        for name, ms in run["startup"]["phases_ms"].items():
+            phases.setdefault(name, []).append(ms)
+    results = {
+        "runs": args.runs,
+        "workers": args.workers,
+        "database": "warm" if args.warm_db else "fresh",
+        "ready_ms_median": round(statistics.median(r["ready_ms"] for r in runs), 1),
+        "ready_ms_max": max(r["ready_ms"] for r in runs),
+        "import_ms_median": round(statistics.median(r["startup"]["import_ms"] for r in runs), 1),
+        "startup_ms_median": round(statistics.median(r["startup"]["total_ms"] for r in runs), 1),
+        "phases_ms_median": {name: round(statistics.median(v), 1) for name, v in phases.items()},
+        "migrations_per_boot": [r["migrations_run"] for r in runs],
+    }
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    expected = 0 if args.warm_db else 1
+    if any(r["migrations_run"] != expected for r in runs):
+        print(f"FAIL: expected {expected} migration per boot across {args.workers} workers")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
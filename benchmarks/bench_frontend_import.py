@@ -0,0 +1,72 @@
+"""
+Import-time benchmark for the user-facing frontend.
+
+Imports app.py in a fresh interpreter (what the first `streamlit run` session
+pays) several times and reports the median import time, plus the extra time
+the admin pages add. Fails if admin-only analytics dependencies (pandas,
+plotly.express) are loaded by the user-facing pages, or if the median import
+time exceeds --max-ms.
+
+    python benchmarks/bench_frontend_import.py --runs 5 --max-ms 2000 --json import_times.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must only be imported once an admin page is rendered
+ADMIN_ONLY_MODULES = ["pandas", "plotly.express", "admin_pages"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def time_import(module):
+    code = PROBE.format(module=module, heavy=ADMIN_ONLY_MODULES)
+    out = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=None, help="fail if the median app import exceeds this")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    app_runs = [time_import("app") for _ in range(args.runs)]
+    admin_runs = [time_import("admin_pages") for _ in range(args.runs)]
+
+    results = {
+        "runs": args.runs,
+        "app_import_ms_median": round(statistics.median(r["ms"] for r in app_runs), 1),
+        "app_import_ms_max": round(max(r["ms"] for r in app_runs), 1),
+        "admin_pages_import_ms_median": round(statistics.median(r["ms"] for r in admin_runs), 1),
+        "admin_only_modules_loaded_by_app": sorted({m for r in app_runs for m in r["loaded"]}),
+    }
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failures = []
+    if results["admin_only_modules_loaded_by_app"]:
+        failures.append(f"user-facing import loaded admin-only modules: {results['admin_only_modules_loaded_by_app']}")
+    if args.max_ms is not None and results["app_import_ms_median"] > args.max_ms:
+        failures.append(f"median app import {results['app_import_ms_median']} ms > {args.max_ms} ms")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Semantic cache benchmark: index memory, lookup latency and the hit rate it
+adds over exact matching.
+
+The index is filled with a list of real science terms plus synthetic
+filler terms up to --entries. Then a query set is replayed: paraphrases
+of indexed terms (should hit the right term), exact repeats (the exact
+tiers answer these, so they are not sent to the semantic tier), new
+terms that are not in the index and near misses that differ from an
+indexed term only in a number or letter ("hepatitis C" vs "Hepatitis B");
+the last two must not hit anything.
+
+    python benchmarks/bench_semantic.py --entries 20000 --threshold 0.8 --json semantic.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from glossary import normalize_term  # noqa: E402
+from semantic_cache import SemanticIndex  # noqa: E402
+
+TERMS = [
+    "Photosynthesis", "Newton's Second Law of Motion", "Newton's First Law", "Newton's Third Law", "Alpha Decay",
+    "Beta Decay", "Black Hole", "Mitochondria", "DNA Replication", "Quantum Entanglement", "Entropy",
+    "Cellular Respiration", "Plate Tectonics", "General Relativity", "Special Relativity", "Osmosis", "Diffusion",
+    "Photoelectric Effect", "Kinetic Energy", "Potential Energy", "Ohm's Law", "Natural Selection",
+    "Gravitational Waves", "Electromagnetic Induction", "Covalent Bond", "Ionic Bond", "Greenhouse Effect",
+    "Doppler Effect", "Heisenberg Uncertainty Principle", "Pythagorean Theorem", "Big Bang Theory", "Enzyme",
+    "Catalyst", "Half-life", "Speed of Light", "Boyle's Law", "Archimedes' Principle", "Cell Membrane",
+    "Water Cycle", "Nuclear Fusion", "Nuclear Fission", "Supernova", "Neutron Star", "Dark Matter",
+    "Hepatitis B", "Type 1 Diabetes", "Chromosome 21", "Vitamin B12", "World War I", "Carbon-14 Dating",
+]
+PARAPHRASES = [
+    # (query, term it should be answered from)
+    ("process of photosynthesis", "Photosynthesis"), ("Newton's 2nd law", "Newton's Second Law of Motion"),
+    ("newtons second law", "Newton's Second Law of Motion"), ("what is entropy", "Entropy"),
+    ("black holes", "Black Hole"), ("the photoelectric effect", "Photoelectric Effect"),
+    ("ohms law", "Ohm's Law"), ("kinetic energy definition", "Kinetic Energy"),
+    ("explain the doppler effect", "Doppler Effect"), ("heisenberg's uncertainty principle",
+                                                       "Heisenberg Uncertainty Principle"),
+    ("pythagoras theorem", "Pythagorean Theorem"), ("the big bang", "Big Bang Theory"), ("enzymes", "Enzyme"),
+    ("what is a catalyst", "Catalyst"), ("half life", "Half-life"), ("the speed of light", "Speed of Light"),
+    ("boyles law", "Boyle's Law"), ("archimedes principle", "Archimedes' Principle"),
+    ("cell membranes", "Cell Membrane"), ("the water cycle", "Water Cycle"), ("nuclear fusion process",
+                                                                              "Nuclear Fusion"),
+    ("supernovae", "Supernova"), ("neutron stars", "Neutron Star"), ("what is dark matter", "Dark Matter"),
+    ("newton's 1st law", "Newton's First Law"), ("newton's 3rd law", "Newton's Third Law"),
+]
+NEW_TERMS = [
+    "Gamma Decay", "Hooke's Law", "Relativity", "Quantum Tunneling", "Respiration", "Potential Difference",
+    "Greenhouse Gases", "Electromagnetism", "Ionization Energy", "Nuclear Reactor", "White Dwarf", "Dark Energy",
+    "Light Year", "Cell Division", "Water Pollution", "Kinetic Theory of Gases", "Natural Gas", "DNA",
+]
+NEAR_MISSES = [
+    # Score above the default threshold on n-grams alone, but name a different concept
+    "hepatitis C", "type 2 diabetes", "chromosome 13", "vitamin B6", "World War II", "carbon-12",
+]
+
+
+def synthetic_terms(count, seed=7):
+    rng = random.Random(seed)
+    syllables = ["pro", "ton", "lec", "tro", "mag", "neto", "bio", "geo", "chem", "phy", "sis", "gen", "lyte",
+                 "cyto", "plasm", "therm", "dyn", "amic", "quan", "tum", "pho", "ton", "ther", "mal", "iso", "morph"]
+    return [" ".join("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4)))
+                     for _ in range(rng.randint(1, 3))) for _ in range(count)]
+
+
+def run(entries, threshold, dim, complexities=("Basic", "Intermediate", "Advanced")):
+    index = SemanticIndex(dim=dim, threshold=threshold, max_entries=entries)
+    per_complexity = entries // len(complexities)
+    corpus = TERMS + synthetic_terms(max(0, per_complexity - len(TERMS)))
+    started = time.perf_counter()
+    index.rebuild([(term, complexity) for complexity in complexities for term in corpus[:per_complexity]])
+    build_ms = (time.perf_counter() - started) * 1000
+
+    exact = {normalize_term(term) for term in TERMS}
+    queries = [(query, expected) for query, expected in PARAPHRASES if normalize_term(query) not in exact]
+    queries += [(term, None) for term in NEW_TERMS + NEAR_MISSES]
+    queries += [(term, term) for term in TERMS]  # repeats: answered by the exact tiers
+
+    exact_hits = semantic_hits = correct = wrong = near_misses_served = 0
+    latencies = []
+    for query, expected in queries:
+        if normalize_term(query) in exact:
+            exact_hits += 1
+            continue
+        started = time.perf_counter()
+        match = index.lookup(query, "Basic", fetch=lambda matched: matched)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if match:
+            semantic_hits += 1
+            if match[0] == expected:
+                correct += 1
+            else:
+                wrong += 1
+                near_misses_served += query in NEAR_MISSES
+
+    batch = [query for query, _ in queries]
+    started = time.perf_counter()
+    index.search(batch, "Basic", k=5)
+    batch_ms = (time.perf_counter() - started) * 1000
+
+    latencies.sort()
+    total = len(queries)
+    return {
+        "entries": index.size, "dim": dim, "threshold": threshold,
+        "memory_mb": round(index.memory_bytes() / 1e6, 2), "build_ms": round(build_ms, 1),
+        "lookup_ms_p50": round(statistics.median(latencies), 3),
+        "lookup_ms_p99": round(latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))], 3),
+        "batch_ms_per_query": round(batch_ms / len(batch), 3),
+        "queries": total, "exact_hit_rate": round(exact_hits / total, 3),
+        "exact_plus_semantic_hit_rate": round((exact_hits + semantic_hits) / total, 3),
+        "paraphrases_matched": f"{correct}/{len(queries) - len(NEW_TERMS) - len(NEAR_MISSES) - len(TERMS)}",
+        "wrong_matches": wrong,
+        "near_misses_served": f"{near_misses_served}/{len(NEAR_MISSES)}",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, nargs="+", default=[1000, 10000, 20000])
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    results = [run(entries, args.threshold, args.dim) for entries in args.entries]
+    for result in results:
+        print(", ".join(f"{key}={value}" for key, value in result.items()))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Stale-while-revalidate check: how fast expired answers are served when the
+upstream is slow, and that answers users rated down are never among them.
+
+Starts the fake Groq server and the backend (throw-away database, short
+cache TTL), explains a few terms, rates one of them down until cache
+quality control flags it, lets the TTL run out and makes the upstream
+slower than STALE_SERVE_BUDGET. Then:
+
+    ordinary terms  must come back stale, within about the budget
+    flagged term    must wait for a fresh answer (no "freshness": "stale")
+
+    python benchmarks/bench_stale.py --latency 2 --budget 0.5 --json stale.json
+
+Each term is asked by READERS users at once, so most of them join a
+revalidation another one started. The usage ledger must then hold exactly
+one row per request, plus one 'revalidate' row (the upstream call) per
+ordinary term.
+
+Exits 1 if a flagged answer is served stale, an ordinary one is not, or
+the ledger rows don't add up.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_groq import start_fake_groq  # noqa: E402
+from loadtest import start_backend, stop_backend  # noqa: E402
+
+TERMS = ["Gravity", "Entropy", "Osmosis", "Catalyst"]
+FLAGGED = "Entropy"
+COMPLEXITY = "Basic"
+CACHE_TTL = 2.0
+READERS = 3
+
+
+def explain(base_url, term, user):
+    started = time.perf_counter()
+    r = requests.post(base_url + "/explain", json={"term": term, "complexity": COMPLEXITY},
+                      headers={"X-User-Id": user}, timeout=60)
+    r.raise_for_status()
+    return r.json(), time.perf_counter() - started
+
+
+def rate_down(base_url, term, answer, ratings):
+    for i in range(ratings):
+        requests.post(base_url + "/submit_feedback", json={
+            "username": f"rater_{i}", "term": term, "complexity": COMPLEXITY, "category": answer["category"],
+            "explanation": answer["explanation"], "extra_content": answer["extra_content"], "rating": 1,
+        }, timeout=10).raise_for_status()
+
+
+def run(latency, budget, port):
+    fake, state = start_fake_groq()
+    os.environ["STALE_SERVE_BUDGET"] = str(budget)
+    os.environ["QUALITY_MIN_RATINGS"] = "3"
+    with tempfile.TemporaryDirectory(prefix="cc-stale-") as workdir:
+        proc, base_url = start_backend(port, f"http://127.0.0.1:{fake.server_port}", workdir, workers=1,
+                                       keep_admission_limits=False, cache_ttl=CACHE_TTL)
+        try:
+            answers = {term: explain(base_url, term, f"seed_{i}")[0] for i, term in enumerate(TERMS)}
+            rate_down(base_url, FLAGGED, answers[FLAGGED], ratings=3)
+            time.sleep(CACHE_TTL + 0.5)  # every answer is now expired
+            state.set_latency(f"fixed:{latency}")
+
+            results = []
+            with ThreadPoolExecutor(READERS) as pool:
+                for term in TERMS:
+                    users = [f"reader_{term}_{i}" for i in range(READERS)]
+                    for data, seconds in pool.map(lambda user: explain(base_url, term, user), users):
+                        results.append({"term": term, "flagged": term == FLAGGED, "seconds": round(seconds, 3),
+                                        "stale": data.get("freshness") == "stale"})
+            time.sleep(latency + 0.5)  # shutdown cancels revalidations still running
+        finally:
+            stop_backend(proc)  # shuts down cleanly, so the ledger has written everything
+            fake.shutdown()
+        conn = sqlite3.connect(os.path.join(workdir, "bench.db"))
+        try:
+            ledger_rows = dict(conn.execute(
+                "SELECT cache_status, COUNT(*) FROM usage_ledger WHERE username LIKE 'reader_%' GROUP BY cache_status"))
+        finally:
+            conn.close()
+    return results, ledger_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=2.0, help="fake upstream latency once answers expired")
+    parser.add_argument("--budget", type=float, default=0.5, help="STALE_SERVE_BUDGET for the backend")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    results, ledger_rows = run(args.latency, args.budget, args.port)
+    for result in results:
+        print(", ".join(f"{key}={value}" for key, value in result.items()))
+    print("ledger rows:", ", ".join(f"{status}={count}" for status, count in sorted(ledger_rows.items())))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"results": results, "ledger_rows": ledger_rows}, f, indent=2)
+    failed = False
+    wrong = sorted({r["term"] for r in results if r["stale"] == r["flagged"]})
+    if wrong:
+        print(f"FAIL: unexpected freshness for {', '.join(wrong)}")
+        failed = True
+    requests_booked = sum(count for status, count in ledger_rows.items() if status != "revalidate")
+    if requests_booked != len(results) or ledger_rows.get("revalidate", 0) != len(TERMS) - 1:
+        print(f"FAIL: expected {len(results)} request rows and {len(TERMS) - 1} 'revalidate' rows")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
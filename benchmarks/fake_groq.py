@@ -0,0 +1,147 @@
+"""
+Local fake of the Groq API for benchmarks and tests (no quota spent).
+
+Implements the two endpoints backend.py uses:
+    POST /openai/v1/chat/completions      -> a valid explanation JSON + usage
+    POST /openai/v1/audio/transcriptions  -> {"text": "..."}
+
+Latency distributions (seconds):
+    fixed:0.4               always 0.4
+    uniform:0.2:1.5         uniform between 0.2 and 1.5
+    lognormal:0.6:0.5       median 0.6, sigma 0.5 (long tail, like a real LLM)
+
+Run standalone and point the backend at it:
+    python benchmarks/fake_groq.py --port 9100 --latency lognormal:0.6:0.5 --error-rate 0.02
+    GROQ_BASE_URL=http://127.0.0.1:9100 GROQ_API_KEY=fake uvicorn backend:app
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def parse_latency(spec):
+    """'lognormal:0.6:0.5' -> callable returning a delay in seconds."""
+    kind, *args = spec.split(":")
+    values = [float(a) for a in args]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda: random.lognormvariate(math.log(median), sigma)
+    raise ValueError(f"unknown latency distribution: {spec}")
+
+
+class FakeGroqState:
+    def __init__(self, latency="fixed:0", error_rate=0.0, error_status=500):
+        self.set_latency(latency)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.lock = threading.Lock()
+        self.counts = {"chat": 0, "transcriptions": 0, "errors": 0}
+
+    def set_latency(self, spec):
+        self.latency_spec = spec
+        self.latency = parse_latency(spec)
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+
+def _handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, payload, headers=None):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(state.latency())
+
+            if random.random() < state.error_rate:
+                state.count("errors")
+                headers = {"Retry-After": "1"} if state.error_status == 429 else None
+                return self._send(state.error_status, {"error": {"message": "fake upstream error"}}, headers)
+
+            if self.path.endswith("/chat/completions"):
+                state.count("chat")
+                request = json.loads(body or b"{}")
+                return self._send(200, self._completion(request))
+            if self.path.endswith("/audio/transcriptions"):
+                state.count("transcriptions")
+                return self._send(200, {"text": "photosynthesis"})
+            self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+        def _completion(self, request):
+            messages = request.get("messages", [])
+            user = messages[-1]["content"] if messages else ""
+            term = user.split(":", 1)[-1].strip() or "Science"
+            content = {
+                "term": term,
+                "category": "Physics",
+                "explanation": f"{term} is a scientific concept explained simply. " * 3,
+                "extra_content": f"Once upon a time, Raju discovered {term}. " * 5,
+                "related_terms": [f"{term} theory", f"{term} law", f"Applied {term}"],
+            }
+            prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+            completion_tokens = len(json.dumps(content)) // 4
+            return {
+                "id": f"chatcmpl-fake-{random.randrange(1 << 30)}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "fake"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": json.dumps(content)}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            }
+
+    return Handler
+
+
+def start_fake_groq(port=0, latency="fixed:0", error_rate=0.0, error_status=500):
+    """Starts the server in a daemon thread. Returns (server, state); server.server_port has the port."""
+    state = FakeGroqState(latency, error_rate, error_status)
+    server = ThreadingHTTPServer(("127.0.0.1", port), _handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="fake-groq").start()
+    return server, state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", default="lognormal:0.6:0.5")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    args = parser.parse_args()
+
+    server, state = start_fake_groq(args.port, args.latency, args.error_rate, args.error_status)
+    print(f"Fake Groq listening on http://127.0.0.1:{server.server_port} (latency={args.latency}, "
+          f"error_rate={args.error_rate})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
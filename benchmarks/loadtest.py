@@ -0,0 +1,431 @@
+"""
+Load test for backend.py against a local fake Groq server (no quota spent).
+
+Starts benchmarks/fake_groq.py in-process and the backend under uvicorn with
+a throw-away database, seeds a few users, then drives a weighted mix of
+endpoints at each concurrency level for --duration seconds and reports
+throughput, p50/p95/p99 latency and error rate (overall and per endpoint).
+
+    python benchmarks/loadtest.py --concurrency 1,4,16,32 --duration 15 \\
+        --latency lognormal:0.6:0.5 --error-rate 0.02 --out benchmarks/results/run.json
+    python benchmarks/loadtest.py --compare benchmarks/results/baseline.json --max-regression 0.2
+
+Results are written as JSON (full detail) and CSV (one row per level and
+endpoint). With --compare the run is matched against an earlier JSON file by
+(concurrency, endpoint) and the script exits 1 if p95 latency grew or
+throughput fell by more than --max-regression.
+
+Admission limits are lifted by default so the run measures the backend, not
+the rate limiter; pass --keep-admission-limits to measure shedding instead.
+
+Bulkheads: --background-explain N adds N extra clients that do nothing but
+/explain on uncached terms (reported separately as explain_background, not
+in ALL). With a slow upstream this shows whether DB-only endpoints keep
+their latency while LLM calls pile up; --no-bulkheads runs the same load
+with every endpoint in the shared thread pool for comparison:
+
+    python benchmarks/loadtest.py --mix db-only --concurrency 8 --latency fixed:3 \\
+        --background-explain 64 [--no-bulkheads]
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_groq import start_fake_groq  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MIXES = {
+    # A student session: explain, save, browse history, rate; the odd admin page view
+    "default": {"explain": 25, "save_history": 20, "get_history": 30, "submit_feedback": 15, "admin": 10},
+    "read-heavy": {"explain": 10, "save_history": 5, "get_history": 60, "submit_feedback": 5, "admin": 20},
+    "write-heavy": {"explain": 20, "save_history": 45, "get_history": 10, "submit_feedback": 25, "admin": 0},
+    "explain-only": {"explain": 100},
+    # Endpoints that never call the LLM (run with --background-explain to load the LLM pool meanwhile)
+    "db-only": {"login": 20, "get_history": 40, "save_history": 10, "admin": 30},
+}
+
+TERMS = [
+    "Photosynthesis", "Gravity", "Entropy", "Mitochondria", "Osmosis", "Quantum Entanglement", "Black Hole",
+    "DNA Replication", "Newton's Third Law", "Plate Tectonics", "Covalent Bond", "Doppler Effect",
+    "Natural Selection", "Ohm's Law", "Half-life", "Catalyst", "Refraction", "Kinetic Energy", "Isotope",
+    "Electromagnetic Induction", "Cell Membrane", "Greenhouse Effect", "Buoyancy", "Enzyme", "Photon",
+]
+COMPLEXITIES = ["Basic", "Intermediate", "Advanced"]
+ADMIN_PATHS = ["/admin/stats", "/admin/trends", "/admin/users", "/admin/timeseries", "/metrics"]
+
+# Generous enough that admission never sheds during a benchmark
+UNLIMITED_ADMISSION = json.dumps({
+    name: {"global_rate": 100000, "global_burst": 100000, "user_rate": 100000, "user_burst": 100000,
+           "max_queue": 100000, "max_wait": 60}
+    for name in ("explain", "transcribe")
+})
+
+
+# --- Backend process ---
+
+def start_backend(port, groq_url, workdir, workers, keep_admission_limits, cache_ttl=None, bulkheads=True):
+    env = dict(os.environ)
+    env.update({
+        "GROQ_API_KEY": "bench",
+        "GROQ_BASE_URL": groq_url,
+        "DB_NAME": os.path.join(workdir, "bench.db"),
+        "GLOSSARY_DIR": os.path.join(workdir, "glossary_packs"),
+        "SHARED_CACHE_PATH": os.path.join(workdir, "explain_cache.db"),
+        "ADMIN_EMAIL": "bench-admin@example.com",
+        "ADMIN_PASSWORD": "bench",
+    })
+    if not keep_admission_limits:
+        env["ADMISSION_LIMITS"] = UNLIMITED_ADMISSION
+    if cache_ttl is not None:
+        env["SHARED_CACHE_TTL"] = str(cache_ttl)
+    if not bulkheads:
+        env["BULKHEADS"] = "off"
+    cmd = [sys.executable, "-m", "uvicorn", "backend:app", "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(workers), "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, cwd=REPO_ROOT, env=env)
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"backend exited with code {proc.returncode}")
+        try:
+            if requests.get(base_url + "/readyz", timeout=1).status_code == 200:
+                return proc, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("backend did not become ready within 60s")
+
+
+def stop_backend(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+# --- Workload ---
+
+class Workload:
+    def __init__(self, base_url, users, mix):
+        self.base_url = base_url
+        self.users = users
+        self.ops = list(mix)
+        self.weights = [mix[op] for op in self.ops]
+        self.feedback_ids = []
+        self.lock = threading.Lock()
+
+    def seed(self):
+        session = requests.Session()
+        for user in self.users:
+            session.post(self.base_url + "/register",
+                         json={"username": user, "email": f"{user}@example.com", "password": "pw"})
+            for term in random.sample(TERMS, 5):
+                session.post(self.base_url + "/save_history", json=self._history(user, term))
+
+    @staticmethod
+    def _history(user, term):
+        return {"username": user, "term": term, "category": "Physics",
+                "explanation": f"{term} explained. " * 20, "extra_content": f"A story about {term}. " * 30,
+                "complexity_used": random.choice(COMPLEXITIES),
+                "related_terms": [f"{term} theory", f"{term} law", f"Applied {term}"]}
+
+    def run_one(self, session, user):
+        """Runs one weighted-random operation. Returns (op, status, seconds)."""
+        op = random.choices(self.ops, self.weights)[0]
+        term = random.choice(TERMS)
+        headers = {"X-User-Id": user}
+        started = time.perf_counter()
+        try:
+            if op == "explain":
+                r = session.post(self.base_url + "/explain", headers=headers, timeout=120,
+                                 json={"term": term, "complexity": random.choice(COMPLEXITIES)})
+            elif op == "save_history":
+                r = session.post(self.base_url + "/save_history", json=self._history(user, term), timeout=30)
+            elif op == "login":
+                r = session.post(self.base_url + "/login", json={"email": f"{user}@example.com", "password": "pw"},
+                                 timeout=30)
+            elif op == "get_history":
+                r = session.get(f"{self.base_url}/get_history/{user}", params={"limit": 10}, timeout=30)
+            elif op == "submit_feedback":
+                r = self._feedback(session, user, term)
+            else:
+                r = session.get(self.base_url + random.choice(ADMIN_PATHS), timeout=30)
+            status = r.status_code
+        except requests.RequestException:
+            status = 0  # connection error / client timeout
+        return op, status, time.perf_counter() - started
+
+    def _feedback(self, session, user, term):
+        payload = {"username": user, "term": term, "complexity": random.choice(COMPLEXITIES),
+                   "category": "Physics", "explanation": f"{term} explained.", "extra_content": "",
+                   "rating": random.randint(1, 5), "comment": ""}
+        with self.lock:
+            # Roughly a third of ratings get a follow-up comment (the UPDATE path)
+            if self.feedback_ids and random.random() < 0.3:
+                payload["id"] = random.choice(self.feedback_ids)
+                payload["comment"] = "Helpful, thanks!"
+        r = session.post(self.base_url + "/submit_feedback", json=payload, timeout=30)
+        if r.status_code == 200 and "id" not in payload:
+            with self.lock:
+                self.feedback_ids.append(r.json()["id"])
+                del self.feedback_ids[:-1000]
+        return r
+
+    def run_background_explain(self, session):
+        """One /explain on a term nobody asked for before, so it always goes upstream."""
+        term = f"{random.choice(TERMS)} variant {random.getrandbits(48):x}"
+        started = time.perf_counter()
+        try:
+            r = session.post(self.base_url + "/explain", headers={"X-User-Id": "background"}, timeout=120,
+                             json={"term": term, "complexity": random.choice(COMPLEXITIES)})
+            status = r.status_code
+        except requests.RequestException:
+            status = 0
+        return "explain_background", status, time.perf_counter() - started
+
+
+def run_level(workload, concurrency, duration, warmup, background=0):
+    """Returns (samples, background samples)."""
+    samples = []
+    background_samples = []
+    lock = threading.Lock()
+    start = time.monotonic()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+
+    def worker(index):
+        session = requests.Session()
+        user = workload.users[index % len(workload.users)]
+        local = []
+        while True:
+            now = time.monotonic()
+            if now >= stop_at:
+                break
+            result = workload.run_one(session, user)
+            if now >= measure_from:
+                local.append(result)
+        with lock:
+            samples.extend(local)
+
+    def background_worker():
+        session = requests.Session()
+        local = []
+        while True:
+            now = time.monotonic()
+            if now >= stop_at:
+                break
+            result = workload.run_background_explain(session)
+            if now >= measure_from:
+                local.append(result)
+        with lock:
+            background_samples.extend(local)
+
+    threads = [threading.Thread(target=background_worker) for _ in range(background)]
+    threads += [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, background_samples
+
+
+# --- Reporting ---
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, duration):
+    latencies = sorted(s[2] for s in samples)
+    errors = sum(1 for s in samples if s[1] == 0 or s[1] >= 500 or s[1] == 429)
+    statuses = {}
+    for s in samples:
+        statuses[str(s[1])] = statuses.get(str(s[1]), 0) + 1
+
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "requests": len(samples),
+        "throughput_rps": round(len(samples) / duration, 2),
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+        "status_codes": statuses,
+    }
+
+
+def report(levels):
+    header = f"{'conc':>5} {'endpoint':<16} {'reqs':>7} {'rps':>8} {'err%':>6} {'p50ms':>9} {'p95ms':>9} {'p99ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for level in levels:
+        for name, s in [("ALL", level["overall"])] + sorted(level["endpoints"].items()):
+            print(f"{level['concurrency']:>5} {name:<16} {s['requests']:>7} {s['throughput_rps']:>8} "
+                  f"{s['error_rate'] * 100:>6.2f} {s['p50_ms'] or 0:>9} {s['p95_ms'] or 0:>9} {s['p99_ms'] or 0:>9}")
+
+
+def write_results(path, results):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    csv_path = os.path.splitext(path)[0] + ".csv"
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["concurrency", "endpoint", "requests", "throughput_rps", "error_rate",
+                         "p50_ms", "p95_ms", "p99_ms", "max_ms"])
+        for level in results["levels"]:
+            for name, s in [("ALL", level["overall"])] + sorted(level["endpoints"].items()):
+                writer.writerow([level["concurrency"], name, s["requests"], s["throughput_rps"], s["error_rate"],
+                                 s["p50_ms"], s["p95_ms"], s["p99_ms"], s["max_ms"]])
+    print(f"Results written to {path} and {csv_path}")
+
+
+def compare(baseline_path, results, max_regression, min_requests):
+    """
+    Prints deltas against a previous run; returns False if anything regressed
+    past the threshold. Rows with fewer than `min_requests` samples on either
+    side are too noisy to judge and are skipped.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    old = {}
+    for level in baseline["levels"]:
+        old[(level["concurrency"], "ALL")] = level["overall"]
+        for name, s in level["endpoints"].items():
+            old[(level["concurrency"], name)] = s
+
+    ok = True
+    print(f"\nComparison with {baseline_path} (threshold {max_regression:.0%}):")
+    for level in results["levels"]:
+        for name, s in [("ALL", level["overall"])] + sorted(level["endpoints"].items()):
+            before = old.get((level["concurrency"], name))
+            if not before or min(before["requests"], s["requests"]) < min_requests:
+                continue
+            if not before["p95_ms"] or not s["p95_ms"] or not before["throughput_rps"]:
+                continue
+            p95_change = s["p95_ms"] / before["p95_ms"] - 1
+            rps_change = s["throughput_rps"] / before["throughput_rps"] - 1
+            regressed = p95_change > max_regression or rps_change < -max_regression
+            ok = ok and not regressed
+            print(f"{level['concurrency']:>5} {name:<16} p95 {before['p95_ms']:>9} -> {s['p95_ms']:>9} "
+                  f"({p95_change:+.1%})  rps {before['throughput_rps']:>8} -> {s['throughput_rps']:>8} "
+                  f"({rps_change:+.1%}){'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def parse_mix(value):
+    if value in MIXES:
+        return MIXES[value]
+    mix = {}
+    for part in value.split(","):
+        name, weight = part.split("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,4,16,32", help="comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=15, help="measured seconds per level")
+    parser.add_argument("--warmup", type=float, default=2, help="unmeasured seconds before each level")
+    parser.add_argument("--mix", default="default",
+                        help=f"one of {', '.join(MIXES)} or weights like 'explain=50,get_history=50'")
+    parser.add_argument("--latency", default="lognormal:0.6:0.5", help="fake Groq latency distribution")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake Groq calls that fail")
+    parser.add_argument("--error-status", type=int, default=500, help="status code of failed fake Groq calls")
+    parser.add_argument("--users", type=int, default=20, help="distinct simulated users")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--keep-admission-limits", action="store_true")
+    parser.add_argument("--background-explain", type=int, default=0,
+                        help="extra clients doing only uncached /explain calls (not counted in ALL)")
+    parser.add_argument("--no-bulkheads", action="store_true", help="run all endpoints in the shared thread pool")
+    parser.add_argument("--cache-ttl", type=float,
+                        help="shared explanation cache TTL in seconds (0: every /explain goes upstream)")
+    parser.add_argument("--out", help="results JSON path (default: benchmarks/results/loadtest-<time>.json)")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    parser.add_argument("--min-requests", type=int, default=50, help="ignore smaller samples when comparing")
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(",")]
+    mix = parse_mix(args.mix)
+    fake, fake_state = start_fake_groq(latency=args.latency, error_rate=args.error_rate,
+                                       error_status=args.error_status)
+    groq_url = f"http://127.0.0.1:{fake.server_port}"
+
+    with tempfile.TemporaryDirectory(prefix="cc-loadtest-") as workdir:
+        proc, base_url = start_backend(args.port, groq_url, workdir, args.workers, args.keep_admission_limits,
+                                       args.cache_ttl, bulkheads=not args.no_bulkheads)
+        try:
+            workload = Workload(base_url, [f"bench_user_{i}" for i in range(args.users)], mix)
+            workload.seed()
+            results_levels = []
+            for concurrency in levels:
+                print(f"Running concurrency={concurrency} for {args.duration}s ...")
+                samples, background = run_level(workload, concurrency, args.duration, args.warmup,
+                                                args.background_explain)
+                per_op = {}
+                for sample in samples + background:
+                    per_op.setdefault(sample[0], []).append(sample)
+                results_levels.append({
+                    "concurrency": concurrency,
+                    "overall": summarize(samples, args.duration),
+                    "endpoints": {op: summarize(s, args.duration) for op, s in per_op.items()},
+                })
+        finally:
+            stop_backend(proc)
+            fake.shutdown()
+
+    results = {
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "git_revision": git_revision(),
+        "config": {"duration": args.duration, "warmup": args.warmup, "mix": mix, "latency": args.latency,
+                   "error_rate": args.error_rate, "error_status": args.error_status, "users": args.users,
+                   "workers": args.workers, "admission_limits": args.keep_admission_limits,
+                   "cache_ttl": args.cache_ttl, "background_explain": args.background_explain,
+                   "bulkheads": not args.no_bulkheads},
+        "fake_groq_calls": fake_state.counts,
+        "levels": results_levels,
+    }
+    report(results_levels)
+    out = args.out or os.path.join(REPO_ROOT, "benchmarks", "results",
+                                   f"loadtest-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    write_results(out, results)
+
+    if args.compare and not compare(args.compare, results, args.max_regression, args.min_requests):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Bulkheads: separate, independently sized thread pools for upstream AI
+calls, audio processing and database work.
+
+Starlette runs every sync endpoint in one shared pool (anyio's default
+limiter, 40 threads), so a burst of slow /explain calls can take every
+thread while /login, /get_history and the admin pages queue behind them.
+Here each kind of work gets its own anyio CapacityLimiter:
+
+    llm    /explain (waits on the upstream for seconds)
+    audio  /transcribe (upload + Whisper)
+    db     every other sync endpoint (the default)
+
+A route picks its pool with the @bulkheads.pool("llm") decorator, placed
+under @app.get / @app.post; the route class (route_class()) reads it.
+Async endpoints stay on the event loop. When all of a pool's threads are
+busy and max_queue calls are already waiting, further calls get a 503
+with Retry-After straight away instead of piling up.
+
+Sizes can be overridden with BULKHEAD_LIMITS, e.g.
+    BULKHEAD_LIMITS='{"llm": {"workers": 32, "max_queue": 64}}'
+and BULKHEADS=off runs everything in the shared pool again.
+"""
+import asyncio
+import functools
+import json
+import os
+import time
+from dataclasses import dataclass, asdict, replace
+
+import anyio
+import anyio.to_thread
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.routing import APIRoute
+
+from metrics import Histogram
+
+DEFAULT_POOL = "db"
+
+POOL_WAIT = Histogram("bulkhead_wait_seconds", "Time a call waited for a thread in its pool", ["pool"],
+                      buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+
+
+@dataclass
+class PoolLimits:
+    workers: int     # threads the pool may use at once
+    max_queue: int   # calls allowed to wait for a thread; more are rejected with 503
+
+
+DEFAULT_LIMITS = {
+    "llm": PoolLimits(workers=24, max_queue=48),
+    "audio": PoolLimits(workers=4, max_queue=8),
+    "db": PoolLimits(workers=16, max_queue=200),
+}
+
+
+def limits_from_env():
+    limits = dict(DEFAULT_LIMITS)
+    overrides = os.getenv("BULKHEAD_LIMITS")
+    if overrides:
+        for name, values in json.loads(overrides).items():
+            limits[name] = replace(limits.get(name, DEFAULT_LIMITS[DEFAULT_POOL]), **values)
+    return limits
+
+
+def pool(name):
+    """Decorator assigning a sync endpoint to a pool; goes under @app.get / @app.post."""
+    def assign(endpoint):
+        endpoint.bulkhead = name
+        return endpoint
+    return assign
+
+
+class Pool:
+    def __init__(self, name, limits):
+        self.name = name
+        self.limits = limits
+        self.limiter = anyio.CapacityLimiter(limits.workers)
+        # Running + waiting calls. Counted on the event loop when a call is admitted: the limiter only
+        # sees a waiter after a checkpoint, so a burst would all pass a check of its statistics.
+        self.admitted = 0
+        self.counters = {"completed": 0, "rejected": 0}
+
+    def stats(self):
+        busy = self.limiter.statistics().borrowed_tokens
+        return {**asdict(self.limits), "busy": busy, "queued": max(0, self.admitted - busy), **self.counters}
+
+
+class Bulkheads:
+    def __init__(self, limits=None, enabled=True):
+        self.configure(limits or DEFAULT_LIMITS, enabled)
+
+    def configure(self, limits, enabled=True):
+        self.enabled = enabled
+        self.pools = {name: Pool(name, lim) for name, lim in limits.items()}
+
+    def configure_from_env(self):
+        """Replaces the pools; used once the environment is loaded at startup."""
+        self.configure(limits_from_env(), os.getenv("BULKHEADS", "on") != "off")
+
+    async def run(self, name, func, *args, **kwargs):
+        """Runs the sync func in pool `name` (the shared pool if bulkheads are off or the pool is unknown)."""
+        target = self.pools.get(name) if self.enabled else None
+        if target is None:
+            return await run_in_threadpool(func, *args, **kwargs)
+
+        if target.admitted >= target.limits.workers + target.limits.max_queue:
+            target.counters["rejected"] += 1
+            raise HTTPException(status_code=503, detail=f"Server busy ({name}), please try again shortly.",
+                                headers={"Retry-After": "1"})
+
+        target.admitted += 1
+        queued_at = time.perf_counter()
+
+        def call():
+            POOL_WAIT.labels(pool=name).observe(time.perf_counter() - queued_at)
+            return func(*args, **kwargs)
+
+        try:
+            return await anyio.to_thread.run_sync(call, limiter=target.limiter)
+        finally:
+            target.admitted -= 1
+            target.counters["completed"] += 1
+
+    def wrap(self, endpoint):
+        """Makes a sync endpoint run in its pool; async endpoints are returned unchanged."""
+        if asyncio.iscoroutinefunction(endpoint):
+            return endpoint
+        name = getattr(endpoint, "bulkhead", DEFAULT_POOL)
+
+        @functools.wraps(endpoint)
+        async def run_in_pool(*args, **kwargs):
+            return await self.run(name, endpoint, *args, **kwargs)
+
+        return run_in_pool
+
+    def stats(self):
+        return {"enabled": self.enabled, "pools": {name: p.stats() for name, p in self.pools.items()}}
+
+    def collect_metrics(self):
+        # Scraped from /metrics, which is async, so the limiters are read on the event loop
+        stats = {name: p.stats() for name, p in self.pools.items()}
+        yield ("bulkhead_capacity", "gauge", "Threads each pool may use at once",
+               [({"pool": name}, s["workers"]) for name, s in stats.items()])
+        yield ("bulkhead_busy", "gauge", "Threads currently in use per pool",
+               [({"pool": name}, s["busy"]) for name, s in stats.items()])
+        yield ("bulkhead_queue_depth", "gauge", "Calls waiting for a thread per pool",
+               [({"pool": name}, s["queued"]) for name, s in stats.items()])
+        yield ("bulkhead_rejected_total", "counter", "Calls rejected with 503 because their pool was full",
+               [({"pool": name}, s["rejected"]) for name, s in stats.items()])
+
+
+def route_class(bulkheads, base=APIRoute):
+    """Route class that runs each sync endpoint in its bulkhead pool (see pool())."""
+
+    class BulkheadRoute(base):
+        def __init__(self, path, endpoint, **kwargs):
+            super().__init__(path, bulkheads.wrap(endpoint), **kwargs)
+
+    return BulkheadRoute
@@ -0,0 +1,323 @@
+"""
+Feedback-driven quality control for cached explanations.
+
+cache_quality keeps one row per cached entry (normalized term, complexity):
+rating count / sum and an exponentially weighted moving average of the
+ratings (QUALITY_ALPHA), so recent ratings weigh more than old ones. It is
+updated in the same transaction as the feedback row.
+
+When an entry has at least QUALITY_MIN_RATINGS ratings and its average
+drops below QUALITY_THRESHOLD it is flagged. The backend then expires the
+shared cache entry: it is no longer served as fresh (nor stale while the
+upstream is merely slow), a request for it regenerates it on the spot and
+resets its ratings, and it stays available as a fallback only while the
+upstream is down.
+
+Flagged entries nobody asks for again are regenerated by the Regenerator:
+a background thread per worker that, off-peak only (QUALITY_REGEN_HOURS,
+server local time, default "1-6" = 01:00-05:59; "any" for every hour; and
+never while interactive jobs are waiting), claims flagged rows and queues
+"regenerate" jobs at prefetch priority, at most QUALITY_REGEN_PER_HOUR per
+worker (token bucket). A regenerated entry starts over with no ratings.
+A row whose job could not be submitted goes straight back to 'flagged';
+one still 'queued' after QUALITY_REQUEUE_AFTER seconds (default 12 h) lost
+its job and is flagged again too.
+
+Answers served from glossary packs are tracked too, but packs take
+precedence over the cache, so a bad pack entry has to be fixed in the pack.
+"""
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import metrics
+from admission import TokenBucket
+from shared_cache import cache_key
+
+STATUSES = ("ok", "flagged", "queued")
+DEFAULT_REGEN_HOURS = "1-6"  # off-peak window for background regeneration
+SWEEP_INTERVAL = 600  # seconds between looking for 'queued' rows whose job was lost
+
+
+def create_table(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS cache_quality (
+            key TEXT PRIMARY KEY,       -- shared_cache.cache_key(term, complexity)
+            term TEXT,
+            complexity TEXT,
+            ratings INTEGER DEFAULT 0,
+            rating_sum INTEGER DEFAULT 0,
+            ewma REAL,                  -- rolling average, recent ratings weigh more
+            last_rating_at DATETIME,
+            status TEXT DEFAULT 'ok',   -- ok / flagged / queued (regeneration job submitted)
+            flagged_at DATETIME,
+            queued_at DATETIME,
+            regenerated_at DATETIME,
+            regenerations INTEGER DEFAULT 0
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_cache_quality_status ON cache_quality(status, flagged_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_cache_quality_ewma ON cache_quality(ewma)")
+
+
+def add_missing_columns(c):
+    # Tables created before queued_at existed (migration)
+    c.execute("PRAGMA table_info(cache_quality)")
+    if "queued_at" not in [info[1] for info in c.fetchall()]:
+        c.execute("ALTER TABLE cache_quality ADD COLUMN queued_at DATETIME")
+
+
+class QualityPolicy:
+    def __init__(self, threshold=2.5, min_ratings=3, alpha=0.3):
+        self.threshold = threshold
+        self.min_ratings = min_ratings
+        self.alpha = alpha
+
+    @classmethod
+    def from_env(cls):
+        return cls(threshold=float(os.getenv("QUALITY_THRESHOLD", "2.5")),
+                   min_ratings=int(os.getenv("QUALITY_MIN_RATINGS", "3")),
+                   alpha=float(os.getenv("QUALITY_ALPHA", "0.3")))
+
+    def record_rating(self, c, term, complexity, rating, previous_rating=None):
+        """
+        Adds a rating (or replaces `previous_rating` when a user changes theirs).
+        Call in the feedback write's transaction. Returns True if this rating
+        flagged the entry.
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        key = cache_key(term, complexity)
+        if previous_rating is None:
+            c.execute('''
+                INSERT INTO cache_quality (key, term, complexity, ratings, rating_sum, ewma, last_rating_at)
+                VALUES (?, ?, ?, 1, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    ratings = ratings + 1, rating_sum = rating_sum + excluded.rating_sum,
+                    ewma = COALESCE(ewma + ? * (excluded.ewma - ewma), excluded.ewma), last_rating_at = excluded.last_rating_at
+            ''', (key, term.strip(), complexity, rating, rating, now, self.alpha))
+        else:
+            c.execute('''
+                UPDATE cache_quality SET rating_sum = rating_sum + ?, ewma = ewma + ? * ?, last_rating_at = ?
+                WHERE key = ? AND ratings > 0  -- not if the rated answer was regenerated since
+            ''', (rating - previous_rating, self.alpha, rating - previous_rating, now, key))
+
+        c.execute('''
+            UPDATE cache_quality SET status = 'flagged', flagged_at = ?
+            WHERE key = ? AND status = 'ok' AND ratings >= ? AND ewma < ?
+        ''', (now, key, self.min_ratings, self.threshold))
+        return c.rowcount > 0
+
+    def rebuild(self, c):
+        """Recompute every aggregate from the feedback table (migration backfill)."""
+        c.execute("DELETE FROM cache_quality")
+        for term, complexity, rating in c.execute(
+                "SELECT term, complexity, rating FROM feedback WHERE rating IS NOT NULL ORDER BY id").fetchall():
+            self.record_rating(c, term, complexity, rating)
+
+
+# --- Regeneration ---
+
+def claim_flagged(db_path, limit):
+    """Atomically moves up to `limit` of the oldest flagged rows to 'queued'; returns (term, complexity) pairs."""
+    conn = sqlite3.connect(db_path, timeout=10, factory=metrics.TimedConnection)
+    conn.isolation_level = None
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute('''
+            UPDATE cache_quality SET status = 'queued', queued_at = ?
+            WHERE key IN (SELECT key FROM cache_quality WHERE status = 'flagged' ORDER BY flagged_at LIMIT ?)
+            RETURNING term, complexity
+        ''', (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), limit)).fetchall()
+        conn.execute("COMMIT")
+        return rows
+    except sqlite3.OperationalError:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        return []
+    finally:
+        conn.close()
+
+
+def needs_regeneration(c, term, complexity):
+    """True if the entry was flagged for low ratings and has not been regenerated since."""
+    c.execute("SELECT status FROM cache_quality WHERE key = ?", (cache_key(term, complexity),))
+    row = c.fetchone()
+    return row is not None and row[0] != "ok"
+
+
+def mark_regenerated(c, term, complexity):
+    # A new answer replaced the flagged one: its ratings start over. No-op if that was already recorded.
+    c.execute('''
+        UPDATE cache_quality SET status = 'ok', ratings = 0, rating_sum = 0, ewma = NULL,
+            regenerated_at = ?, regenerations = regenerations + 1
+        WHERE key = ? AND status != 'ok'
+    ''', (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), cache_key(term, complexity)))
+
+
+def mark_failed(c, term, complexity):
+    # Back in line; the next off-peak window tries again
+    c.execute("UPDATE cache_quality SET status = 'flagged' WHERE key = ? AND status = 'queued'",
+              (cache_key(term, complexity),))
+
+
+def release(db_path, rows):
+    """Puts claimed (term, complexity) rows whose job could not be submitted back to 'flagged'."""
+    conn = sqlite3.connect(db_path, timeout=10, factory=metrics.TimedConnection)
+    try:
+        c = conn.cursor()
+        for term, complexity in rows:
+            mark_failed(c, term, complexity)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def requeue_stuck(db_path, older_than):
+    """
+    Moves rows queued more than `older_than` seconds ago back to 'flagged':
+    their job was lost (abandoned after repeated crashes, failed before
+    mark_failed, deleted). Returns how many.
+    """
+    cutoff = datetime.fromtimestamp(time.time() - older_than).strftime("%Y-%m-%d %H:%M:%S")
+    conn = sqlite3.connect(db_path, timeout=10, factory=metrics.TimedConnection)
+    try:
+        count = conn.execute('''
+            UPDATE cache_quality SET status = 'flagged'
+            WHERE status = 'queued' AND (queued_at IS NULL OR queued_at < ?)
+        ''', (cutoff,)).rowcount
+        conn.commit()
+        return count
+    finally:
+        conn.close()
+
+
+def parse_hours(spec):
+    """'1-6' -> hours 1..5 (end exclusive), '22-6' wraps past midnight, '' or 'any' -> every hour."""
+    if not spec or spec == "any":
+        return set(range(24))
+    start, _, end = spec.partition("-")
+    start, end = int(start) % 24, int(end) % 24
+    hours, hour = set(), start
+    while True:
+        hours.add(hour)
+        hour = (hour + 1) % 24
+        if hour == end:
+            return hours
+
+
+class Regenerator:
+    def __init__(self, db_path, submit, is_busy, per_hour=30, burst=5, hours=DEFAULT_REGEN_HOURS,
+                 poll_interval=60.0, requeue_after=12 * 3600):
+        self.db_path = db_path
+        self.submit = submit        # callable(term, complexity) -> job id
+        self.is_busy = is_busy      # callable() -> True while interactive work is waiting
+        self.bucket = TokenBucket(per_hour / 3600, burst)
+        self.per_hour = per_hour
+        self.hours = parse_hours(hours)
+        self.hours_spec = hours or "any"
+        self.poll_interval = poll_interval
+        self.requeue_after = requeue_after  # a row queued this long lost its job
+        self.last_sweep = 0.0
+        self.stopping = threading.Event()
+        self.thread = None
+        self.counters = {"queued": 0, "submit_failed": 0, "requeued_stuck": 0, "skipped_peak": 0, "skipped_busy": 0}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, db_path, submit, is_busy):
+        return cls(db_path, submit, is_busy,
+                   per_hour=float(os.getenv("QUALITY_REGEN_PER_HOUR", "30")),
+                   burst=int(os.getenv("QUALITY_REGEN_BURST", "5")),
+                   hours=os.getenv("QUALITY_REGEN_HOURS", DEFAULT_REGEN_HOURS),
+                   poll_interval=float(os.getenv("QUALITY_REGEN_POLL", "60")),
+                   requeue_after=float(os.getenv("QUALITY_REQUEUE_AFTER", str(12 * 3600))))
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True, name="quality-regenerator")
+        self.thread.start()
+
+    def stop(self, timeout=5.0):
+        self.stopping.set()
+        if self.thread:
+            self.thread.join(timeout)
+
+    def _run(self):
+        while not self.stopping.wait(self.poll_interval):
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"Warning: quality regeneration round failed: {e}")
+
+    def tick(self):
+        """One round: queue as many flagged entries as the token bucket allows. Returns how many."""
+        self.sweep()
+        if datetime.now().hour not in self.hours:
+            with self.lock:
+                self.counters["skipped_peak"] += 1
+            return 0
+        if self.is_busy():
+            with self.lock:
+                self.counters["skipped_busy"] += 1
+            return 0
+        self.bucket.refill(time.monotonic())
+        available = int(self.bucket.tokens)
+        if available < 1:
+            return 0
+        claimed = claim_flagged(self.db_path, available)
+        for i, (term, complexity) in enumerate(claimed):
+            try:
+                self.submit(term, complexity)
+            except Exception as e:
+                # Not queued after all: back to 'flagged' for the next round instead of stuck in 'queued'
+                release(self.db_path, claimed[i:])
+                with self.lock:
+                    self.counters["queued"] += i
+                    self.counters["submit_failed"] += len(claimed) - i
+                print(f"Warning: could not queue regeneration of {term!r}: {e}")
+                return i
+            self.bucket.take()
+        with self.lock:
+            self.counters["queued"] += len(claimed)
+        return len(claimed)
+
+    def sweep(self):
+        """Every SWEEP_INTERVAL, returns rows whose regeneration job was lost to 'flagged'."""
+        now = time.monotonic()
+        if now - self.last_sweep < SWEEP_INTERVAL:
+            return
+        self.last_sweep = now
+        requeued = requeue_stuck(self.db_path, self.requeue_after)
+        if requeued:
+            with self.lock:
+                self.counters["requeued_stuck"] += requeued
+
+    def stats(self):
+        with self.lock:
+            return {**self.counters, "per_hour": self.per_hour, "hours": self.hours_spec,
+                    "tokens": round(self.bucket.tokens, 2)}
+
+    def collect_metrics(self):
+        with self.lock:
+            queued = self.counters["queued"]
+        yield ("quality_regenerations_queued_total", "counter",
+               "Low-rated cache entries queued for regeneration by this worker", [({}, queued)])
+
+
+# --- Admin view ---
+
+def worst(c, limit=20, min_ratings=1):
+    c.execute('''
+        SELECT term, complexity, ratings, ROUND(CAST(rating_sum AS REAL) / ratings, 2) AS avg_rating,
+               ROUND(ewma, 2) AS rolling_rating, status, last_rating_at, flagged_at, regenerated_at, regenerations
+        FROM cache_quality WHERE ratings >= ? ORDER BY ewma ASC, ratings DESC LIMIT ?
+    ''', (min_ratings, limit))
+    return [dict(row) for row in c.fetchall()]
+
+
+def summary(c):
+    c.execute("SELECT status, COUNT(*) FROM cache_quality GROUP BY status")
+    counts = dict.fromkeys(STATUSES, 0)
+    counts.update(c.fetchall())
+    return counts
@@ -0,0 +1,36 @@
+"""
+Data version counters for conditional requests.
+
+Every write that changes what a read endpoint returns bumps one or more
+named counters in the same transaction ("history", "history:<username>",
+"feedback", "users", "admins", "rollups", "usage"). A read endpoint's
+ETag is derived from the counters it depends on, so checking freshness
+costs one primary-key lookup instead of re-running the endpoint's query.
+
+The "epoch" row is a random token written when the table is created; it
+changes if the database is replaced, so ETags from an old database never
+match a new one.
+"""
+import uuid
+
+
+def create_table(c):
+    c.execute("CREATE TABLE IF NOT EXISTS data_versions (name TEXT PRIMARY KEY, version INTEGER DEFAULT 0)")
+    c.execute("INSERT OR IGNORE INTO data_versions (name, version) VALUES ('epoch', ?)",
+              (uuid.uuid4().int & 0x7FFFFFFFFFFFFFFF,))
+
+
+def bump(c, *names):
+    """Call inside the write's transaction."""
+    c.executemany('''
+        INSERT INTO data_versions (name, version) VALUES (?, 1)
+        ON CONFLICT(name) DO UPDATE SET version = version + 1
+    ''', [(name,) for name in names])
+
+
+def read(c, names):
+    """[(name, version)] for 'epoch' plus `names` (0 for counters never bumped)."""
+    names = ["epoch"] + list(names)
+    c.execute(f"SELECT name, version FROM data_versions WHERE name IN ({','.join('?' * len(names))})", names)
+    found = dict(c.fetchall())
+    return [(name, found.get(name, 0)) for name in names]
@@ -0,0 +1,173 @@
+"""
+Streaming bulk export of the raw history / feedback tables.
+
+Rows are read in chunks of EXPORT_CHUNK_SIZE, paged by key (id > last id
+of the previous chunk), and encoded chunk by chunk, so memory stays
+constant however large the table is and the client starts receiving data
+immediately (chunked transfer encoding). Each chunk is one short read: no
+cursor stays open while the client downloads, so users.db (rollback
+journal) is not held under a shared lock and writers carry on during a
+long export.
+
+Formats:
+    csv      header line + one line per row
+    ndjson   one JSON object per line
+    parquet  one row group per chunk (needs the optional pyarrow package)
+
+The generators own their connection and close it when the response is
+finished or the client disconnects.
+"""
+import csv
+import io
+import json
+import os
+import sqlite3
+
+import metrics
+
+CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+
+# table -> (columns, name of its complexity column, has a rating)
+TABLES = {
+    "history": (("id", "username", "term", "category", "explanation", "extra_content", "complexity_used",
+                 "related_terms", "timestamp"), "complexity_used", False),
+    "feedback": (("id", "username", "term", "complexity", "category", "explanation", "extra_content",
+                  "rating", "comment", "timestamp"), "complexity", True),
+}
+FORMATS = {
+    # format: (media type, file extension)
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def build_query(table, start=None, end=None, username=None, complexity=None, min_rating=None, max_rating=None):
+    """
+    SELECT for one chunk of a table with the given filters (start inclusive,
+    end exclusive). Its first parameter is the last id already read and its
+    last the chunk size; _chunks() fills those in.
+    """
+    columns, complexity_column, has_rating = TABLES[table]
+    where, params = ["id > ?"], []
+    if start:
+        where.append("timestamp >= ?")
+        params.append(start)
+    if end:
+        where.append("timestamp < ?")
+        params.append(end)
+    if username:
+        where.append("username = ?")
+        params.append(username)
+    if complexity:
+        where.append(f"{complexity_column} = ?")
+        params.append(complexity)
+    if has_rating and min_rating is not None:
+        where.append("rating >= ?")
+        params.append(min_rating)
+    if has_rating and max_rating is not None:
+        where.append("rating <= ?")
+        params.append(max_rating)
+    sql = f"SELECT {', '.join(columns)} FROM {table} WHERE " + " AND ".join(where)
+    return sql + " ORDER BY id LIMIT ?", params
+
+
+def _chunks(db_path, sql, params, chunk_size):
+    # The response generator is resumed on different threadpool threads
+    conn = sqlite3.connect(db_path, check_same_thread=False, factory=metrics.TimedConnection)
+    try:
+        last_id = 0
+        while True:
+            # fetchall() finishes the statement, releasing the read lock before the chunk is yielded
+            rows = conn.execute(sql, [last_id, *params, chunk_size]).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]  # id is the first column of every table
+            yield rows
+            if len(rows) < chunk_size:
+                break
+    finally:
+        conn.close()
+
+
+def _csv_stream(columns, chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()  # header only: the export matched no rows
+
+
+def _ndjson_stream(columns, chunks):
+    for rows in chunks:
+        yield "".join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows).encode()
+
+
+class _Drain:
+    """Write-only file for ParquetWriter; what was written is handed out after each row group."""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def _parquet_stream(columns, chunks):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {"id": pa.int64(), "rating": pa.int64()}
+    schema = pa.schema([(name, types.get(name, pa.string())) for name in columns])
+    drain = _Drain()
+    writer = pq.ParquetWriter(drain, schema, compression="zstd")
+    try:
+        for rows in chunks:
+            writer.write_table(pa.Table.from_pylist([dict(zip(columns, row)) for row in rows], schema=schema))
+            yield drain.take()
+    finally:
+        writer.close()  # writes the footer
+    yield drain.take()
+
+
+def stream(db_path, table, fmt, filters, chunk_size=None):
+    """Byte chunks of the export; pass to StreamingResponse."""
+    columns = TABLES[table][0]
+    sql, params = build_query(table, **filters)
+    chunks = _chunks(db_path, sql, params, chunk_size or CHUNK_SIZE)
+    if fmt == "csv":
+        return _csv_stream(columns, chunks)
+    if fmt == "ndjson":
+        return _ndjson_stream(columns, chunks)
+    return _parquet_stream(columns, chunks)
@@ -0,0 +1,252 @@
+"""
+Offline glossary packs: pre-generated explanations served without the LLM.
+
+A pack is a (optionally gzip-compressed) JSON Lines file. The first line is a
+header, every following line is one entry:
+
+    {"format": "conceptclarity-glossary", "version": 1, "name": "classroom", "created": "...", "entries": 2}
+    {"term": "Gravity", "complexity": "Basic", "data": {...same JSON as /explain returns...}}
+
+At startup every pack in GLOSSARY_DIR is loaded into one in-memory index
+keyed by (normalized term, complexity). Entries are kept as compact JSON
+strings and only decoded when served. Packs are loaded in file name order,
+so a later pack overrides an earlier one for the same key.
+
+Build a pack from the search history, or from the shared explanation cache:
+
+    python glossary.py build --db users.db --out glossary_packs/classroom-v1.jsonl.gz --min-searches 2
+    python glossary.py build --from-cache explain_cache.db --out glossary_packs/popular.jsonl.gz --min-searches 5
+    python glossary.py info glossary_packs/classroom-v1.jsonl.gz
+"""
+import argparse
+import gzip
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from metrics import CACHE_LOOKUPS
+
+PACK_FORMAT = "conceptclarity-glossary"
+PACK_VERSION = 1
+PACK_SUFFIXES = (".jsonl", ".jsonl.gz")
+REQUIRED_FIELDS = ("term", "category", "explanation", "extra_content", "related_terms")
+
+
+def normalize_term(term):
+    """'  Newton's  2nd Law? ' -> "newton's 2nd law" (used as the lookup key)."""
+    term = re.sub(r"\s+", " ", term.strip().lower())
+    return term.rstrip("?!.,;: ")
+
+
+def _open(path, mode="rt"):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def read_pack(path):
+    """Returns (header, entries). Raises ValueError on an unknown format/version."""
+    with _open(path) as f:
+        header = json.loads(f.readline())
+        if header.get("format") != PACK_FORMAT:
+            raise ValueError(f"{path}: not a glossary pack")
+        if header.get("version") != PACK_VERSION:
+            raise ValueError(f"{path}: unsupported pack version {header.get('version')}")
+        entries = [json.loads(line) for line in f if line.strip()]
+    return header, entries
+
+
+def write_pack(path, name, entries):
+    """entries: iterable of (term, complexity, data dict). Returns the number written."""
+    entries = list(entries)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with _open(path, "wt") as f:
+        header = {"format": PACK_FORMAT, "version": PACK_VERSION, "name": name,
+                  "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "entries": len(entries)}
+        f.write(json.dumps(header) + "\n")
+        for term, complexity, data in entries:
+            f.write(json.dumps({"term": term, "complexity": complexity, "data": data},
+                               separators=(",", ":"), ensure_ascii=False) + "\n")
+    return len(entries)
+
+
+class GlossaryIndex:
+    def __init__(self):
+        self.entries = {}   # (normalized term, complexity) -> compact JSON string
+        self.packs = []
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load_dir(cls, directory):
+        index = cls()
+        if directory and os.path.isdir(directory):
+            for name in sorted(os.listdir(directory)):
+                if name.endswith(PACK_SUFFIXES):
+                    index.load_pack(os.path.join(directory, name))
+        return index
+
+    def load_pack(self, path):
+        try:
+            header, entries = read_pack(path)
+        except (OSError, ValueError) as e:
+            print(f"Warning: skipping glossary pack {path}: {e}")
+            return
+        loaded = skipped = 0
+        for entry in entries:
+            if not (isinstance(entry, dict) and isinstance(entry.get("term"), str)
+                    and isinstance(entry.get("complexity"), str) and isinstance(entry.get("data"), dict)):
+                skipped += 1
+                continue
+            key = (normalize_term(entry["term"]), entry["complexity"])
+            self.entries[key] = json.dumps(entry["data"], separators=(",", ":"), ensure_ascii=False)
+            loaded += 1
+        if skipped:
+            print(f"Warning: glossary pack {path}: skipped {skipped} entries without term / complexity / data")
+        self.packs.append({"path": path, "name": header.get("name"), "created": header.get("created"),
+                           "entries": loaded})
+        print(f"Loaded glossary pack '{header.get('name')}' ({loaded} entries)")
+
+    def lookup(self, term, complexity):
+        """Returns a fresh dict in the /explain schema, or None."""
+        raw = self.entries.get((normalize_term(term), complexity))
+        with self.lock:
+            if raw is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        CACHE_LOOKUPS.labels(tier="glossary", result="miss" if raw is None else "hit").inc()
+        return json.loads(raw) if raw is not None else None
+
+    def stats(self):
+        with self.lock:
+            return {"packs": self.packs, "entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+# --- Pack builders ---
+
+def entries_from_history(db_path, min_searches=1, complexity=None, exclude_keys=()):
+    """
+    Latest explanation for every (term, complexity) searched at least
+    `min_searches` times, leaving out `exclude_keys` (see flagged_keys).
+    """
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        query = '''
+            SELECT h.term, h.category, h.explanation, h.extra_content, h.related_terms, h.complexity_used
+            FROM history h
+            JOIN (
+                SELECT LOWER(TRIM(term)) AS norm, complexity_used, MAX(id) AS last_id, COUNT(*) AS searches
+                FROM history
+                GROUP BY norm, complexity_used
+                HAVING searches >= ?
+            ) latest ON latest.last_id = h.id
+        '''
+        params = [min_searches]
+        if complexity:
+            query += " WHERE h.complexity_used = ?"
+            params.append(complexity)
+        seen = set()
+        for row in conn.execute(query, params):
+            key = (normalize_term(row["term"]), row["complexity_used"])
+            if key in seen or f"{key[0]}|{key[1]}" in exclude_keys:
+                continue
+            seen.add(key)
+            try:
+                related = json.loads(row["related_terms"] or "[]")
+            except ValueError:
+                related = []
+            data = {"term": row["term"].strip(), "category": row["category"], "explanation": row["explanation"],
+                    "extra_content": row["extra_content"], "related_terms": related}
+            if all(data.get(field) is not None for field in REQUIRED_FIELDS):
+                yield data["term"], row["complexity_used"], data
+    finally:
+        conn.close()
+
+
+def flagged_keys(db_path):
+    """Cache keys that cache_quality (in users.db) flagged for low ratings; empty if it has no such table."""
+    if not os.path.exists(db_path):
+        return set()
+    conn = sqlite3.connect(db_path)
+    try:
+        return {key for (key,) in conn.execute("SELECT key FROM cache_quality WHERE status != 'ok'")}
+    except sqlite3.OperationalError:
+        return set()
+    finally:
+        conn.close()
+
+
+def entries_from_cache(cache_path, min_hits=0, complexity=None, exclude_keys=()):
+    """
+    Fresh entries of the shared explanation cache (see shared_cache.py) hit
+    at least `min_hits` times. Expired ones, including those expired for low
+    ratings, and `exclude_keys` (see flagged_keys) are left out: a pack
+    takes precedence over the cache, so a bad answer frozen into one would
+    never be regenerated.
+    """
+    conn = sqlite3.connect(cache_path)
+    try:
+        query = "SELECT key, term, complexity, value FROM cache_entries WHERE expires > ? AND hits >= ?"
+        params = [time.time(), min_hits]
+        if complexity:
+            query += " AND complexity = ?"
+            params.append(complexity)
+        for key, term, entry_complexity, value in conn.execute(query + " ORDER BY hits DESC", params):
+            if key in exclude_keys:
+                continue
+            try:
+                data = json.loads(value)
+            except ValueError:
+                continue
+            if all(data.get(field) is not None for field in REQUIRED_FIELDS):
+                yield term, entry_complexity, data
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and inspect offline glossary packs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="build a pack from the search history")
+    build.add_argument("--db", default="users.db",
+                       help="history database (default: users.db); its low-rated entries are skipped")
+    build.add_argument("--from-cache", metavar="CACHE_DB",
+                       help="build from the shared explanation cache instead (--min-searches = minimum hits)")
+    build.add_argument("--out", required=True, help="output file (.jsonl or .jsonl.gz)")
+    build.add_argument("--name", help="pack name (default: output file name)")
+    build.add_argument("--min-searches", type=int, default=1, help="only terms searched at least this often")
+    build.add_argument("--complexity", choices=["Basic", "Intermediate", "Advanced"])
+
+    info = sub.add_parser("info", help="show a pack's header and entry counts")
+    info.add_argument("pack")
+
+    args = parser.parse_args()
+    if args.command == "build":
+        name = args.name or os.path.basename(args.out).split(".")[0]
+        if args.from_cache:
+            entries = entries_from_cache(args.from_cache, args.min_searches, args.complexity,
+                                         exclude_keys=flagged_keys(args.db))
+        else:
+            entries = entries_from_history(args.db, args.min_searches, args.complexity,
+                                           exclude_keys=flagged_keys(args.db))
+        count = write_pack(args.out, name, entries)
+        print(f"Wrote {count} entries to {args.out}")
+    else:
+        header, entries = read_pack(args.pack)
+        print(json.dumps(header, indent=2))
+        per_complexity = {}
+        for entry in entries:
+            per_complexity[entry["complexity"]] = per_complexity.get(entry["complexity"], 0) + 1
+        print(json.dumps(per_complexity, indent=2))
+
+
+if __name__ == "__main__":
+    main()
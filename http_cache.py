@@ -0,0 +1,186 @@
+"""
+Response compression and conditional GETs.
+
+CompressionMiddleware (pure ASGI) compresses text / JSON responses with
+brotli (if the optional brotli package is installed and the client accepts
+it) or gzip. Complete bodies are compressed only from COMPRESS_MIN_BYTES
+up; streamed bodies (exports) are compressed chunk by chunk with a sync
+flush, so they still stream.
+
+conditional(connect, *names) is a route dependency that gives the response
+a strong ETag computed from the data versions the endpoint depends on (see
+data_versions.py) plus the request path and query. A request whose
+If-None-Match still matches gets 304 Not Modified before the endpoint
+runs. Compressed responses carry the ETag with a "-gzip" / "-br" suffix
+(a different representation needs a different strong ETag); the suffix is
+ignored when comparing.
+"""
+import hashlib
+import os
+import zlib
+
+from fastapi import HTTPException, Request, Response
+from starlette.datastructures import Headers, MutableHeaders
+
+import data_versions
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+MIN_SIZE = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))
+COMPRESSIBLE = ("text/", "application/json", "application/x-ndjson")
+ETAG_SUFFIXES = {"gzip": "-gzip", "br": "-br"}
+
+
+# --- Compression ---
+
+def _accepted(accept_encoding):
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def choose_encoding(accept_encoding):
+    accepted = _accepted(accept_encoding)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+class _Gzip:
+    def __init__(self):
+        self.z = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits 31: gzip container
+
+    def chunk(self, data):
+        return self.z.compress(data) + self.z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data=b""):
+        return self.z.compress(data) + self.z.flush()
+
+
+class _Brotli:
+    def __init__(self):
+        self.c = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def chunk(self, data):
+        return self.c.process(data) + self.c.flush()
+
+    def finish(self, data=b""):
+        return self.c.process(data) + self.c.finish()
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size=MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            return await self.app(scope, receive, send)
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start = message  # held back until the first body chunk shows the size
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                return await send(message)
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=list(start["headers"]))
+                eligible = (start["status"] not in (204, 304) and "content-encoding" not in headers
+                            and headers.get("content-type", "").startswith(COMPRESSIBLE))
+                if eligible:
+                    headers.add_vary_header("Accept-Encoding")
+                if not eligible or (not more and len(body) < self.minimum_size):
+                    passthrough = True
+                    start["headers"] = headers.raw
+                    await send(start)
+                    return await send(message)
+
+                compressor = _Brotli() if encoding == "br" else _Gzip()
+                headers["Content-Encoding"] = encoding
+                etag = headers.get("etag")
+                if etag and etag.endswith('"'):
+                    headers["ETag"] = etag[:-1] + ETAG_SUFFIXES[encoding] + '"'
+                if "content-length" in headers:
+                    del headers["content-length"]
+                if more:
+                    body = compressor.chunk(body)
+                else:
+                    body = compressor.finish(body)
+                    headers["Content-Length"] = str(len(body))
+                start["headers"] = headers.raw
+                await send(start)
+                return await send({"type": "http.response.body", "body": body, "more_body": more})
+
+            data = compressor.chunk(body) if more else compressor.finish(body)
+            await send({"type": "http.response.body", "body": data, "more_body": more})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+# --- Conditional requests ---
+
+def _strip(tag):
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    tag = tag.strip('"')
+    for suffix in ETAG_SUFFIXES.values():
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)]
+    return tag
+
+
+def make_etag(request, versions):
+    query = "&".join(sorted(request.url.query.split("&"))) if request.url.query else ""
+    raw = f"{request.url.path}?{query}|{versions}"
+    return '"' + hashlib.sha1(raw.encode()).hexdigest()[:24] + '"'
+
+
+def conditional(connect, *names):
+    """
+    Route dependency. `names` are data version names and may use path
+    parameters, e.g. "history:{username}". `connect` returns a DB connection.
+    """
+    def check(request: Request, response: Response):
+        conn = connect()
+        try:
+            versions = data_versions.read(conn.cursor(), [name.format(**request.path_params) for name in names])
+        finally:
+            conn.close()
+        etag = make_etag(request, versions)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            current = _strip(etag)
+            if if_none_match.strip() == "*" or any(_strip(tag) == current for tag in if_none_match.split(",")):
+                raise HTTPException(status_code=304, headers=headers)
+        response.headers.update(headers)
+
+    return check
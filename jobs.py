@@ -0,0 +1,419 @@
+"""
+Persistent background jobs for long-running LLM work.
+
+Submitting a job stores it in the `jobs` table and returns its id at once.
+Every backend process runs a small worker pool (JOB_WORKERS threads). The
+workers claim jobs in priority order, interactive before batch before
+prefetch, oldest first within a priority. The claim is a single
+UPDATE ... RETURNING inside BEGIN IMMEDIATE, so a job is never picked up
+by two workers, even across uvicorn worker processes.
+
+A claimed job holds a lease (JOB_LEASE seconds), renewed by a heartbeat
+thread every third of a lease while the job runs, so a long job (retries,
+hedging, model fallback) is never claimed by a second worker. If its
+process dies, the renewals stop and the job is claimed again once the
+lease expires, so jobs survive restarts without a separate recovery step.
+A job still running after JOB_MAX_RUNTIME seconds is taken to be stuck: its
+lease is no longer renewed, so it runs again elsewhere. A job that keeps
+failing that way is marked failed after MAX_ATTEMPTS. Finished jobs are deleted after
+JOB_RETENTION seconds.
+
+Submissions made on a user's behalf are capped: a user may have at most
+JOB_MAX_PENDING_PER_USER jobs queued or running at once, checked in the
+same transaction as the insert, so repeated batches cannot queue unbounded
+LLM work.
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+import metrics
+
+PRIORITIES = {"interactive": 0, "batch": 10, "prefetch": 20}
+TERMINAL = ("done", "failed")
+MAX_ATTEMPTS = 3
+CLEANUP_EVERY = 600  # seconds between deleting old finished jobs
+FINISH_ATTEMPTS = 5  # tries to record a job's outcome while the database is locked
+FINISH_BACKOFF_BASE = 0.5
+FINISH_BACKOFF_MAX = 4.0
+
+
+class JobError(Exception):
+    """Raised by a handler to fail a job with an HTTP-style status code."""
+
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class QueueFullError(Exception):
+    """Raised when a submission would take a user over their pending-job cap."""
+
+    def __init__(self, pending, limit):
+        super().__init__(f"{pending} jobs already pending (limit {limit})")
+        self.pending = pending
+        self.limit = limit
+
+
+def new_id():
+    return uuid.uuid4().hex
+
+
+def create_table(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT,
+            priority INTEGER,
+            status TEXT,            -- queued / running / done / failed
+            payload TEXT,
+            result TEXT,
+            error TEXT,
+            error_status INTEGER,
+            username TEXT,
+            batch_id TEXT,
+            attempts INTEGER DEFAULT 0,
+            worker TEXT,
+            lease_expires REAL,
+            created REAL,
+            started REAL,
+            finished REAL
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(status, priority, created)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs(batch_id)")
+
+
+def _row_to_job(row, position=None):
+    job = {
+        "id": row["id"], "kind": row["kind"], "status": row["status"],
+        "priority": next((name for name, value in PRIORITIES.items() if value == row["priority"]), row["priority"]),
+        "batch_id": row["batch_id"], "attempts": row["attempts"],
+        "created": row["created"], "started": row["started"], "finished": row["finished"],
+        "result": json.loads(row["result"]) if row["result"] else None,
+        "error": row["error"], "error_status": row["error_status"],
+    }
+    if position is not None:
+        job["queue_position"] = position
+    return job
+
+
+class JobQueue:
+    def __init__(self, db_path, handlers, workers=2, lease=300.0, retention=86400.0, poll_interval=1.0,
+                 max_pending_per_user=200, max_runtime=3600.0):
+        self.db_path = db_path
+        self.handlers = handlers   # kind -> callable(payload dict) -> result dict
+        self.workers = workers
+        self.lease = lease
+        self.max_runtime = max_runtime
+        self.retention = retention
+        self.poll_interval = poll_interval
+        self.max_pending_per_user = max_pending_per_user
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.threads = []
+        self.counters = {"submitted": 0, "rejected": 0, "done": 0, "failed": 0, "retried": 0, "finish_errors": 0,
+                         "lease_renewals": 0}
+        self.busy = 0
+        self.running = {}   # job id -> time.monotonic() it started, for the lease heartbeat
+        self.lock = threading.Lock()
+        self.last_cleanup = 0.0
+        self.depth_snapshot = []  # queue_depth() as of the last refresh_gauges(); read by collect_metrics
+
+    @classmethod
+    def from_env(cls, db_path, handlers):
+        return cls(db_path, handlers,
+                   workers=int(os.getenv("JOB_WORKERS", "2")),
+                   lease=float(os.getenv("JOB_LEASE", "300")),
+                   retention=float(os.getenv("JOB_RETENTION", "86400")),
+                   max_pending_per_user=int(os.getenv("JOB_MAX_PENDING_PER_USER", "200")),
+                   max_runtime=float(os.getenv("JOB_MAX_RUNTIME", "3600")))
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10, factory=metrics.TimedConnection)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    # --- Submitting / reading ---
+
+    def submit(self, kind, payload, priority="interactive", username=None, batch_id=None, capped=False):
+        return self.submit_many(kind, [payload], priority, username, batch_id, capped)[0]
+
+    def submit_many(self, kind, payloads, priority="batch", username=None, batch_id=None, capped=False):
+        """
+        Queues one job per payload in one transaction. Returns the job ids.
+        With capped=True (requests made by users) raises QueueFullError if
+        the user would have more than max_pending_per_user jobs pending.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"unknown job kind: {kind}")
+        now = time.time()
+        ids = [new_id() for _ in payloads]
+        conn = self._connect()
+        conn.isolation_level = None
+        try:
+            # IMMEDIATE: two submissions from the same user cannot both pass the cap
+            conn.execute("BEGIN IMMEDIATE")
+            if capped:
+                pending = conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running') "
+                                       "AND username = ?", (username,)).fetchone()[0]
+                if pending + len(ids) > self.max_pending_per_user:
+                    conn.execute("ROLLBACK")
+                    with self.lock:
+                        self.counters["rejected"] += len(ids)
+                    raise QueueFullError(pending, self.max_pending_per_user)
+            conn.executemany('''
+                INSERT INTO jobs (id, kind, priority, status, payload, username, batch_id, created)
+                VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)
+            ''', [(job_id, kind, PRIORITIES[priority], json.dumps(payload), username, batch_id, now)
+                  for job_id, payload in zip(ids, payloads)])
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        with self.lock:
+            self.counters["submitted"] += len(ids)
+        self.wakeup.set()
+        return ids
+
+    def get(self, job_id):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            position = None
+            if row["status"] == "queued":
+                # Jobs that will be claimed before this one
+                position = conn.execute('''
+                    SELECT COUNT(*) FROM jobs WHERE status = 'queued'
+                    AND (priority < ? OR (priority = ? AND created < ?))
+                ''', (row["priority"], row["priority"], row["created"])).fetchone()[0]
+            return _row_to_job(row, position)
+        finally:
+            conn.close()
+
+    def batch(self, batch_id):
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT * FROM jobs WHERE batch_id = ? ORDER BY created", (batch_id,)).fetchall()
+        finally:
+            conn.close()
+        jobs = [_row_to_job(row) for row in rows]
+        counts = {}
+        for job in jobs:
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {"batch_id": batch_id, "total": len(jobs), "counts": counts, "jobs": jobs}
+
+    # --- Workers ---
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, daemon=True, name=f"job-worker-{i}")
+            thread.start()
+            self.threads.append(thread)
+        threading.Thread(target=self._heartbeat, daemon=True, name="job-lease-heartbeat").start()
+
+    def stop(self, timeout=5.0):
+        """Stops claiming new jobs; running ones finish (or are reclaimed after their lease)."""
+        self.stopping.set()
+        self.wakeup.set()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def claim(self):
+        """Atomically marks the next runnable job as running by this worker. Returns the row or None."""
+        now = time.time()
+        conn = self._connect()
+        conn.isolation_level = None
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute('''
+                UPDATE jobs SET status = 'running', worker = ?, started = ?, lease_expires = ?,
+                                attempts = attempts + 1
+                WHERE id = (
+                    SELECT id FROM jobs
+                    WHERE status = 'queued' OR (status = 'running' AND lease_expires < ?)
+                    ORDER BY priority, created LIMIT 1
+                )
+                RETURNING *
+            ''', (self.worker_id, now, now + self.lease, now)).fetchone()
+            conn.execute("COMMIT")
+            return row
+        except sqlite3.OperationalError as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            print(f"Warning: job claim failed: {e}")
+            return None
+        finally:
+            conn.close()
+
+    def _finish(self, job_id, status, result=None, error=None, error_status=None):
+        """
+        Records the outcome, retrying with backoff while the database is
+        locked so a finished result isn't lost. Returns False if it still
+        could not be written; the job then runs again once its lease expires.
+        """
+        values = (status, json.dumps(result) if result is not None else None, error, error_status, time.time(),
+                  job_id, self.worker_id)
+        for attempt in range(FINISH_ATTEMPTS):
+            conn = self._connect()
+            try:
+                conn.execute('''
+                    UPDATE jobs SET status = ?, result = ?, error = ?, error_status = ?, finished = ?, lease_expires = NULL
+                    WHERE id = ? AND worker = ?
+                ''', values)
+                conn.commit()
+                break
+            except sqlite3.OperationalError as e:
+                print(f"Warning: recording job {job_id} as {status} failed (attempt {attempt + 1}): {e}")
+            finally:
+                conn.close()
+            if attempt + 1 < FINISH_ATTEMPTS:
+                time.sleep(min(FINISH_BACKOFF_MAX, FINISH_BACKOFF_BASE * 2 ** attempt))
+        else:
+            with self.lock:
+                self.counters["finish_errors"] += 1
+            return False
+        with self.lock:
+            self.counters[status] += 1
+        return True
+
+    def _run(self):
+        while not self.stopping.is_set():
+            try:
+                worked = self._run_next()
+            except Exception as e:
+                # Never let one bad round kill the worker thread; the job (if any) is retried after its lease
+                print(f"Warning: job worker error: {e}")
+                worked = False
+            if not worked:
+                # Woken early by a submit in this process; other processes' submits are seen on the next poll
+                self.wakeup.wait(self.poll_interval)
+                self.wakeup.clear()
+
+    def _run_next(self):
+        """Claims and runs one job. Returns False if there was nothing to run."""
+        self._cleanup()
+        row = self.claim()
+        if row is None:
+            return False
+        if row["attempts"] > MAX_ATTEMPTS:
+            self._finish(row["id"], "failed", error="Job abandoned after repeated worker crashes", error_status=500)
+            return True
+        if row["attempts"] > 1:
+            with self.lock:
+                self.counters["retried"] += 1
+
+        with self.lock:
+            self.busy += 1
+            self.running[row["id"]] = time.monotonic()
+        try:
+            try:
+                result = self.handlers[row["kind"]](json.loads(row["payload"]))
+            except JobError as e:
+                self._finish(row["id"], "failed", error=str(e.detail), error_status=e.status_code)
+            except Exception as e:
+                self._finish(row["id"], "failed", error=str(e), error_status=500)
+            else:
+                self._finish(row["id"], "done", result=result)
+        finally:
+            with self.lock:
+                self.busy -= 1
+                self.running.pop(row["id"], None)
+        return True
+
+    def _heartbeat(self):
+        # Keeps going after stop() until the jobs still running have finished
+        while not self.stopping.is_set() or self.running:
+            time.sleep(self.lease / 3)
+            self.renew_leases()
+
+    def renew_leases(self):
+        """Pushes the lease of every job this process is running (and not past max_runtime) a full lease ahead."""
+        now = time.monotonic()
+        with self.lock:
+            ids = [job_id for job_id, started in self.running.items() if now - started < self.max_runtime]
+        if not ids:
+            return
+        conn = self._connect()
+        try:
+            renewed = conn.execute(f'''
+                UPDATE jobs SET lease_expires = ?
+                WHERE status = 'running' AND worker = ? AND id IN ({",".join("?" * len(ids))})
+            ''', (time.time() + self.lease, self.worker_id, *ids)).rowcount
+            conn.commit()
+        except sqlite3.OperationalError as e:
+            # Next beat tries again; a third of a lease is left before anyone else may claim the job
+            print(f"Warning: job lease renewal failed: {e}")
+            return
+        finally:
+            conn.close()
+        with self.lock:
+            self.counters["lease_renewals"] += renewed
+
+    def _cleanup(self):
+        now = time.time()
+        with self.lock:
+            if now - self.last_cleanup < CLEANUP_EVERY:
+                return
+            self.last_cleanup = now
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished < ?",
+                         (now - self.retention,))
+            conn.commit()
+        except sqlite3.OperationalError:
+            pass  # busy; try again next round
+        finally:
+            conn.close()
+
+    # --- Stats ---
+
+    def queue_depth(self):
+        conn = self._connect()
+        try:
+            rows = conn.execute('''
+                SELECT priority, status, COUNT(*) FROM jobs WHERE status IN ('queued', 'running')
+                GROUP BY priority, status
+            ''').fetchall()
+        finally:
+            conn.close()
+        names = {value: name for name, value in PRIORITIES.items()}
+        return [{"priority": names.get(p, p), "status": s, "jobs": n} for p, s, n in rows]
+
+    def stats(self):
+        with self.lock:
+            local = {**self.counters, "busy_workers": self.busy, "workers": self.workers}
+        return {"worker_id": self.worker_id, "this_worker": local, "queue": self.queue_depth()}
+
+    def refresh_gauges(self):
+        """Re-reads the queue depth for collect_metrics; call off the event loop (it queries the database)."""
+        try:
+            depth = self.queue_depth()
+        except sqlite3.OperationalError as e:
+            print(f"Warning: job queue depth not refreshed: {e}")
+            return
+        with self.lock:
+            self.depth_snapshot = depth
+
+    def collect_metrics(self):
+        # No I/O: /metrics collects on the event loop, so the queue depth comes from refresh_gauges()
+        with self.lock:
+            counters = dict(self.counters)
+            busy = self.busy
+            depth = self.depth_snapshot
+        yield ("jobs_total", "counter", "Jobs by outcome (this process)",
+               [({"outcome": name}, value) for name, value in counters.items()])
+        yield ("jobs_busy_workers", "gauge", "Job workers currently running a job", [({}, busy)])
+        yield ("jobs_queue_depth", "gauge", "Queued / running jobs by priority (all processes)",
+               [({"priority": row["priority"], "status": row["status"]}, row["jobs"]) for row in depth])
@@ -0,0 +1,218 @@
+"""
+Token usage / latency ledger.
+
+One row per /explain answer: who asked, which model served it, prompt and
+completion tokens, upstream latency and where the answer came from
+(cache_status 'glossary' = offline pack, no tokens; 'miss' = upstream call).
+Revalidating an expired answer is the exception: its upstream call gets a
+'revalidate' row of its own (the tokens, not a request), and every request
+waiting on it one row without tokens, 'revalidated' if the fresh answer
+arrived in time or 'stale' if the expired one was served.
+
+Rows are queued in memory and written by a background thread in batches
+(one executemany + commit per batch), so the request path never waits on
+SQLite for bookkeeping. If the queue is full, entries are dropped and
+counted rather than blocking. Aggregates are therefore up to
+LEDGER_FLUSH_INTERVAL seconds behind.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import data_versions
+import metrics
+
+COLUMNS = ("timestamp", "username", "term", "complexity", "model", "cache_status", "outcome",
+           "prompt_tokens", "completion_tokens", "total_tokens", "latency_ms", "attempts", "fallback")
+
+
+def create_table(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS usage_ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME,
+            username TEXT,
+            term TEXT,
+            complexity TEXT,
+            model TEXT,
+            cache_status TEXT,      -- 'miss' (upstream call), 'revalidate' (background call, not a request),
+                                    -- 'revalidated' / 'stale' or the cache tier that answered
+            outcome TEXT,           -- 'ok' / 'invalid_term' / 'error' / 'unavailable'
+            prompt_tokens INTEGER DEFAULT 0,
+            completion_tokens INTEGER DEFAULT 0,
+            total_tokens INTEGER DEFAULT 0,
+            latency_ms REAL,
+            attempts INTEGER DEFAULT 0,
+            fallback INTEGER DEFAULT 0
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_usage_ledger_timestamp ON usage_ledger(timestamp)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_usage_ledger_user ON usage_ledger(username, timestamp)")
+
+
+class UsageLedger:
+    def __init__(self, db_path, batch_size=200, flush_interval=1.0, max_queue=10000):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.counters = {"recorded": 0, "written": 0, "dropped": 0, "batches": 0, "write_errors": 0}
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, daemon=True, name="usage-ledger")
+        self.thread.start()
+
+    @classmethod
+    def from_env(cls, db_path):
+        return cls(db_path,
+                   batch_size=int(os.getenv("LEDGER_BATCH_SIZE", "200")),
+                   flush_interval=float(os.getenv("LEDGER_FLUSH_INTERVAL", "1.0")))
+
+    def record(self, username, term, complexity, cache_status, outcome="ok", model=None, usage=None,
+               latency=None, attempts=0, fallback=False):
+        """Queue one entry. `usage` is the completion's usage object (or None); latency in seconds."""
+        prompt = getattr(usage, "prompt_tokens", 0) or 0
+        completion = getattr(usage, "completion_tokens", 0) or 0
+        total = getattr(usage, "total_tokens", None) or prompt + completion
+        row = (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), username, term, complexity, model, cache_status,
+               outcome, prompt, completion, total, round(latency * 1000, 2) if latency is not None else None,
+               attempts, int(bool(fallback)))
+        try:
+            self.queue.put_nowait(row)
+            with self.lock:
+                self.counters["recorded"] += 1
+        except queue.Full:
+            with self.lock:
+                self.counters["dropped"] += 1
+
+    def close(self, timeout=5.0):
+        """Writes what is queued and stops the writer thread (application shutdown)."""
+        self.flush(timeout)
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far is written (shutdown / admin reads that must be exact)."""
+        done = threading.Event()
+        try:
+            self.queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, factory=metrics.TimedConnection)
+        placeholders = ",".join("?" * len(COLUMNS))
+        sql = f"INSERT INTO usage_ledger ({', '.join(COLUMNS)}) VALUES ({placeholders})"
+        stopping = False
+        while not stopping:
+            batch, waiters = [], []
+            item = self.queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    stopping = True  # close(): write this batch, then exit
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break  # a flush() caller is waiting: write what we have now
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    conn.executemany(sql, batch)
+                    data_versions.bump(conn, "usage")  # invalidates the /admin/usage ETags
+                    conn.commit()
+                    with self.lock:
+                        self.counters["written"] += len(batch)
+                        self.counters["batches"] += 1
+                except sqlite3.Error as e:
+                    conn.rollback()
+                    with self.lock:
+                        self.counters["write_errors"] += 1
+                    print(f"Warning: usage ledger write failed ({len(batch)} rows): {e}")
+            for waiter in waiters:
+                waiter.set()
+        conn.close()
+
+    def stats(self):
+        with self.lock:
+            return {**self.counters, "queue_depth": self.queue.qsize()}
+
+    def collect_metrics(self):
+        stats = self.stats()
+        yield ("usage_ledger_entries_total", "counter", "Usage ledger entries by fate",
+               [({"state": state}, stats[state]) for state in ("recorded", "written", "dropped")])
+        yield ("usage_ledger_queue_depth", "gauge", "Usage ledger entries waiting to be written",
+               [({}, stats["queue_depth"])])
+
+
+# --- Aggregates for the admin endpoints ---
+
+_AGGREGATES = '''
+    SUM(CASE WHEN cache_status != 'revalidate' THEN 1 ELSE 0 END) AS requests,
+    SUM(CASE WHEN cache_status IN ('miss', 'revalidate') THEN 1 ELSE 0 END) AS upstream_calls,
+    SUM(CASE WHEN cache_status NOT IN ('miss', 'revalidate', 'revalidated') THEN 1 ELSE 0 END) AS cache_hits,
+    SUM(prompt_tokens) AS prompt_tokens,
+    SUM(completion_tokens) AS completion_tokens,
+    SUM(total_tokens) AS total_tokens,
+    ROUND(AVG(CASE WHEN cache_status IN ('miss', 'revalidate') THEN latency_ms END), 1) AS avg_upstream_latency_ms,
+    SUM(CASE WHEN cache_status != 'revalidate' AND outcome NOT IN ('ok', 'invalid_term') THEN 1 ELSE 0 END)
+        AS errors
+'''
+SORT_COLUMNS = ("total_tokens", "requests", "upstream_calls", "avg_upstream_latency_ms", "errors")
+
+
+def _where(start, end):
+    where, params = [], []
+    if start:
+        where.append("timestamp >= ?")
+        params.append(start)
+    if end:
+        where.append("timestamp < ?")
+        params.append(end)
+    return (" WHERE " + " AND ".join(where)) if where else "", params
+
+
+def _rows(c):
+    rows = [dict(row) for row in c.fetchall()]
+    for row in rows:
+        row["cache_hit_rate"] = round(row["cache_hits"] / row["requests"], 3) if row["requests"] else 0.0
+    return rows
+
+
+def usage_by_user(c, start=None, end=None, sort="total_tokens", limit=50):
+    where, params = _where(start, end)
+    c.execute(f'''
+        SELECT username, {_AGGREGATES} FROM usage_ledger{where}
+        GROUP BY username ORDER BY {sort} DESC LIMIT ?
+    ''', params + [limit])
+    return _rows(c)
+
+
+def usage_by_complexity(c, start=None, end=None):
+    where, params = _where(start, end)
+    c.execute(f'''
+        SELECT complexity, model, {_AGGREGATES} FROM usage_ledger{where}
+        GROUP BY complexity, model ORDER BY total_tokens DESC
+    ''', params)
+    return _rows(c)
+
+
+def usage_daily(c, start=None, end=None):
+    where, params = _where(start, end)
+    c.execute(f'''
+        SELECT DATE(timestamp) AS day, {_AGGREGATES} FROM usage_ledger{where}
+        GROUP BY day ORDER BY day
+    ''', params)
+    return _rows(c)
@@ -0,0 +1,317 @@
+"""
+On-demand request profiling.
+
+A request is profiled when it carries `X-Profile-Token: <PROFILE_TOKEN>` (only
+admins know the token) or is picked by PROFILE_SAMPLE_RATE (0.0 - 1.0). For
+those requests a background thread samples the stack of the thread running
+the endpoint every PROFILE_INTERVAL_MS via sys._current_frames(). That is
+wall-clock sampling: time blocked in sqlite3 or waiting on the Groq client
+shows up under the Python frame that made the call.
+
+Finished profiles go into a bounded ring (PROFILE_RING_SIZE) served by
+/admin/profiles; the response carries an X-Profile-Id header to find it.
+The collapsed stack output feeds straight into flamegraph.pl / speedscope.
+
+When no request is being profiled the sampler thread sleeps on an event and
+the per-request cost is one header scan (only if PROFILE_TOKEN is set) and
+one random() call (only if PROFILE_SAMPLE_RATE > 0).
+
+Sync endpoints run in a worker thread which is attached through
+ProfiledRoute. Async endpoints are sampled on the event loop thread, so
+other coroutines running at the same time can show up in their profile.
+"""
+import asyncio
+import functools
+import hmac
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+
+from fastapi.routing import APIRoute
+
+TOKEN_HEADER = b"x-profile-token"
+MAX_STACK_DEPTH = 64
+# Never profile the profiler's own endpoints or scrapes
+EXCLUDED_PREFIXES = ("/admin/profiles", "/metrics")
+
+_current_profile = ContextVar("current_profile", default=None)
+
+
+def _frame_label(code, cache={}):
+    label = cache.get(code)
+    if label is None:
+        label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        cache[code] = label
+    return label
+
+
+def _collapse(frame):
+    """Frame -> 'root;caller;...;leaf' (one entry per function)."""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class Profile:
+    def __init__(self, profile_id, method, path, reason):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.route = None
+        self.status = None
+        self.started_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.started = time.perf_counter()
+        self.wall_ms = None
+        self.stacks = {}   # collapsed stack -> samples
+        self.samples = 0
+
+    def add(self, stack):
+        if self.wall_ms is not None:
+            return  # late sample from the sampler's previous round
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+        self.samples += 1
+
+    def finish(self, route, status):
+        self.route = route
+        self.status = status
+        self.wall_ms = round((time.perf_counter() - self.started) * 1000, 2)
+
+    def summary(self, interval):
+        return {
+            "id": self.id, "method": self.method, "path": self.path, "route": self.route,
+            "status": self.status, "reason": self.reason, "started_at": self.started_at,
+            "wall_ms": self.wall_ms, "samples": self.samples, "sampled_ms": round(self.samples * interval * 1000, 2),
+        }
+
+    def top_functions(self, limit):
+        """Self (leaf) and total (anywhere on the stack) samples per function."""
+        self_counts, total_counts = {}, {}
+        for stack, count in dict(self.stacks).items():
+            frames = stack.split(";")
+            self_counts[frames[-1]] = self_counts.get(frames[-1], 0) + count
+            for name in set(frames):
+                total_counts[name] = total_counts.get(name, 0) + count
+        rows = [{"function": name, "self_samples": self_counts.get(name, 0), "total_samples": total,
+                 "self_pct": round(100 * self_counts.get(name, 0) / self.samples, 1) if self.samples else 0.0,
+                 "total_pct": round(100 * total / self.samples, 1) if self.samples else 0.0}
+                for name, total in total_counts.items()]
+        rows.sort(key=lambda r: (r["self_samples"], r["total_samples"]), reverse=True)
+        return rows[:limit]
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in
+                         sorted(dict(self.stacks).items(), key=lambda item: -item[1])) + "\n"
+
+
+class Sampler:
+    """One daemon thread that samples every attached thread while any profile is active."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.attached = {}   # thread id -> [Profile, ...]
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def attach(self, profile, thread_id):
+        with self.lock:
+            self.attached.setdefault(thread_id, []).append(profile)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True, name="request-profiler")
+                self.thread.start()
+        self.wakeup.set()
+
+    def detach(self, profile, thread_id):
+        with self.lock:
+            profiles = self.attached.get(thread_id, [])
+            if profile in profiles:
+                profiles.remove(profile)
+            if not profiles:
+                self.attached.pop(thread_id, None)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            self.wakeup.wait()
+            with self.lock:
+                targets = [(tid, list(profiles)) for tid, profiles in self.attached.items()]
+                if not targets:
+                    self.wakeup.clear()
+                    continue
+            frames = sys._current_frames()
+            for thread_id, profiles in targets:
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own_id:
+                    continue
+                stack = _collapse(frame)
+                for profile in profiles:
+                    profile.add(stack)
+            del frames
+            time.sleep(self.interval)
+
+
+class Profiler:
+    def __init__(self, token=None, sample_rate=0.0, ring_size=50, interval_ms=5.0):
+        self.ids = itertools.count(1)
+        self.captured = 0
+        self.lock = threading.Lock()
+        self.configure(token, sample_rate, ring_size, interval_ms)
+
+    @classmethod
+    def from_env(cls):
+        profiler = cls()
+        profiler.configure_from_env()
+        return profiler
+
+    def configure(self, token=None, sample_rate=0.0, ring_size=50, interval_ms=5.0):
+        self.token = token or None
+        self.sample_rate = sample_rate
+        self.interval = interval_ms / 1000
+        self.ring = deque(maxlen=ring_size)
+        self.sampler = Sampler(self.interval)
+
+    def configure_from_env(self):
+        self.configure(
+            token=os.getenv("PROFILE_TOKEN"),
+            sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+            ring_size=int(os.getenv("PROFILE_RING_SIZE", "50")),
+            interval_ms=float(os.getenv("PROFILE_INTERVAL_MS", "5")),
+        )
+
+    def reason_for(self, scope):
+        """'token' / 'sampled' if this request should be profiled, else None."""
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == TOKEN_HEADER:
+                    if hmac.compare_digest(value, self.token.encode()):
+                        return "token"
+                    break
+        if self.sample_rate and random.random() < self.sample_rate:
+            if not scope["path"].startswith(EXCLUDED_PREFIXES):
+                return "sampled"
+        return None
+
+    def start(self, scope, reason):
+        return Profile(next(self.ids), scope["method"], scope["path"], reason)
+
+    def store(self, profile):
+        with self.lock:
+            self.ring.append(profile)
+            self.captured += 1
+
+    def list(self):
+        with self.lock:
+            profiles = list(self.ring)
+        return [p.summary(self.interval) for p in reversed(profiles)]
+
+    def get(self, profile_id):
+        with self.lock:
+            for profile in self.ring:
+                if profile.id == profile_id:
+                    return profile
+        return None
+
+    def details(self, profile, top=30):
+        stacks = sorted(dict(profile.stacks).items(), key=lambda item: -item[1])[:top]
+        return {
+            **profile.summary(self.interval),
+            "interval_ms": self.interval * 1000,
+            "top_functions": profile.top_functions(top),
+            "top_stacks": [{"stack": stack, "samples": count} for stack, count in stacks],
+        }
+
+    def stats(self):
+        with self.lock:
+            return {"enabled_by_token": bool(self.token), "sample_rate": self.sample_rate,
+                    "interval_ms": self.interval * 1000, "ring_size": self.ring.maxlen,
+                    "stored": len(self.ring), "captured": self.captured}
+
+    def collect_metrics(self):
+        yield ("profiles_captured_total", "counter", "Requests profiled (token or sampling)",
+               [({}, self.captured)])
+
+
+# --- ASGI middleware ---
+
+class ProfilingMiddleware:
+    """Pure ASGI; a non-profiled request only pays for Profiler.reason_for()."""
+
+    def __init__(self, app, profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        reason = self.profiler.reason_for(scope)
+        if reason is None:
+            return await self.app(scope, receive, send)
+
+        profile = self.profiler.start(scope, reason)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", str(profile.id).encode())]
+            await send(message)
+
+        token = _current_profile.set(profile)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_profile.reset(token)
+            route = getattr(scope.get("route"), "path", None)
+            profile.finish(route, status["code"])
+            self.profiler.store(profile)
+
+
+# --- Route class: attaches the thread that actually runs the endpoint ---
+
+def _attach_thread(profiler, endpoint):
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def async_wrapper(*args, **kwargs):
+            profile = _current_profile.get()
+            if profile is None:
+                return await endpoint(*args, **kwargs)
+            thread_id = threading.get_ident()
+            profiler.sampler.attach(profile, thread_id)
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                profiler.sampler.detach(profile, thread_id)
+        return async_wrapper
+
+    @functools.wraps(endpoint)
+    def sync_wrapper(*args, **kwargs):
+        # Runs in the worker thread; the context variable is copied over by run_in_threadpool
+        profile = _current_profile.get()
+        if profile is None:
+            return endpoint(*args, **kwargs)
+        thread_id = threading.get_ident()
+        profiler.sampler.attach(profile, thread_id)
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            profiler.sampler.detach(profile, thread_id)
+    return sync_wrapper
+
+
+def route_class(profiler, base=APIRoute):
+    """APIRoute subclass for app.router.route_class that makes endpoints profileable."""
+
+    class ProfiledRoute(base):
+        def __init__(self, path, endpoint, **kwargs):
+            super().__init__(path, _attach_thread(profiler, endpoint), **kwargs)
+
+    return ProfiledRoute
@@ -0,0 +1,228 @@
+"""
+Related-terms graph.
+
+Every explanation comes with `related_terms`. Each saved explanation adds
+an undirected edge term <-> related term (weight = number of explanations
+that linked them) to related_edges, in the same transaction as the
+history row. related_labels keeps a display form per normalized term.
+rebuild_edges() recomputes both tables from history (backfill / repair).
+
+Each worker keeps the whole graph in memory as an adjacency dict
+(RelatedGraph), loaded in the background at startup, updated in place by
+the history it saves itself and reloaded every RELATED_REFRESH seconds to
+pick up other workers' writes. "What to learn next" and multi-hop
+neighbourhood queries are answered from it without scanning any table or
+calling the LLM.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+from glossary import normalize_term
+
+MAX_HOPS = 3
+MAX_FANOUT = 25        # strongest neighbours followed per node on multi-hop walks
+RECENT_TERMS = 20      # history items used to recommend from
+DECAY = 0.8            # weight of each older history item relative to the next newer one
+
+
+def create_tables(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS related_edges (
+            source TEXT,
+            target TEXT,
+            weight INTEGER DEFAULT 0,
+            PRIMARY KEY (source, target)
+        ) WITHOUT ROWID
+    ''')
+    c.execute("CREATE TABLE IF NOT EXISTS related_labels (term TEXT PRIMARY KEY, label TEXT)")
+
+
+def _edges(term, related_terms):
+    """(source, target) pairs in both directions, normalized, without self-loops or duplicates."""
+    source = normalize_term(term)
+    targets = {normalize_term(t) for t in related_terms or [] if isinstance(t, str) and t.strip()}
+    targets.discard(source)
+    return [(source, target) for target in targets] + [(target, source) for target in targets]
+
+
+def _labels(term, related_terms):
+    terms = [term] + [t for t in related_terms or [] if isinstance(t, str) and t.strip()]
+    return [(normalize_term(t), t.strip()) for t in terms]
+
+
+def record_explanation(c, term, related_terms):
+    """Adds one saved explanation's edges; call in the history write's transaction."""
+    c.executemany('''
+        INSERT INTO related_edges (source, target, weight) VALUES (?, ?, 1)
+        ON CONFLICT(source, target) DO UPDATE SET weight = weight + 1
+    ''', _edges(term, related_terms))
+    c.executemany("INSERT OR REPLACE INTO related_labels (term, label) VALUES (?, ?)", _labels(term, related_terms))
+
+
+def _parse_related(raw):
+    try:
+        value = json.loads(raw) if raw else []
+    except ValueError:
+        return []
+    return value if isinstance(value, list) else []
+
+
+def rebuild_edges(c):
+    """Recompute the graph from history (streams the table; memory grows with the graph, not history)."""
+    weights, labels = {}, {}
+    for term, raw in c.execute("SELECT term, related_terms FROM history ORDER BY id"):
+        related_terms = _parse_related(raw)
+        for edge in _edges(term, related_terms):
+            weights[edge] = weights.get(edge, 0) + 1
+        labels.update(_labels(term, related_terms))
+    c.execute("DELETE FROM related_edges")
+    c.execute("DELETE FROM related_labels")
+    c.executemany("INSERT INTO related_edges (source, target, weight) VALUES (?, ?, ?)",
+                  [(source, target, weight) for (source, target), weight in weights.items()])
+    c.executemany("INSERT INTO related_labels (term, label) VALUES (?, ?)", labels.items())
+
+
+class RelatedGraph:
+    def __init__(self, db_path, refresh_interval=60.0):
+        self.db_path = db_path
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self.adjacency = {}   # term -> {neighbour: weight}
+        self.labels = {}      # term -> display form
+        self.popular = []     # best connected terms, for users without history
+        self.edges = 0
+        self.loaded_at = 0.0
+        self.load_ms = None
+        self.refreshing = False
+
+    @classmethod
+    def from_env(cls, db_path):
+        return cls(db_path, refresh_interval=float(os.getenv("RELATED_REFRESH", "60")))
+
+    # --- Loading ---
+
+    def load(self):
+        started = time.perf_counter()
+        conn = sqlite3.connect(self.db_path, factory=metrics.TimedConnection)
+        try:
+            adjacency = {}
+            for source, target, weight in conn.execute("SELECT source, target, weight FROM related_edges"):
+                adjacency.setdefault(source, {})[target] = weight
+            labels = dict(conn.execute("SELECT term, label FROM related_labels"))
+        finally:
+            conn.close()
+        popular = sorted(adjacency, key=lambda t: -sum(adjacency[t].values()))[:50]
+        with self.lock:
+            self.adjacency, self.labels, self.popular = adjacency, labels, popular
+            self.edges = sum(len(n) for n in adjacency.values())
+            self.loaded_at = time.time()
+            self.load_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    def maybe_refresh(self):
+        """Reloads in a background thread once the graph is older than refresh_interval."""
+        with self.lock:
+            if self.refreshing or time.time() - self.loaded_at < self.refresh_interval:
+                return
+            self.refreshing = True
+
+        def refresh():
+            try:
+                self.load()
+            except Exception as e:
+                print(f"Warning: related graph reload failed: {e}")
+            finally:
+                with self.lock:
+                    self.refreshing = False
+
+        threading.Thread(target=refresh, daemon=True, name="related-refresh").start()
+
+    def apply(self, term, related_terms):
+        """Same update as record_explanation(), on the in-memory graph (after the commit)."""
+        with self.lock:
+            for source, target in _edges(term, related_terms):
+                neighbours = self.adjacency.setdefault(source, {})
+                if target not in neighbours:
+                    self.edges += 1
+                neighbours[target] = neighbours.get(target, 0) + 1
+            self.labels.update(_labels(term, related_terms))
+
+    # --- Queries ---
+
+    def _label(self, term):
+        return self.labels.get(term, term)
+
+    def _walk(self, starts, hops):
+        """
+        Spreads each start's score over its neighbours in proportion to edge
+        weight, hop by hop. Returns {term: (score, hops, {start: contribution})}.
+        """
+        found = {}
+        frontier = dict(starts)   # term -> score arriving at it
+        origins = {term: {term: score} for term, score in starts.items()}
+        visited = set(starts)
+        with self.lock:
+            for hop in range(1, hops + 1):
+                next_frontier, next_origins = {}, {}
+                for term, score in frontier.items():
+                    neighbours = self.adjacency.get(term)
+                    if not neighbours:
+                        continue
+                    total = sum(neighbours.values())
+                    strongest = sorted(neighbours.items(), key=lambda item: -item[1])[:MAX_FANOUT]
+                    for neighbour, weight in strongest:
+                        if neighbour in visited:
+                            continue
+                        share = weight / total
+                        next_frontier[neighbour] = next_frontier.get(neighbour, 0.0) + score * share
+                        contributions = next_origins.setdefault(neighbour, {})
+                        for origin, amount in origins[term].items():
+                            contributions[origin] = contributions.get(origin, 0.0) + amount * share
+                for term, score in next_frontier.items():
+                    found[term] = (score, hop, next_origins[term])
+                visited.update(next_frontier)
+                frontier, origins = next_frontier, next_origins
+        return found
+
+    def neighbors(self, term, hops=1, limit=10):
+        key = normalize_term(term)
+        found = self._walk({key: 1.0}, hops)
+        ranked = sorted(found.items(), key=lambda item: (item[1][1], -item[1][0]))[:limit]
+        return [{"term": self._label(t), "score": round(score, 4), "hops": hop}
+                for t, (score, hop, _) in ranked]
+
+    def recommend(self, recent_terms, limit=5, hops=2):
+        """
+        Terms to learn next after `recent_terms` (newest first): neighbours of
+        recent searches weighted towards the newest, excluding what was seen.
+        """
+        seen = {normalize_term(t) for t in recent_terms}
+        starts = {}
+        for i, term in enumerate(recent_terms[:RECENT_TERMS]):
+            key = normalize_term(term)
+            starts[key] = starts.get(key, 0.0) + DECAY ** i
+        found = {t: v for t, v in self._walk(starts, hops).items() if t not in seen}
+        if not found:
+            with self.lock:
+                popular = [t for t in self.popular if t not in seen][:limit]
+            return [{"term": self._label(t), "score": 0.0, "because": []} for t in popular]
+        ranked = sorted(found.items(), key=lambda item: -item[1][0])[:limit]
+        return [{"term": self._label(t), "score": round(score, 4),
+                 "because": [self._label(o) for o, _ in sorted(origins.items(), key=lambda i: -i[1])[:2]]}
+                for t, (score, _, origins) in ranked]
+
+    # --- Stats ---
+
+    def stats(self):
+        with self.lock:
+            return {"terms": len(self.adjacency), "edges": self.edges, "loaded_at": self.loaded_at,
+                    "load_ms": self.load_ms, "refresh_interval": self.refresh_interval}
+
+    def collect_metrics(self):
+        stats = self.stats()
+        yield ("related_graph_terms", "gauge", "Terms in this worker's related-terms graph", [({}, stats["terms"])])
+        yield ("related_graph_edges", "gauge", "Directed edges in this worker's related-terms graph",
+               [({}, stats["edges"])])
@@ -0,0 +1,121 @@
+"""
+Stale-while-revalidate for explanations.
+
+When the shared cache only has an expired answer for a term, /explain
+still asks the LLM, but in a background pool, and waits at most
+STALE_SERVE_BUDGET seconds for it. If the upstream answers in time the
+fresh answer is returned as usual; if not, the expired answer is returned
+right away (flagged "freshness": "stale") and the call keeps running,
+refreshing the shared cache when it completes.
+
+Revalidation is single-flight per key: requests for the same term while a
+call is running wait on that call instead of starting another. At most
+REVALIDATE_MAX_INFLIGHT calls run per worker; past that, expired answers
+are served without revalidating (the upstream is struggling anyway) and
+the next request after a slot frees up tries again.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from metrics import Counter, Histogram
+
+STALE_SERVES = Counter("explain_stale_served_total",
+                       "Expired explanations served instead of waiting for the upstream", ["reason"])
+REVALIDATIONS = Counter("explain_revalidations_total",
+                        "Upstream calls made to refresh an expired explanation, by result", ["result", "served"])
+REVALIDATION_LATENCY = Histogram("explain_revalidation_duration_seconds",
+                                 "Time to refresh an expired explanation, including after it was served stale")
+
+
+class Revalidator:
+    def __init__(self, budget=2.0, max_inflight=8):
+        self.budget = budget
+        self.max_inflight = max_inflight
+        self.pool = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="revalidate")
+        self.lock = threading.RLock()  # a call that is already done runs _done() inside fetch()'s lock
+        self.inflight = {}   # key -> (future, {"stale": served stale while it ran})
+        self.counters = {"fresh_in_budget": 0, "stale_budget": 0, "stale_shed": 0, "stale_upstream_error": 0,
+                         "revalidated": 0, "failed": 0, "joined": 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(budget=float(os.getenv("STALE_SERVE_BUDGET", "2.0")),
+                   max_inflight=int(os.getenv("REVALIDATE_MAX_INFLIGHT", "8")))
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def served_stale(self, reason):
+        """Records a stale serve ('budget', 'shed' or 'upstream_error')."""
+        self._count(f"stale_{reason}")
+        STALE_SERVES.labels(reason=reason).inc()
+
+    def fetch(self, key, call):
+        """
+        Runs call() (single-flight per key) and waits up to the budget.
+        Returns (value, True) if it finished in time, (None, False) if the
+        caller should serve its stale answer now. Errors raised by call()
+        within the budget are re-raised.
+        """
+        with self.lock:
+            entry = self.inflight.get(key)
+            if entry is not None:
+                self.counters["joined"] += 1
+            elif len(self.inflight) >= self.max_inflight:
+                entry = None
+            else:
+                entry = (self.pool.submit(self._timed, call), {"stale": False})
+                self.inflight[key] = entry
+                entry[0].add_done_callback(lambda future: self._done(key, future))
+        if entry is None:
+            self.served_stale("shed")
+            return None, False
+
+        future, state = entry
+        try:
+            value = future.result(timeout=self.budget)
+        except FutureTimeout:
+            state["stale"] = True
+            self.served_stale("budget")
+            return None, False
+        self._count("fresh_in_budget")
+        return value, True
+
+    def _timed(self, call):
+        started = time.monotonic()
+        try:
+            return call()
+        finally:
+            REVALIDATION_LATENCY.observe(time.monotonic() - started)
+
+    def _done(self, key, future):
+        with self.lock:
+            _, state = self.inflight.pop(key, (None, {"stale": False}))
+            ok = future.exception() is None
+            self.counters["revalidated" if ok else "failed"] += 1
+        REVALIDATIONS.labels(result="ok" if ok else "error", served="stale" if state["stale"] else "fresh").inc()
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            inflight = len(self.inflight)
+        refreshed = counters["revalidated"] + counters["failed"]
+        return {
+            "budget": self.budget,
+            "max_inflight": self.max_inflight,
+            "inflight": inflight,
+            **counters,
+            "success_rate": round(counters["revalidated"] / refreshed, 3) if refreshed else None,
+        }
+
+    def collect_metrics(self):
+        with self.lock:
+            inflight = len(self.inflight)
+        yield ("explain_revalidations_in_progress", "gauge",
+               "Upstream calls refreshing expired explanations on this worker", [({}, inflight)])
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
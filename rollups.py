@@ -0,0 +1,140 @@
+"""
+Hourly / daily analytics rollups.
+
+rollup_hourly and rollup_daily hold, per time bucket, the number of searches
+and the rating sum/count for four dimensions:
+
+    total       key = 'all'
+    complexity  key = 'Basic' / 'Intermediate' / 'Advanced'
+    category    key = e.g. 'Physics'
+    term        key = normalized term
+
+They are maintained incrementally in the same transaction as the history /
+feedback write, so time-series queries never scan the raw tables.
+rebuild_rollups() recomputes them from scratch (backfill / compaction).
+"""
+from datetime import datetime
+
+from glossary import normalize_term
+
+GRANULARITIES = {
+    # granularity: (table, bucket format for strftime / SQLite strftime)
+    "hour": ("rollup_hourly", "%Y-%m-%d %H:00"),
+    "day": ("rollup_daily", "%Y-%m-%d"),
+}
+DIMENSIONS = ("total", "complexity", "category", "term")
+
+
+def create_tables(c):
+    for table, _ in GRANULARITIES.values():
+        c.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                bucket TEXT,
+                dimension TEXT,
+                key TEXT,
+                searches INTEGER DEFAULT 0,
+                rating_sum INTEGER DEFAULT 0,
+                rating_count INTEGER DEFAULT 0,
+                PRIMARY KEY (dimension, key, bucket)
+            )
+        ''')
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_dim_bucket ON {table}(dimension, bucket)")
+
+
+def _keys(term, complexity, category):
+    return [
+        ("total", "all"),
+        ("complexity", complexity or "Unknown"),
+        ("category", category or "Unknown"),
+        ("term", normalize_term(term or "")),
+    ]
+
+
+def _parse(timestamp):
+    if isinstance(timestamp, datetime):
+        return timestamp
+    return datetime.strptime(timestamp[:19], "%Y-%m-%d %H:%M:%S")
+
+
+def _bump(c, timestamp, term, complexity, category, searches=0, rating_sum=0, rating_count=0):
+    when = _parse(timestamp)
+    for table, fmt in GRANULARITIES.values():
+        bucket = when.strftime(fmt)
+        for dimension, key in _keys(term, complexity, category):
+            c.execute(f'''
+                INSERT INTO {table} (bucket, dimension, key, searches, rating_sum, rating_count)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(dimension, key, bucket) DO UPDATE SET
+                    searches = searches + excluded.searches,
+                    rating_sum = rating_sum + excluded.rating_sum,
+                    rating_count = rating_count + excluded.rating_count
+            ''', (bucket, dimension, key, searches, rating_sum, rating_count))
+
+
+def record_search(c, timestamp, term, complexity, category):
+    _bump(c, timestamp, term, complexity, category, searches=1)
+
+
+def record_rating(c, timestamp, term, complexity, category, rating, previous_rating=None):
+    """New rating, or a changed rating when previous_rating is given."""
+    if previous_rating is None:
+        _bump(c, timestamp, term, complexity, category, rating_sum=rating, rating_count=1)
+    else:
+        _bump(c, timestamp, term, complexity, category, rating_sum=rating - previous_rating)
+
+
+def rebuild_rollups(c):
+    """Recompute every rollup from history and feedback (slow; run off-peak)."""
+    for table, _ in GRANULARITIES.values():
+        c.execute(f"DELETE FROM {table}")
+    for row in c.execute("SELECT timestamp, term, complexity_used, category FROM history").fetchall():
+        record_search(c, row[0], row[1], row[2], row[3])
+    for row in c.execute("SELECT timestamp, term, complexity, category, rating FROM feedback").fetchall():
+        if row[4] is not None:
+            record_rating(c, row[0], row[1], row[2], row[3], row[4])
+
+
+def query_timeseries(c, granularity, dimension, start=None, end=None, key=None, top=5):
+    """
+    Returns [{"key", "points": [{"bucket", "searches", "avg_rating"}]}] for the
+    `top` keys by searches in [start, end] (or just `key` if given).
+    """
+    table, _ = GRANULARITIES[granularity]
+    where = ["dimension = ?"]
+    params = [dimension]
+    if start:
+        where.append("bucket >= ?")
+        params.append(start)
+    if end:
+        where.append("bucket <= ?")
+        params.append(end)
+    if key:
+        where.append("key = ?")
+        params.append(key)
+    where_sql = " AND ".join(where)
+
+    if key:
+        keys = [key]
+    else:
+        c.execute(f'''
+            SELECT key FROM {table} WHERE {where_sql}
+            GROUP BY key ORDER BY SUM(searches) DESC LIMIT ?
+        ''', params + [top])
+        keys = [row[0] for row in c.fetchall()]
+    if not keys:
+        return []
+
+    placeholders = ",".join("?" * len(keys))
+    c.execute(f'''
+        SELECT key, bucket, searches, rating_sum, rating_count FROM {table}
+        WHERE {where_sql} AND key IN ({placeholders})
+        ORDER BY bucket
+    ''', params + keys)
+    series = {k: [] for k in keys}
+    for row in c.fetchall():
+        series[row[0]].append({
+            "bucket": row[1],
+            "searches": row[2],
+            "avg_rating": round(row[3] / row[4], 2) if row[4] else None,
+        })
+    return [{"key": k, "points": points} for k, points in series.items()]
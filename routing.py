@@ -0,0 +1,125 @@
+"""
+Complexity-aware model routing for /explain.
+
+A routing table is an ordered list of rules. Each rule may match on
+`complexity`, `category` and `cache_state` (omitted fields match anything)
+and says which model, max_tokens and temperature to use. The first matching
+rule wins, so put specific rules above general ones.
+
+The table can be replaced with a JSON file (same shape as DEFAULT_ROUTES)
+pointed to by MODEL_ROUTES_FILE.
+"""
+import json
+import os
+import threading
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+from upstream import LatencyWindow
+
+DEFAULT_ROUTES = [
+    {"name": "basic", "complexity": "Basic",
+     "model": "llama-3.1-8b-instant", "max_tokens": 512, "temperature": 0.7,
+     "fallback_model": "llama-3.3-70b-versatile"},
+    {"name": "intermediate", "complexity": "Intermediate",
+     "model": "llama-3.3-70b-versatile", "max_tokens": 1024, "temperature": 0.5},
+    {"name": "advanced", "complexity": "Advanced",
+     "model": "llama-3.3-70b-versatile", "max_tokens": 2048, "temperature": 0.3},
+    {"name": "default",
+     "model": "llama-3.3-70b-versatile", "max_tokens": 1024, "temperature": 0.5},
+]
+
+
+@dataclass
+class Route:
+    name: str
+    model: str
+    max_tokens: int
+    temperature: float
+    complexity: Optional[str] = None
+    category: Optional[str] = None
+    cache_state: Optional[str] = None   # e.g. "miss" or "stale"
+    fallback_model: Optional[str] = None
+
+    def matches(self, complexity, category, cache_state):
+        if self.complexity and self.complexity != complexity:
+            return False
+        if self.category and (category or "").lower() != self.category.lower():
+            return False
+        if self.cache_state and self.cache_state != cache_state:
+            return False
+        return True
+
+
+class RouteStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latency = LatencyWindow(size=500)
+        self.lock = threading.Lock()
+
+    def record(self, latency, prompt_tokens=0, completion_tokens=0, error=False):
+        with self.lock:
+            self.requests += 1
+            if error:
+                self.errors += 1
+                return
+            self.prompt_tokens += prompt_tokens or 0
+            self.completion_tokens += completion_tokens or 0
+        self.latency.add(latency)
+
+    def snapshot(self):
+        with self.lock:
+            ok = self.requests - self.errors
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "avg_completion_tokens": round(self.completion_tokens / ok, 1) if ok else 0,
+                "p50_latency": self.latency.percentile(50, min_samples=1),
+                "p95_latency": self.latency.percentile(95, min_samples=1),
+            }
+
+
+class RoutingTable:
+    def __init__(self, routes):
+        self.routes = [Route(**r) for r in routes]
+        self.stats = {r.name: RouteStats() for r in self.routes}
+
+    @classmethod
+    def from_env(cls):
+        path = os.getenv("MODEL_ROUTES_FILE")
+        if path:
+            with open(path) as f:
+                return cls(json.load(f))
+        return cls(DEFAULT_ROUTES)
+
+    def select(self, complexity, category=None, cache_state="miss"):
+        for route in self.routes:
+            if route.matches(complexity, category, cache_state):
+                return route
+        raise LookupError(f"No route matches complexity={complexity!r}; add a catch-all rule.")
+
+    def record(self, route, latency, usage=None, error=False):
+        self.stats[route.name].record(
+            latency,
+            getattr(usage, "prompt_tokens", 0),
+            getattr(usage, "completion_tokens", 0),
+            error=error,
+        )
+
+    def collect_metrics(self):
+        snapshots = {name: stats.snapshot() for name, stats in self.stats.items()}
+        yield ("llm_route_requests_total", "counter", "Requests per model route",
+               [({"route": name}, s["requests"]) for name, s in snapshots.items()])
+        yield ("llm_route_errors_total", "counter", "Failed requests per model route",
+               [({"route": name}, s["errors"]) for name, s in snapshots.items()])
+        yield ("llm_route_tokens_total", "counter", "Tokens used per model route",
+               [({"route": name, "kind": kind}, s[f"{kind}_tokens"])
+                for name, s in snapshots.items() for kind in ("prompt", "completion")])
+
+    def describe(self):
+        return [{**asdict(r), "stats": self.stats[r.name].snapshot()} for r in self.routes]
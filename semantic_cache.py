@@ -0,0 +1,305 @@
+"""
+Semantic lookup over terms that were already explained.
+
+Exact caching misses paraphrases ("process of photosynthesis" vs
+"photosynthesis", "Newton's 2nd law" vs "Newton's second law of motion").
+This tier sits after the glossary and the shared cache: when both miss, the
+term is compared with every term in the shared cache and, if the best match
+for the same complexity scores at least SEMANTIC_THRESHOLD (cosine), its
+stored explanation is served instead of calling the LLM.
+
+Vectors are CPU-only and need no model: a term is canonicalized (filler
+words like "what is" / "process of" dropped, "2nd" -> "second"), split
+into words and character 3-5 grams, hashed into SEMANTIC_DIM buckets
+(signed, so collisions cancel out instead of piling up) and weighted by
+TF-IDF. All vectors live in one L2-normalized float32 NumPy matrix, so a
+lookup is a single matrix-vector product (a batch of lookups is one matrix
+product) followed by a top-k.
+
+Numbers, single letters, roman numerals and ordinals carry almost no n-gram
+weight, yet they are what tells "hepatitis B" from "hepatitis C" or "type 1
+diabetes" from "type 2 diabetes". A match is only served if those marker
+words are exactly the same on both sides.
+
+Each worker builds its own index from the shared cache in the background
+at startup, adds the answers it generates itself, and rebuilds every
+SEMANTIC_REFRESH seconds to pick up other workers' answers (and refresh
+the IDF weights). Only the SEMANTIC_MAX_ENTRIES most-hit entries are kept.
+"""
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from collections import deque
+
+import numpy as np
+
+from glossary import normalize_term
+from metrics import CACHE_LOOKUPS, Histogram
+
+SEMANTIC_LOOKUP_LATENCY = Histogram("semantic_lookup_duration_seconds", "Semantic cache lookup latency",
+                                    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05))
+
+NGRAM_SIZES = (3, 4, 5)
+WORD_WEIGHT = 2.0   # a whole shared word counts more than one of its n-grams
+FILLER_WORDS = {
+    "a", "an", "the", "of", "in", "on", "for", "to", "and", "is", "are", "what", "whats", "how", "does", "do",
+    "explain", "define", "definition", "meaning", "concept", "process", "principle", "idea", "basics",
+}
+ORDINALS = {"1st": "first", "2nd": "second", "3rd": "third", "4th": "fourth", "5th": "fifth", "0th": "zeroth"}
+ORDINAL_WORDS = set(ORDINALS.values()) | {"sixth", "seventh", "eighth", "ninth", "tenth"}
+ROMAN_NUMERAL = re.compile(r"x{0,3}(ix|iv|v?i{0,3})")  # i .. xxxix; longer ones would match real words ("mix")
+
+
+def _stem(word):
+    # Plurals only ("holes" -> "hole", "newtons" -> "newton"); applied to both sides, so consistent is enough
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def canonical_words(term):
+    """"What is the process of Photosynthesis?" -> ['photosynthesis']"""
+    text = normalize_term(term).replace("'s", "")
+    words = [_stem(ORDINALS.get(word, word)) for word in re.findall(r"[a-z0-9]+", text)]
+    kept = [word for word in words if word not in FILLER_WORDS]
+    return kept or words  # a term made only of filler words is still a term
+
+
+def distinguishing_words(term):
+    """Words a match must share exactly: "Hepatitis C" -> {'c'}, "Type 2 Diabetes" -> {'2'}."""
+    return frozenset(word for word in canonical_words(term)
+                     if len(word) == 1 or any(ch.isdigit() for ch in word) or word in ORDINAL_WORDS
+                     or ROMAN_NUMERAL.fullmatch(word))
+
+
+def features(term):
+    """Word and character n-gram features of a term, with counts."""
+    counts = {}
+    for word in canonical_words(term):
+        counts["w:" + word] = counts.get("w:" + word, 0) + WORD_WEIGHT
+        padded = f" {word} "
+        for n in NGRAM_SIZES:
+            for i in range(len(padded) - n + 1):
+                gram = padded[i:i + n]
+                counts[gram] = counts.get(gram, 0) + 1
+    return counts
+
+
+def _hashed(term, dim):
+    """(bucket indices, signed sublinear TF values) for one term."""
+    indices, values = [], []
+    for feature, count in features(term).items():
+        h = zlib.crc32(feature.encode())
+        indices.append(h % dim)
+        values.append((1.0 + math.log(count)) * (1.0 if h & 0x80000000 else -1.0))
+    return indices, values
+
+
+class _Partition:
+    """Vectors of one complexity; lookups only ever compare within a complexity."""
+
+    def __init__(self, vectors, terms):
+        self.matrix = vectors   # rows [0, size) are in use, the rest is room to grow
+        self.size = len(terms)
+        self.terms = terms
+
+    def append(self, vector, term, limit):
+        if self.size == len(self.matrix):  # grow geometrically, like a list
+            capacity = min(limit, max(64, 2 * len(self.matrix)))
+            grown = np.zeros((capacity, self.matrix.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.matrix[:self.size]
+            self.matrix = grown  # searches still holding the old array keep working on it
+        self.matrix[self.size] = vector
+        self.terms.append(term)
+        self.size += 1
+
+
+class SemanticIndex:
+    def __init__(self, dim=512, threshold=0.8, max_entries=20000, refresh_interval=300.0):
+        self.dim = dim
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self.partitions = {}     # complexity -> _Partition
+        self.size = 0
+        self.keys = set()        # (canonical term, complexity) already indexed
+        self.idf = np.ones(dim, dtype=np.float32)
+        self.built_at = 0.0
+        self.build_ms = None
+        self.refreshing = False
+        self.counters = {"lookups": 0, "hits": 0, "misses": 0, "added": 0, "rebuilds": 0, "rejected": 0}
+        self.latencies = deque(maxlen=1000)  # seconds, for the p50 / p99 in stats()
+
+    @classmethod
+    def from_env(cls):
+        return cls(dim=int(os.getenv("SEMANTIC_DIM", "512")),
+                   threshold=float(os.getenv("SEMANTIC_THRESHOLD", "0.8")),
+                   max_entries=int(os.getenv("SEMANTIC_MAX_ENTRIES", "20000")),
+                   refresh_interval=float(os.getenv("SEMANTIC_REFRESH", "300")))
+
+    # --- Vectors ---
+
+    def _tf_matrix(self, terms):
+        rows, cols, values = [], [], []
+        for row, term in enumerate(terms):
+            indices, weights = _hashed(term, self.dim)
+            rows.extend([row] * len(indices))
+            cols.extend(indices)
+            values.extend(weights)
+        tf = np.zeros((len(terms), self.dim), dtype=np.float32)
+        np.add.at(tf, (np.array(rows, dtype=np.intp), np.array(cols, dtype=np.intp)),
+                  np.array(values, dtype=np.float32))
+        return tf
+
+    @staticmethod
+    def _normalized(vectors):
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    # --- Building ---
+
+    def rebuild(self, entries):
+        """entries: (term, complexity) pairs, most valuable first. Replaces the index."""
+        started = time.perf_counter()
+        seen, terms, complexities = set(), [], []
+        for term, complexity in entries:
+            key = (" ".join(canonical_words(term)), complexity)
+            if key in seen:
+                continue
+            seen.add(key)
+            terms.append(term)
+            complexities.append(complexity)
+            if len(terms) >= self.max_entries:
+                break
+
+        tf = self._tf_matrix(terms)
+        df = np.count_nonzero(tf, axis=0)
+        idf = (np.log((1 + len(terms)) / (1 + df)) + 1).astype(np.float32)
+        vectors = self._normalized(tf * idf)
+        labels = np.array(complexities, dtype=object)
+        partitions = {}
+        for complexity in set(complexities):
+            rows = np.flatnonzero(labels == complexity)
+            partitions[complexity] = _Partition(vectors[rows], [terms[i] for i in rows])
+        with self.lock:
+            self.partitions, self.size, self.keys, self.idf = partitions, len(terms), seen, idf
+            self.built_at = time.time()
+            self.build_ms = round((time.perf_counter() - started) * 1000, 1)
+            self.counters["rebuilds"] += 1
+
+    def add(self, term, complexity):
+        """Indexes one newly generated answer (until the next rebuild re-weights everything)."""
+        key = (" ".join(canonical_words(term)), complexity)
+        with self.lock:
+            if key in self.keys or self.size >= self.max_entries:
+                return
+            vector = self._normalized(self._tf_matrix([term]) * self.idf)[0]
+            partition = self.partitions.get(complexity)
+            if partition is None:
+                partition = self.partitions[complexity] = _Partition(np.zeros((0, self.dim), np.float32), [])
+            partition.append(vector, term, self.max_entries)
+            self.keys.add(key)
+            self.size += 1
+            self.counters["added"] += 1
+
+    def maybe_refresh(self, load_entries):
+        """Rebuilds in a background thread once the index is older than refresh_interval."""
+        with self.lock:
+            if self.refreshing or time.time() - self.built_at < self.refresh_interval:
+                return
+            self.refreshing = True
+
+        def refresh():
+            try:
+                self.rebuild(load_entries())
+            except Exception as e:
+                print(f"Warning: semantic index refresh failed: {e}")
+            finally:
+                with self.lock:
+                    self.refreshing = False
+
+        threading.Thread(target=refresh, daemon=True, name="semantic-refresh").start()
+
+    # --- Searching ---
+
+    def search(self, terms, complexity, k=1):
+        """Top-k (term, cosine) per query term among entries of the same complexity; one matrix product."""
+        with self.lock:
+            partition = self.partitions.get(complexity)
+            if partition is None or partition.size == 0:
+                return [[] for _ in terms]
+            matrix, size, indexed, idf = partition.matrix, partition.size, partition.terms, self.idf
+        scores = self._normalized(self._tf_matrix(terms) * idf) @ matrix[:size].T
+        k = min(k, size)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in enumerate(top):
+            ranked = sorted(candidates, key=lambda i: -scores[row, i])
+            results.append([(indexed[i], float(scores[row, i])) for i in ranked if scores[row, i] > 0])
+        return results
+
+    def lookup(self, term, complexity, fetch):
+        """
+        Best match for the same complexity that clears the threshold, has
+        the same distinguishing words (numbers, single letters, ...) and for
+        which fetch(matched term) still returns its stored value. Returns
+        (matched term, score, value) or None.
+        """
+        started = time.perf_counter()
+        matches = self.search([term], complexity, k=5)[0]
+        elapsed = time.perf_counter() - started
+        SEMANTIC_LOOKUP_LATENCY.observe(elapsed)
+        markers = distinguishing_words(term)
+        candidates = [(matched, score) for matched, score in matches if score >= self.threshold]
+        match = next(((matched, score) for matched, score in candidates
+                      if distinguishing_words(matched) == markers), None)
+        value = fetch(match[0]) if match else None  # None if it expired since the index was built
+        with self.lock:
+            self.counters["lookups"] += 1
+            self.counters["hits" if value is not None else "misses"] += 1
+            if candidates and match is None:
+                self.counters["rejected"] += 1
+            self.latencies.append(elapsed)
+        CACHE_LOOKUPS.labels(tier="semantic", result="miss" if value is None else "hit").inc()
+        return (match[0], match[1], value) if value is not None else None
+
+    # --- Stats ---
+
+    def memory_bytes(self):
+        with self.lock:
+            return int(sum(p.matrix.nbytes for p in self.partitions.values()) + self.idf.nbytes)
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            latencies = sorted(self.latencies)
+            size, built_at, build_ms = self.size, self.built_at, self.build_ms
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 3) if latencies else None
+
+        return {
+            "entries": size,
+            "max_entries": self.max_entries,
+            "dim": self.dim,
+            "threshold": self.threshold,
+            "memory_bytes": self.memory_bytes(),
+            "built_at": built_at,
+            "build_ms": build_ms,
+            **counters,
+            # Lookups only happen after the exact tiers missed, so this is the hit rate added on top of them
+            "extra_hit_rate": round(counters["hits"] / counters["lookups"], 3) if counters["lookups"] else 0.0,
+            "lookup_ms_p50": percentile(0.5),
+            "lookup_ms_p99": percentile(0.99),
+        }
+
+    def collect_metrics(self):
+        stats = self.stats()
+        yield ("semantic_index_entries", "gauge", "Terms in this worker's semantic index", [({}, stats["entries"])])
+        yield ("semantic_index_memory_bytes", "gauge", "Memory held by the semantic index vectors",
+               [({}, stats["memory_bytes"])])
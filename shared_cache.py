@@ -0,0 +1,279 @@
+"""
+Explanation cache shared by every uvicorn worker on the host.
+
+One SQLite file (SHARED_CACHE_PATH, default explain_cache.db) in WAL mode:
+readers never block the writer and each write is a single atomic
+INSERT ... ON CONFLICT upsert, so any worker can read and write without a
+coordinator or an external service.
+
+Entries are keyed by (normalized term, complexity) and are
+    fresh  for SHARED_CACHE_TTL seconds after they were written,
+    stale  for SHARED_CACHE_STALE_TTL seconds after that (still useful as a
+           fallback when the upstream is down, or to revalidate),
+    gone   afterwards.
+Eviction is cross-process: whichever worker notices the table is over
+SHARED_CACHE_MAX_ENTRIES deletes expired rows, then the least recently
+used ones.
+
+Reads never write. Each worker counts hits (per key, for hits/last_access)
+and lookups in memory, and a background thread adds the deltas every
+STATS_FLUSH_INTERVAL seconds in one transaction (value = value + delta), so
+the stats are single-writer safe, no increment is lost between workers,
+hot keys don't turn every hit into a write and a lookup never waits on the
+write lock.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from glossary import normalize_term
+from metrics import CACHE_LOOKUPS
+
+EVICTION_CHECK_EVERY = 100   # writes between size checks
+STATS_FLUSH_INTERVAL = 5.0   # seconds between flushing local counters and key hits
+STAT_NAMES = ("hits", "stale_hits", "misses", "writes", "evictions")
+
+
+def cache_key(term, complexity):
+    return f"{normalize_term(term)}|{complexity}"
+
+
+def connect(path, timeout=5.0):
+    conn = sqlite3.connect(path, timeout=timeout)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")  # WAL + NORMAL is durable across process crashes
+    return conn
+
+
+def create_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cache_entries (
+            key TEXT PRIMARY KEY,
+            term TEXT,
+            complexity TEXT,
+            value TEXT,
+            created REAL,
+            expires REAL,
+            last_access REAL,
+            hits INTEGER DEFAULT 0,
+            size INTEGER
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_last_access ON cache_entries(last_access)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_expires ON cache_entries(expires)")
+    conn.execute("CREATE TABLE IF NOT EXISTS cache_stats (name TEXT PRIMARY KEY, value INTEGER DEFAULT 0)")
+    conn.commit()
+
+
+class SharedCache:
+    def __init__(self, path, ttl=7 * 86400, stale_ttl=30 * 86400, max_entries=50000):
+        self.path = path
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.pending = dict.fromkeys(STAT_NAMES, 0)   # not yet flushed to cache_stats
+        self.process_totals = dict.fromkeys(STAT_NAMES, 0)
+        self.key_hits = {}   # key -> (hits, last access) not yet flushed
+        self.stopping = threading.Event()
+        self.writes_since_check = 0
+        self.entry_count = None  # as of the last refresh_gauges(); read by collect_metrics
+        conn = self._conn()
+        create_tables(conn)
+        self.flusher = threading.Thread(target=self._flush_loop, daemon=True, name="shared-cache-stats")
+        self.flusher.start()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            os.getenv("SHARED_CACHE_PATH", "explain_cache.db"),
+            ttl=float(os.getenv("SHARED_CACHE_TTL", str(7 * 86400))),
+            stale_ttl=float(os.getenv("SHARED_CACHE_STALE_TTL", str(30 * 86400))),
+            max_entries=int(os.getenv("SHARED_CACHE_MAX_ENTRIES", "50000")),
+        )
+
+    def _conn(self):
+        # One connection per thread (sync endpoints run in a thread pool)
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = connect(self.path)
+            self.local.conn = conn
+        return conn
+
+    def _count(self, name, amount=1, key=None):
+        with self.lock:
+            self.pending[name] += amount
+            self.process_totals[name] += amount
+            if key is not None:
+                hits, _ = self.key_hits.get(key, (0, 0))
+                self.key_hits[key] = (hits + 1, time.time())
+
+    def _flush_loop(self):
+        while not self.stopping.wait(STATS_FLUSH_INTERVAL):
+            self.flush_stats()
+
+    def close(self, timeout=5.0):
+        """Stops the stats thread and writes what it has not flushed yet (application shutdown)."""
+        self.stopping.set()
+        self.flusher.join(timeout)
+        self.flush_stats()
+
+    def get(self, term, complexity, count=True):
+        """
+        Returns (value JSON string, 'fresh' | 'stale'), or (None, None) on a miss.
+        count=False reads without touching the stats (lookups made on behalf of another tier).
+        """
+        key = cache_key(term, complexity)
+        conn = self._conn()
+        row = conn.execute("SELECT value, expires FROM cache_entries WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None or now >= row[1] + self.stale_ttl:
+            if not count:
+                return None, None
+            self._count("misses")
+            CACHE_LOOKUPS.labels(tier="shared", result="miss").inc()
+            return None, None
+
+        state = "fresh" if now < row[1] else "stale"
+        if not count:
+            return row[0], state
+        self._count("hits" if state == "fresh" else "stale_hits", key=key)
+        CACHE_LOOKUPS.labels(tier="shared", result="hit" if state == "fresh" else "stale").inc()
+        return row[0], state
+
+    def put(self, term, complexity, value):
+        """value: JSON string. Upserts atomically; last writer wins."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute('''
+            INSERT INTO cache_entries (key, term, complexity, value, created, expires, last_access, hits, size)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                term = excluded.term, value = excluded.value, created = excluded.created,
+                expires = excluded.expires, last_access = excluded.last_access, size = excluded.size
+        ''', (cache_key(term, complexity), term.strip(), complexity, value, now, now + self.ttl, now, len(value)))
+        conn.commit()
+        self._count("writes")
+
+        with self.lock:
+            self.writes_since_check += 1
+            check = self.writes_since_check >= EVICTION_CHECK_EVERY
+            if check:
+                self.writes_since_check = 0
+        if check:
+            self.evict()
+
+    def invalidate(self, term, complexity):
+        conn = self._conn()
+        deleted = conn.execute("DELETE FROM cache_entries WHERE key = ?", (cache_key(term, complexity),)).rowcount
+        conn.commit()
+        return deleted > 0
+
+    def expire(self, term, complexity):
+        """Stops serving an entry as fresh but keeps it as a stale fallback. Returns True if it existed."""
+        conn = self._conn()
+        updated = conn.execute("UPDATE cache_entries SET expires = MIN(expires, ?) WHERE key = ?",
+                               (time.time(), cache_key(term, complexity))).rowcount
+        conn.commit()
+        return updated > 0
+
+    def evict(self):
+        """Drops expired entries, then least recently used ones down to max_entries. Returns rows deleted."""
+        conn = self._conn()
+        deleted = conn.execute("DELETE FROM cache_entries WHERE expires + ? <= ?",
+                               (self.stale_ttl, time.time())).rowcount
+        count = conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+        if count > self.max_entries:
+            deleted += conn.execute('''
+                DELETE FROM cache_entries WHERE key IN (
+                    SELECT key FROM cache_entries ORDER BY last_access LIMIT ?
+                )
+            ''', (count - self.max_entries,)).rowcount
+        conn.commit()
+        if deleted:
+            self._count("evictions", deleted)
+        return deleted
+
+    def flush_stats(self):
+        with self.lock:
+            deltas = [(name, value) for name, value in self.pending.items() if value]
+            key_hits = [(hits, last, key) for key, (hits, last) in self.key_hits.items()]
+            self.pending = dict.fromkeys(STAT_NAMES, 0)
+            self.key_hits = {}
+        if not deltas and not key_hits:
+            return
+        conn = self._conn()
+        try:
+            conn.executemany('''
+                INSERT INTO cache_stats (name, value) VALUES (?, ?)
+                ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+            ''', deltas)
+            conn.executemany('''
+                UPDATE cache_entries SET hits = hits + ?, last_access = MAX(last_access, ?) WHERE key = ?
+            ''', key_hits)
+            conn.commit()
+        except sqlite3.OperationalError:
+            conn.rollback()
+            with self.lock:  # try again next time
+                for name, value in deltas:
+                    self.pending[name] += value
+                for hits, last, key in key_hits:
+                    pending_hits, pending_last = self.key_hits.get(key, (0, 0))
+                    self.key_hits[key] = (pending_hits + hits, max(last, pending_last))
+
+    def entries(self, min_hits=0):
+        """(term, complexity, value JSON) for every fresh entry (stale ones are not worth exporting), most hit first."""
+        conn = self._conn()
+        return conn.execute('''
+            SELECT term, complexity, value FROM cache_entries
+            WHERE expires > ? AND hits >= ? ORDER BY hits DESC
+        ''', (time.time(), min_hits)).fetchall()
+
+    def terms(self, limit=None):
+        """(term, complexity) of every live entry, most hit first; used to build the semantic index."""
+        conn = self._conn()
+        return conn.execute('''
+            SELECT term, complexity FROM cache_entries WHERE expires > ? ORDER BY hits DESC LIMIT ?
+        ''', (time.time() - self.stale_ttl, -1 if limit is None else limit)).fetchall()
+
+    def stats(self):
+        self.flush_stats()
+        conn = self._conn()
+        shared = dict.fromkeys(STAT_NAMES, 0)
+        shared.update(conn.execute("SELECT name, value FROM cache_stats").fetchall())
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries").fetchone()
+        lookups = shared["hits"] + shared["stale_hits"] + shared["misses"]
+        with self.lock:
+            process = dict(self.process_totals)
+        return {
+            "path": self.path,
+            "entries": entries,
+            "bytes": size,
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "all_workers": shared,
+            "hit_rate": round(shared["hits"] / lookups, 3) if lookups else 0.0,
+            "this_worker": {"pid": os.getpid(), **process},
+        }
+
+    def refresh_gauges(self):
+        """Re-counts the entries for collect_metrics; call off the event loop (it queries the cache file)."""
+        try:
+            entries = self._conn().execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+        except sqlite3.OperationalError as e:
+            print(f"Warning: shared cache entry count not refreshed: {e}")
+            return
+        with self.lock:
+            self.entry_count = entries
+
+    def collect_metrics(self):
+        # No I/O: /metrics collects on the event loop, so the entry count comes from refresh_gauges()
+        with self.lock:
+            entries = self.entry_count
+            evictions = self.process_totals["evictions"]
+        if entries is not None:
+            yield ("shared_cache_entries", "gauge", "Entries in the host-wide explanation cache", [({}, entries)])
+        yield ("shared_cache_evictions_total", "counter", "Entries evicted by this worker", [({}, evictions)])
@@ -0,0 +1,296 @@
+"""
+Resilient wrapper around the Groq chat completions API.
+
+- Retries retryable failures (connection errors, timeouts, 408/409/429/5xx)
+  with full-jitter exponential backoff.
+- Optionally hedges: if a call is still running after the observed p95
+  latency, a duplicate request is sent and the first success wins.
+- A circuit breaker per model fails fast while the upstream is unhealthy.
+- When the primary model is unavailable the call falls back to a smaller model.
+
+The wrapped client only needs a `chat.completions.create(**kwargs)` method, so
+tests can pass a fake object, or point the real SDK at a local server with
+GROQ_BASE_URL.
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from typing import Any
+
+from metrics import UPSTREAM_LATENCY, UPSTREAM_REQUESTS
+
+DEFAULT_MODEL = "llama-3.3-70b-versatile"
+DEFAULT_FALLBACK_MODEL = "llama-3.1-8b-instant"
+
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+class UpstreamUnavailableError(Exception):
+    """Raised when every model failed or every circuit breaker is open."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_retryable(exc):
+    import groq  # already loaded by from_env(); kept lazy so importing this module stays cheap
+
+    if isinstance(exc, (groq.APIConnectionError, groq.APITimeoutError)):
+        return True
+    if isinstance(exc, groq.APIStatusError):
+        return exc.status_code in RETRYABLE_STATUS or exc.status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures.
+    open -> half-open after `reset_timeout` seconds; one trial call is let through.
+    half-open -> closed on success, back to open on failure. Other callers are
+    refused while the trial runs; a trial that never reports back (its caller
+    died, or it ended in a non-retryable error) is replaced after `reset_timeout`.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.trial_started = None  # monotonic time the half-open trial call was let through
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == "closed":
+                return True
+            now = time.monotonic()
+            if self.state == "open":
+                if now - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = "half_open"
+            if self.trial_started is not None and now - self.trial_started < self.reset_timeout:
+                return False
+            self.trial_started = now
+            return True
+
+    def retry_after(self):
+        with self.lock:
+            if self.state != "open":
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.state = "closed"
+            self.trial_started = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+            self.trial_started = None
+
+    def release(self):
+        """The call ended without saying anything about upstream health; lets the next caller be the trial."""
+        with self.lock:
+            self.trial_started = None
+
+
+class LatencyWindow:
+    """Rolling window of recent successful call latencies (seconds)."""
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, pct, min_samples=20):
+        with self.lock:
+            if len(self.samples) < min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+@dataclass
+class UpstreamResponse:
+    completion: Any
+    model: str
+    latency: float      # seconds, including retries and backoff
+    attempts: int
+    hedged: bool
+    fallback: bool
+
+
+class ResilientChatClient:
+    def __init__(self, client, model=DEFAULT_MODEL, fallback_model=DEFAULT_FALLBACK_MODEL,
+                 max_retries=2, backoff_base=0.5, backoff_max=4.0, hedge=False,
+                 hedge_percentile=95, failure_threshold=5, reset_timeout=30.0, sleep=time.sleep):
+        self.client = client
+        self.model = model
+        self.fallback_model = fallback_model if fallback_model != model else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.sleep = sleep
+        self.breakers = {}
+        self.latencies = {}
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.counters = {"calls": 0, "retries": 0, "hedges": 0, "fallbacks": 0, "failures": 0, "short_circuited": 0}
+        self._hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-hedge") if hedge else None
+
+    @classmethod
+    def from_env(cls, api_key=None):
+        import groq
+
+        # Retries are handled here, so the SDK's own retry loop is disabled
+        client = groq.Groq(api_key=api_key or os.getenv("GROQ_API_KEY"),
+                           base_url=os.getenv("GROQ_BASE_URL") or None,
+                           timeout=float(os.getenv("LLM_TIMEOUT", "30")),
+                           max_retries=0)
+        return cls(
+            client,
+            model=os.getenv("LLM_MODEL", DEFAULT_MODEL),
+            fallback_model=os.getenv("LLM_FALLBACK_MODEL", DEFAULT_FALLBACK_MODEL) or None,
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+            hedge=os.getenv("LLM_HEDGE", "0") == "1",
+            failure_threshold=int(os.getenv("LLM_BREAKER_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("LLM_BREAKER_RESET", "30")),
+        )
+
+    def _breaker(self, model):
+        if model not in self.breakers:
+            self.breakers[model] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        return self.breakers[model]
+
+    def _latency(self, model):
+        if model not in self.latencies:
+            self.latencies[model] = LatencyWindow()
+        return self.latencies[model]
+
+    def _backoff(self, attempt):
+        # Full jitter: sleep anywhere between 0 and the exponential cap
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _create(self, model, kwargs):
+        # One HTTP call to the upstream (hedged duplicates are timed separately)
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            completion = self.client.chat.completions.create(model=model, **kwargs)
+            outcome = "ok"
+            return completion
+        finally:
+            UPSTREAM_LATENCY.labels(service="llm", model=model).observe(time.perf_counter() - start)
+            UPSTREAM_REQUESTS.labels(service="llm", model=model, outcome=outcome).inc()
+
+    def _call_once(self, model, kwargs):
+        call = lambda: self._create(model, kwargs)
+        threshold = self._latency(model).percentile(self.hedge_percentile) if self.hedge else None
+        if threshold is None:
+            return call(), False
+
+        first = self._hedge_pool.submit(call)
+        done, _ = wait([first], timeout=threshold)
+        if done:
+            return first.result(), False
+
+        self.counters["hedges"] += 1
+        pending = {first, self._hedge_pool.submit(call)}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result(), True
+                except Exception as e:
+                    error = e
+        raise error
+
+    def _call_with_retries(self, model, kwargs):
+        breaker = self._breaker(model)
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            try:
+                completion, hedged = self._call_once(model, kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    # Bad requests say nothing about upstream health
+                    breaker.release()
+                    raise
+                breaker.record_failure()
+                if attempt >= self.max_retries or not breaker.allow():
+                    raise
+                self.counters["retries"] += 1
+                self.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            breaker.record_success()
+            self._latency(model).add(time.monotonic() - start)
+            return completion, attempt + 1, hedged
+
+    def chat(self, model=None, fallback_model=None, **kwargs):
+        """
+        Same arguments as `chat.completions.create`. `model` / `fallback_model`
+        override the configured defaults for this call.
+        Raises UpstreamUnavailableError if no model could answer, and
+        re-raises non-retryable errors (e.g. 400 Bad Request) unchanged.
+        """
+        self.counters["calls"] += 1
+        primary = model or self.model
+        fallback = fallback_model if fallback_model is not None else self.fallback_model
+        candidates = [primary] + ([fallback] if fallback and fallback != primary else [])
+
+        start = time.monotonic()
+        last_error = None
+        for i, candidate in enumerate(candidates):
+            if not self._breaker(candidate).allow():
+                self.counters["short_circuited"] += 1
+                continue
+            try:
+                completion, attempts, hedged = self._call_with_retries(candidate, kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    self.counters["failures"] += 1
+                    raise
+                last_error = e
+                continue
+            if i > 0:
+                self.counters["fallbacks"] += 1
+            return UpstreamResponse(completion, candidate, time.monotonic() - start, attempts, hedged, i > 0)
+
+        self.counters["failures"] += 1
+        retry_after = min((self._breaker(m).retry_after() for m in candidates), default=None)
+        if last_error is None:
+            raise UpstreamUnavailableError("AI service is temporarily unavailable. Please try again shortly.",
+                                           retry_after=retry_after)
+        raise UpstreamUnavailableError(f"AI service error: {last_error}", retry_after=retry_after) from last_error
+
+    def collect_metrics(self):
+        yield ("llm_client_events_total", "counter", "Resilient LLM client events",
+               [({"event": name}, value) for name, value in self.counters.items()])
+        yield ("llm_circuit_open", "gauge", "1 if the model's circuit breaker is open",
+               [({"model": m}, int(b.state == "open")) for m, b in list(self.breakers.items())])
+
+    def stats(self):
+        return {
+            **self.counters,
+            "breakers": {m: b.state for m, b in self.breakers.items()},
+            "p95_latency": {m: w.percentile(95, min_samples=1) for m, w in self.latencies.items()},
+        }